@@ -0,0 +1,28 @@
+"""
+JSON-кодек кадров WebSocket чата.
+
+Если установлен orjson, кадры кодируются и разбираются им (в разы быстрее стандартного json),
+иначе — модулем json. Результат dumps — строка, готовая для send(text_data=...):
+кадр кодируется один раз при рассылке в группу, а не для каждого получателя.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+
+def json_dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def orjson_dumps(data):
+    return orjson.dumps(data).decode()
+
+
+if orjson is not None:
+    dumps, loads = orjson_dumps, orjson.loads
+else:
+    dumps, loads = json_dumps, json.loads
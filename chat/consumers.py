@@ -2,27 +2,277 @@
 Доставка сообщений в реальном времени
 в асинхронном режиме передачи данных от сервера к клиентам через WebSocket-соединение.
 Здесь идёт беседа tet-a-tet.
+
+ChatConsumer (ws/chat/<room_id>/) — одно соединение на комнату.
+UserConsumer (ws/user/) — одно соединение на пользователя: комнаты подключаются кадрами
+subscribe/unsubscribe, по нему же приходят уведомления о мэтчах и приглашениях.
+События комнат рассылаются в группу комнаты и в группы user_<id> участников
+(chat.events.group_send_room), поэтому подписка не меняет состав групп channel layer.
 """
 
-import json
+import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from . import codec, presence
+from .events import (
+    group_send_room,
+    presence_event,
+    read_receipt_event,
+    room_group_name,
+    typing_event,
+    user_group_name,
+)
 from .models import ChatRoom, ChatMessage
+from .snowflake import next_message_id
+from .writebehind import get_buffer
 
 User = get_user_model()
 
+MAX_BURST_MESSAGES = 50  # Сколько сообщений из одного кадра сохраняем одним INSERT
+MAX_SUBSCRIPTIONS = 100  # Сколько комнат можно подключить к одному UserConsumer
+CLIENT_KEY_MAX_LENGTH = 64
+
+
+def message_items(frame):
+    """
+    Сообщения кадра — список (текст, client_key или None). Кадр {"message": "...",
+    "client_key": "..."} или {"messages": [...]}, где элемент — строка или такой же объект.
+    client_key — строка до 64 символов, уникальная для отправителя: повтор сообщения
+    с тем же ключом (после переподключения без ack) не создаёт дубль
+    """
+    items = frame.get("messages") or [frame]
+    messages = []
+    for item in items:
+        if isinstance(item, str):
+            messages.append((item, None))
+            continue
+        client_key = item.get("client_key")
+        if not isinstance(client_key, str) or not 0 < len(client_key) <= CLIENT_KEY_MAX_LENGTH:
+            client_key = None
+        messages.append((item["message"], client_key))
+    return messages
+
+
+class RoomMessagingMixin:
+    """
+    Сообщения, прочтение и «печатает…» в комнате room_id — общее для обоих консьюмеров.
+    self.rooms — id подключённых комнат -> id их участников (ChatRoom.get_participants)
+    """
+
+    async def send_room_event(self, room_id, event):
+        """Событие комнаты — в группу комнаты и в группы user_<id> обоих участников"""
+        await group_send_room(self.channel_layer, room_id, self.rooms[room_id], event)
+
+    async def handle_room_frame(self, room_id, text_data_json):
+        # {"type": "read"} — пользователь прочитал переписку: сдвигаем его отметку прочтения
+        if text_data_json.get("type") == "read":
+            await self.mark_read(room_id)
+            return
+
+        # {"type": "typing"} — пользователь печатает: только рассылаем собеседнику, без записи в БД
+        if text_data_json.get("type") == "typing":
+            await self.send_room_event(
+                room_id, typing_event(room_id, self.scope["user"].id)
+            )
+            return
+
+        # Кадр {"messages": [...]} — пачка сообщений (клиент копит их при плохой связи),
+        # сохраняем её bulk-вставкой; обычный кадр — {"message": "..."}
+        messages = message_items(text_data_json)
+
+        for start in range(0, len(messages), MAX_BURST_MESSAGES):
+            # Сохраняем сообщения в БД (сразу или через буфер отложенной записи)
+            chunk = messages[start : start + MAX_BURST_MESSAGES]
+            if settings.CHAT_WRITE_BEHIND:
+                chat_messages = self.buffer_messages(room_id, chunk)
+            else:
+                chat_messages = await self.save_messages(room_id, chunk)
+
+            # Отправляем сообщения в группу: кадр кодируем один раз, получатели
+            # пересылают готовую строку без повторного json.dumps
+            for chat_message in chat_messages:
+                await self.send_room_event(
+                    room_id,
+                    {
+                        "type": "chat_message",
+                        "room_id": room_id,
+                        "text": self.encode_message(chat_message),
+                    },
+                )
+
+    def encode_message(self, chat_message):
+        """Кадр WebSocket с сообщением чата"""
+        return codec.dumps(
+            {
+                "message": chat_message.message,
+                "room_id": chat_message.room_id,
+                "user_id": self.scope["user"].id,
+                "username": self.username,
+                "message_id": chat_message.id,
+                "client_key": chat_message.client_key,
+                "created_at": chat_message.created_at.isoformat(),  # ISO 8601 формат YYYY-MM-DD HH:MM:SS.mmmmmmm
+                "type": "chat_message",
+            }
+        )
+
+    def buffer_messages(self, room_id, messages):
+        """
+        Сообщения с Snowflake-id уходят в буфер отложенной записи, а отправитель
+        получает {"type": "ack", "message_ids": [...], "client_keys": [...]}, когда они
+        записаны в БД
+        """
+        buffer = get_buffer()
+        chat_messages = [
+            ChatMessage(
+                id=next_message_id(),
+                room_id=room_id,
+                user=self.scope["user"],
+                message=message,
+                client_key=client_key,
+            )
+            for message, client_key in messages
+        ]
+        futures = [buffer.add(chat_message) for chat_message in chat_messages]
+
+        if not hasattr(self, "ack_tasks"):
+            self.ack_tasks = set()
+        task = asyncio.ensure_future(self.acknowledge(room_id, futures, chat_messages))
+        self.ack_tasks.add(task)
+        task.add_done_callback(self.ack_tasks.discard)
+        return chat_messages
+
+    async def acknowledge(self, room_id, futures, chat_messages):
+        await asyncio.wait(futures)  # wait, а не gather: отмена не отменяет запись
+        saved, failed = [], []
+        for future, chat_message in zip(futures, chat_messages):
+            if future.cancelled() or future.exception() is not None:
+                failed.append(chat_message)
+            else:
+                # Повтор по client_key получил id ранее сохранённого сообщения
+                saved.append(chat_message)
+        if saved:
+            await self.send(
+                text_data=codec.dumps(
+                    {
+                        "type": "ack",
+                        "message_ids": [message.id for message in saved],
+                        "client_keys": [message.client_key for message in saved],
+                    }
+                )
+            )
+        if failed:
+            # Сообщения не сохранены: ack не будет, клиент показывает ошибку или повторяет
+            await self.send(
+                text_data=codec.dumps(
+                    {
+                        "type": "error",
+                        "error": "Сообщения не сохранены",
+                        "room_id": room_id,
+                        "message_ids": [message.id for message in failed],
+                        "client_keys": [message.client_key for message in failed],
+                    }
+                )
+            )
+
+    async def flush_write_behind(self):
+        # В режиме отложенной записи сохраняем буфер до закрытия сокета: при штатной
+        # остановке сервер закрывает все соединения, и сообщения не теряются.
+        # Подтверждения дожидаемся, а не отменяем: если сокет ещё открыт, ack дойдёт,
+        # иначе клиент повторит сообщения с теми же client_key без дублей
+        if settings.CHAT_WRITE_BEHIND:
+            await get_buffer().flush()
+            await asyncio.gather(*getattr(self, "ack_tasks", ()), return_exceptions=True)
+
+    async def chat_message(self, event):
+        # Отправляем пользователю сообщение WebSocket от другого пользователя,
+        # event["text"] - кадр, закодированный отправителем один раз для всей группы.
+        # События комнат без подписки (они приходят через группу user_<id>) пропускаем
+        if event["room_id"] in self.rooms:
+            await self.send(text_data=event["text"])
+
+    async def read_receipt(self, event):
+        # Отметка прочтения участника комнаты: клиент помечает прочитанными
+        # все сообщения с id <= last_read_id
+        if event["room_id"] in self.rooms:
+            await self.send(text_data=event["text"])
+
+    async def presence(self, event):
+        # Собеседник подключился к комнате или ушёл; о себе пользователю не сообщаем
+        if event["room_id"] in self.rooms and event["user_id"] != self.scope["user"].id:
+            await self.send(text_data=event["text"])
+
+    async def typing(self, event):
+        # Индикатор «печатает…» собеседника
+        if event["room_id"] in self.rooms and event["user_id"] != self.scope["user"].id:
+            await self.send(text_data=event["text"])
+
+    async def mark_read(self, room_id):
+        last_read_id = await self.save_read_watermark(room_id)
+        if last_read_id:
+            await self.send_room_event(
+                room_id,
+                read_receipt_event(room_id, self.scope["user"].id, last_read_id),
+            )
+
+    @database_sync_to_async  # Декоратор для асинхронного вызова функции из модели
+    def get_room_participants(self, room_id):
+        """
+        id участников активной комнаты, если в ней состоит пользователь user, создавший
+        канал, иначе None. Берутся из кэша (ChatRoom.get_participants), без запросов к БД
+        при повторных подключениях
+        """
+        participant_ids = ChatRoom.get_participants(room_id)
+        # scope - словарь со всей информацией о текущем соединении WebSocket
+        if participant_ids and self.scope["user"].id in participant_ids:
+            return participant_ids
+        return None
+
+    @database_sync_to_async  # Декоратор для асинхронного вызова синхронной опреации с БД из модели
+    def save_messages(self, room_id, messages):
+        """
+        Сохраняем сообщения в БД (комната по id, без её загрузки). Повтор по client_key
+        не вставляется и рассылается с id уже сохранённого сообщения
+        """
+        texts = [message for message, _ in messages]
+        client_keys = [client_key for _, client_key in messages]
+        # scope - словарь со всей информацией о текущем соединении WebSocket
+        return ChatMessage.create_batch(room_id, self.scope["user"], texts, client_keys)
 
-class ChatConsumer(AsyncWebsocketConsumer):
+    @database_sync_to_async
+    def save_read_watermark(self, room_id):
+        """Сдвигаем отметку прочтения пользователя до последнего сообщения комнаты"""
+        room = ChatRoom.objects.get(id=room_id)
+        return room.mark_read(self.scope["user"])
+
+
+class ChatConsumer(RoomMessagingMixin, AsyncWebsocketConsumer):
     # Получаем ID комнаты из вложенного словаря url_route и создаём название группы
     async def connect(self):
-        self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
-        self.room_group_name = f"chat_{self.room_id}"
+        room_id = self.scope["url_route"]["kwargs"]["room_id"]
+        self.room_group_name = room_group_name(room_id)
+
+        # Имя отправителя для кадров сообщений вычисляем один раз на соединение
+        self.username = self.scope["user"].get_full_name()
 
-        # Проверяем доступ пользователя к группе и присоединяемся к этой группе
-        if await self.is_user_in_room():
+        # Проверяем доступ пользователя к группе и присоединяемся к этой группе.
+        # id комнаты и её участников остаются на экземпляре, чтобы receive
+        # не загружал комнату повторно
+        participant_ids = None
+        if room_id.isdigit():
+            participant_ids = await self.get_room_participants(int(room_id))
+        if participant_ids:
+            self.room_id = int(room_id)
+            self.rooms = {self.room_id: participant_ids}
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
             await self.accept()
+            # Присутствие онлайн — в кэше, собеседнику сообщаем событием группы
+            self.present = True
+            await database_sync_to_async(presence.connect)(self.scope["user"].id)
+            await self.send_room_event(
+                self.room_id, presence_event(self.room_id, self.scope["user"].id, True)
+            )
         else:
             await self.close()
 
@@ -30,60 +280,117 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
+        if getattr(self, "present", False):
+            await database_sync_to_async(presence.disconnect)(self.scope["user"].id)
+            await self.send_room_event(
+                self.room_id, presence_event(self.room_id, self.scope["user"].id, False)
+            )
+
+        await self.flush_write_behind()
+
     async def receive(self, text_data):
         # Получаем текст сообщения от пользователя
-        text_data_json = json.loads(text_data)
-        message = text_data_json["message"]
+        text_data_json = codec.loads(text_data)
 
-        # Сохраняем сообщение в БД
-        chat_message = await self.save_message(message)
+        # {"type": "heartbeat"} — клиент на связи: продлеваем присутствие онлайн
+        if text_data_json.get("type") == "heartbeat":
+            await database_sync_to_async(presence.touch)(self.scope["user"].id)
+            return
 
-        # Отправляем сообщение в группу
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message,
-                "user_id": self.scope["user"].id,
-                "username": self.scope["user"].get_full_name(),
-                "message_id": chat_message.id,
-                "created_at": chat_message.created_at.isoformat(),  # ISO 8601 формат YYYY-MM-DD HH:MM:SS.mmmmmmm
-            },
-        )
+        await self.handle_room_frame(self.room_id, text_data_json)
 
-    async def chat_message(self, event):
-        # Отправляем пользователю ответное сообщение WebSocket от другого пользователя,
-        # event - словарь с данными сообщения
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "message": event["message"],
-                    "user_id": event["user_id"],
-                    "username": event["username"],
-                    "message_id": event["message_id"],
-                    "created_at": event["created_at"],
-                    "type": "chat_message",
-                }
+
+class UserConsumer(RoomMessagingMixin, AsyncWebsocketConsumer):
+    """
+    Одно соединение на пользователя вместо соединения на каждую комнату.
+    Соединение состоит только в группе user_<id>: через неё приходят уведомления о мэтчах
+    и приглашениях и события всех комнат пользователя, из которых клиенту отправляются
+    события только тех комнат, на которые он подписался:
+        {"type": "subscribe", "room_id": 5}    -> {"type": "subscribed", "room_id": 5}
+        {"type": "unsubscribe", "room_id": 5}  -> {"type": "unsubscribed", "room_id": 5}
+    Кадры комнат — те же, что у ChatConsumer, с полем room_id:
+        {"room_id": 5, "message": "..."}, {"room_id": 5, "type": "read"}, {"room_id": 5, "type": "typing"}
+    """
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        self.username = user.get_full_name()
+        self.user_group_name = user_group_name(user.id)
+        self.rooms = {}  # id комнат, на которые подписано соединение -> id участников
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept()
+        self.present = True
+        await database_sync_to_async(presence.connect)(user.id)
+
+    async def disconnect(self, close_code):
+        if not getattr(self, "present", False):
+            return
+        await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+        for room_id in list(self.rooms):
+            await self.unsubscribe(room_id)
+        await database_sync_to_async(presence.disconnect)(self.scope["user"].id)
+        await self.flush_write_behind()
+
+    async def receive(self, text_data):
+        text_data_json = codec.loads(text_data)
+        frame_type = text_data_json.get("type")
+
+        if frame_type == "heartbeat":
+            await database_sync_to_async(presence.touch)(self.scope["user"].id)
+            return
+
+        room_id = text_data_json.get("room_id")
+        if not isinstance(room_id, int):
+            await self.send_error("Не указан room_id")
+            return
+
+        if frame_type == "subscribe":
+            await self.subscribe(room_id)
+        elif frame_type == "unsubscribe":
+            await self.unsubscribe(room_id)
+            await self.send(
+                text_data=codec.dumps({"type": "unsubscribed", "room_id": room_id})
             )
+        elif room_id not in self.rooms:
+            await self.send_error("Нет подписки на комнату", room_id)
+        else:
+            await self.handle_room_frame(room_id, text_data_json)
+
+    async def subscribe(self, room_id):
+        if room_id in self.rooms:
+            return
+        if len(self.rooms) >= MAX_SUBSCRIPTIONS:
+            await self.send_error("Слишком много подписок", room_id)
+            return
+        participant_ids = await self.get_room_participants(room_id)
+        if not participant_ids:
+            await self.send_error("Нет доступа к комнате", room_id)
+            return
+
+        # Группы channel layer не меняются: события комнаты уже приходят через user_<id>
+        self.rooms[room_id] = participant_ids
+        await self.send(text_data=codec.dumps({"type": "subscribed", "room_id": room_id}))
+        await self.send_room_event(
+            room_id, presence_event(room_id, self.scope["user"].id, True)
         )
 
-    @database_sync_to_async  # Декоратор для асинхронного вызова функции из модели
-    def is_user_in_room(self):
-        """Проверяем, принадлежность пользователя user, создавшего канал, к комнате и активность самой команты"""
-        try:
-            room = ChatRoom.objects.get(id=self.room_id, is_active=True)
-            return self.scope["user"] in [
-                room.user1,
-                room.user2,
-            ]  # scope - словарь со всей информацией о текущем соединении WebSocket
-        except ChatRoom.DoesNotExist:
-            return False
+    async def unsubscribe(self, room_id):
+        if room_id not in self.rooms:
+            return
+        await self.send_room_event(
+            room_id, presence_event(room_id, self.scope["user"].id, False)
+        )
+        del self.rooms[room_id]
 
-    @database_sync_to_async  # Декоратор для асинхронного вызова синхронной опреации с БД из модели
-    def save_message(self, message):
-        """Сохраняем сообщение в БД"""
-        room = ChatRoom.objects.get(id=self.room_id)  # Получаем комнату по ID
-        chat_message = ChatMessage.objects.create(
-            room=room, user=self.scope["user"], message=message
-        )  # scope - словарь со всей информацией о текущем соединении WebSocket
-        return chat_message
+    async def send_error(self, error, room_id=None):
+        await self.send(
+            text_data=codec.dumps({"type": "error", "error": error, "room_id": room_id})
+        )
+
+    async def notify(self, event):
+        # Уведомление пользователю: мэтч, приглашение (chat.events.notify_user)
+        await self.send(text_data=event["text"])
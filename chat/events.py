@@ -0,0 +1,101 @@
+"""
+События чата, которые рассылаются в группы channel layer из синхронного кода (вьюсетов)
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from . import codec
+
+
+def room_group_name(room_id):
+    """Название группы channel layer для комнаты чата"""
+    return f"chat_{room_id}"
+
+
+def user_group_name(user_id):
+    """Название группы channel layer для соединений пользователя (UserConsumer)"""
+    return f"user_{user_id}"
+
+
+def room_groups(room_id, participant_ids):
+    """
+    Группы, в которые рассылается событие комнаты: группа комнаты (соединения ChatConsumer)
+    и группы user_<id> обоих участников. UserConsumer в группы комнат не вступает,
+    а пропускает события комнат, на которые клиент не подписан
+    """
+    return [room_group_name(room_id), *map(user_group_name, participant_ids)]
+
+
+async def group_send_room(channel_layer, room_id, participant_ids, event):
+    """Рассылаем событие комнаты room_id (с ключом room_id) во все группы room_groups"""
+    for group in room_groups(room_id, participant_ids):
+        await channel_layer.group_send(group, event)
+
+
+def read_receipt_event(room_id, user_id, last_read_id):
+    """Событие группы с отметкой прочтения; кадр для клиентов кодируется один раз"""
+    return {
+        "type": "read_receipt",
+        "room_id": room_id,
+        "text": codec.dumps(
+            {
+                "type": "read_receipt",
+                "room_id": room_id,
+                "user_id": user_id,
+                "last_read_id": last_read_id,
+            }
+        ),
+    }
+
+
+def presence_event(room_id, user_id, online):
+    """Событие группы: участник подключился к комнате или ушёл из неё"""
+    return {
+        "type": "presence",
+        "room_id": room_id,
+        "user_id": user_id,
+        "text": codec.dumps(
+            {"type": "presence", "room_id": room_id, "user_id": user_id, "online": online}
+        ),
+    }
+
+
+def typing_event(room_id, user_id):
+    """Эфемерное событие «печатает…»: только рассылается, нигде не сохраняется"""
+    return {
+        "type": "typing",
+        "room_id": room_id,
+        "user_id": user_id,
+        "text": codec.dumps({"type": "typing", "room_id": room_id, "user_id": user_id}),
+    }
+
+
+def broadcast_read_receipt(room, user_id, last_read_id):
+    """Отправляем участникам комнаты room отметку прочтения пользователя user_id"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(group_send_room)(
+        channel_layer,
+        room.id,
+        (room.user1_id, room.user2_id),
+        read_receipt_event(room.id, user_id, last_read_id),
+    )
+
+
+def notify_user(user_id, event_type, **payload):
+    """
+    Уведомление на все соединения пользователя (ws/user/): {"type": event_type, **payload}.
+    Отправляется после коммита транзакции, чтобы клиент не запросил ещё не записанные данные
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    text = codec.dumps({"type": event_type, **payload})
+    transaction.on_commit(
+        lambda: async_to_sync(channel_layer.group_send)(
+            user_group_name(user_id), {"type": "notify", "text": text}
+        )
+    )
@@ -0,0 +1,512 @@
+"""
+Нагрузочная проверка доставки сообщений чата через channel layer.
+
+Режим fanout: --workers процессов (как ASGI-воркеры) подписывают по --clients каналов
+(как WebSocket-соединения) на одну группу, главный процесс делает --messages group_send.
+Команда считает доставленные сообщения и задержку доставки. С InMemoryChannelLayer
+сообщения не выходят за пределы процесса, поэтому воркеры ничего не получат.
+С Redis (CHANNEL_LAYER=redis/redis-pubsub) получат все.
+
+Режим throughput: пропускная способность сохранения сообщений одним воркером (сообщений/с)
+для прежнего пути (загрузка комнаты + create), create с room_id= и пачек по --burst сообщений
+(ChatMessage.create_batch). Запись идёт в комнату --room и откатывается по окончании.
+
+Режим writebehind: сообщения идут через настоящий ChatConsumer (asgiref ApplicationCommunicator)
+от --clients соединений во временную комнату — сначала с записью каждого сообщения в БД,
+затем с отложенной записью (CHAT_WRITE_BEHIND). Команда меряет время до получения всех
+сообщений собеседником, после чего штатно закрывает соединения и проверяет, что ни одно
+разосланное сообщение не потеряно. Временные пользователи и комната удаляются.
+
+Режим codec: микробенчмарк подготовки кадров — прежняя схема (json.dumps для каждого
+получателя, get_full_name на каждое сообщение) против кадра, закодированного один раз
+(chat/codec.py: json или orjson, если установлен), для комнаты из 2 участников и --fanout получателей.
+
+Без настоящего Redis можно поднять локальную замену на fakeredis (TCP-сервер в процессе команды):
+
+    python manage.py benchmark_chat --fake-redis
+    python manage.py benchmark_chat --layer redis --redis-url redis://localhost:6379/0
+    python manage.py benchmark_chat --mode throughput --messages 1000 --burst 20
+    python manage.py benchmark_chat --mode writebehind --clients 4 --messages 500
+    python manage.py benchmark_chat --mode codec --fanout 1000
+"""
+
+import asyncio
+import json
+import multiprocessing
+import queue
+import socket
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+STOP_MESSAGE_TYPE = "benchmark.stop"
+
+
+def percentile(values, percent):
+    """Перцентиль percent (0..100) по отсортированному списку values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, round(len(values) * percent / 100))
+    return values[index]
+
+
+class QueryCounter:
+    """Счётчик SQL-запросов для connection.execute_wrapper (без журнала запросов)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def layer_settings(layer, redis_url):
+    """Настройка CHANNEL_LAYERS для выбранного бэкенда"""
+    config = {"BACKEND": settings.CHANNEL_LAYER_BACKENDS[layer]}
+    if layer != "memory":
+        config["CONFIG"] = {"hosts": [redis_url]}
+    return {"default": config}
+
+
+def setup_worker(channel_layers):
+    """Инициализация Django в дочернем процессе с выбранным channel layer"""
+    import django
+
+    django.setup()
+    settings.CHANNEL_LAYERS = channel_layers
+
+    from channels.layers import get_channel_layer
+
+    return get_channel_layer()
+
+
+def fanout_worker(channel_layers, group, clients, timeout, ready, results):
+    """Воркер: clients каналов в группе group, принимают сообщения до сигнала остановки"""
+    channel_layer = setup_worker(channel_layers)
+
+    async def receive_all(channel):
+        latencies = []
+        while True:
+            message = await channel_layer.receive(channel)
+            if message["type"] == STOP_MESSAGE_TYPE:
+                return latencies
+            latencies.append(time.time() - message["sent_at"])
+
+    async def run():
+        channels = [await channel_layer.new_channel() for _ in range(clients)]
+        for channel in channels:
+            await channel_layer.group_add(group, channel)
+        ready.put(len(channels))
+
+        tasks = [asyncio.create_task(receive_all(channel)) for channel in channels]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        for channel in channels:
+            await channel_layer.group_discard(group, channel)
+        # Если сигнал остановки не пришёл (сообщения не доходят до процесса), задержки не известны
+        return [latency for task in done for latency in task.result()], len(pending)
+
+    latencies, timed_out = asyncio.run(run())
+    results.put({"latencies": latencies, "timed_out": timed_out})
+
+
+class Command(BaseCommand):
+    help = "Нагрузочная проверка рассылки сообщений чата через channel layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode", choices=["fanout", "throughput", "writebehind", "codec"], default="fanout"
+        )
+        parser.add_argument(
+            "--layer",
+            choices=list(settings.CHANNEL_LAYER_BACKENDS),
+            default=settings.CHANNEL_LAYER,
+            help="Бэкенд channel layer (по умолчанию — CHANNEL_LAYER из настроек)",
+        )
+        parser.add_argument(
+            "--redis-url",
+            default=settings.CHANNEL_REDIS_URL,
+            help="Адрес Redis для бэкендов redis/redis-pubsub",
+        )
+        parser.add_argument(
+            "--fake-redis",
+            action="store_true",
+            help="Поднять локальный fakeredis-сервер вместо настоящего Redis",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Число процессов-получателей"
+        )
+        parser.add_argument(
+            "--clients", type=int, default=25, help="Число соединений в каждом процессе"
+        )
+        parser.add_argument(
+            "--messages", type=int, default=50, help="Число сообщений в группу"
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=30, help="Ожидание доставки, сек."
+        )
+        parser.add_argument(
+            "--room", type=int, help="id комнаты для режима throughput (по умолчанию — первая активная)"
+        )
+        parser.add_argument(
+            "--fanout", type=int, default=1000, help="Число получателей в режиме codec"
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=2000, help="Число сообщений в режиме codec"
+        )
+        parser.add_argument(
+            "--burst", type=int, default=10, help="Размер пачки сообщений в режиме throughput"
+        )
+
+    def handle(self, *args, **options):
+        getattr(self, f"run_{options['mode']}")(options)
+
+    def start_fake_redis(self, layer):
+        """Локальный TCP-сервер fakeredis в потоке команды — общий для всех процессов"""
+        try:
+            from fakeredis import TcpFakeServer
+        except ImportError:
+            raise CommandError("Для --fake-redis установите пакет fakeredis")
+        if layer == "redis":
+            try:
+                import lupa  # noqa: F401
+            except ImportError:
+                raise CommandError(
+                    "RedisChannelLayer выполняет Lua-скрипты (EVAL): для fakeredis "
+                    "установите пакет lupa или используйте --layer redis-pubsub"
+                )
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = TcpFakeServer(("127.0.0.1", port))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"redis://127.0.0.1:{port}/0"
+
+    def run_fanout(self, options):
+        layer = options["layer"]
+        redis_url = options["redis_url"]
+        server = None
+        if options["fake_redis"]:
+            if layer == "memory":
+                layer = "redis-pubsub"
+            server, redis_url = self.start_fake_redis(layer)
+        elif layer != "memory" and not redis_url:
+            raise CommandError("Для бэкенда redis укажите --redis-url или REDIS_URL")
+
+        channel_layers = layer_settings(layer, redis_url)
+        self.stdout.write(
+            f"Бэкенд: {channel_layers['default']['BACKEND']}"
+            + (f" ({redis_url})" if layer != "memory" else "")
+        )
+        try:
+            self.fanout(channel_layers, options)
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+
+    def fanout(self, channel_layers, options):
+        workers = options["workers"]
+        clients = options["clients"]
+        messages = options["messages"]
+        timeout = options["timeout"]
+        group = f"benchmark_{uuid.uuid4().hex}"
+
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=fanout_worker,
+                args=(channel_layers, group, clients, timeout, ready, results),
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for _ in processes:
+                ready.get(timeout=timeout)
+        except queue.Empty:
+            for process in processes:
+                process.terminate()
+            raise CommandError("Воркеры не подключились к channel layer")
+
+        channel_layer = setup_worker(channel_layers)
+
+        async def send_all():
+            for seq in range(messages):
+                await channel_layer.group_send(
+                    group,
+                    {"type": "chat.message", "seq": seq, "sent_at": time.time()},
+                )
+            await channel_layer.group_send(group, {"type": STOP_MESSAGE_TYPE})
+
+        started = time.perf_counter()
+        asyncio.run(send_all())
+        sent_in = time.perf_counter() - started
+
+        latencies = []
+        timed_out = 0
+        for _ in processes:
+            result = results.get(timeout=timeout + 30)
+            latencies.extend(result["latencies"])
+            timed_out += result["timed_out"]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        expected = workers * clients * messages
+        latencies.sort()
+        self.stdout.write(
+            f"Отправлено {messages} сообщений в группу из {workers}×{clients} соединений "
+            f"за {sent_in:.2f} с"
+        )
+        self.stdout.write(
+            f"Доставлено {len(latencies)}/{expected} за {elapsed:.2f} с "
+            f"({len(latencies) / elapsed:.0f} доставок/с), "
+            f"соединений без сигнала остановки: {timed_out}"
+        )
+        if latencies:
+            self.stdout.write(
+                "Задержка доставки, мс: "
+                f"p50 {statistics.median(latencies) * 1000:.1f}, "
+                f"p95 {percentile(latencies, 95) * 1000:.1f}, "
+                f"p99 {percentile(latencies, 99) * 1000:.1f}, "
+                f"max {latencies[-1] * 1000:.1f}"
+            )
+        if len(latencies) < expected:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Часть сообщений не доставлена: InMemoryChannelLayer не рассылает "
+                    "между процессами, а у Redis-бэкендов возможен сброс по capacity"
+                )
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("Все сообщения доставлены"))
+
+    def run_throughput(self, options):
+        from chat.models import ChatMessage, ChatRoom
+
+        rooms = ChatRoom.objects.filter(is_active=True).select_related("user1")
+        room = rooms.filter(id=options["room"]).first() if options["room"] else rooms.first()
+        if room is None:
+            raise CommandError("Нет активной комнаты, запустите generate_mock_data")
+        user = room.user1
+        messages = options["messages"]
+        burst = options["burst"]
+
+        def fetch_room_and_create(texts):
+            for text in texts:  # Прежний ChatConsumer.save_message
+                chat_room = ChatRoom.objects.get(id=room.id)
+                ChatMessage.objects.create(room=chat_room, user=user, message=text)
+
+        def create_by_room_id(texts):
+            for text in texts:
+                ChatMessage.objects.create(room_id=room.id, user=user, message=text)
+
+        def create_batches(texts):
+            for start in range(0, len(texts), burst):
+                ChatMessage.create_batch(room.id, user, texts[start : start + burst])
+
+        self.stdout.write(f"Комната {room.id}, {messages} сообщений на вариант")
+        texts = [f"benchmark {seq}" for seq in range(messages)]
+        with transaction.atomic():
+            for name, save in [
+                ("get + create", fetch_room_and_create),
+                ("create(room_id=)", create_by_room_id),
+                (f"create_batch по {burst}", create_batches),
+            ]:
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    started = time.perf_counter()
+                    save(texts)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name:<22} {messages / elapsed:8.0f} сообщений/с, "
+                    f"{elapsed * 1000 / messages:.2f} мс и "
+                    f"{counter.count / messages:.2f} запросов на сообщение"
+                )
+            transaction.set_rollback(True)  # Сообщения проверки в БД не оставляем
+
+    def run_writebehind(self, options):
+        from asgiref.testing import ApplicationCommunicator
+        from channels.routing import URLRouter
+
+        from chat.models import ChatMessage, ChatRoom
+        from chat.routing import websocket_urlpatterns
+        from users.models import User
+
+        application = URLRouter(websocket_urlpatterns)
+        clients = max(options["clients"], 2)
+        per_client = max(options["messages"] // clients, 1)
+        timeout = options["timeout"]
+        suffix = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(
+                email=f"benchmark-{suffix}-{number}@example.com",
+                first_name="Benchmark",
+                last_name=str(number),
+            )
+            for number in (1, 2)
+        ]
+        room = ChatRoom.objects.create(user1=users[0], user2=users[1])
+
+        async def connect(user):
+            communicator = ApplicationCommunicator(
+                application,
+                {
+                    "type": "websocket",
+                    "path": f"/ws/chat/{room.id}/",
+                    "user": user,
+                    "headers": [],
+                    "query_string": b"",
+                    "subprotocols": [],
+                },
+            )
+            await communicator.send_input({"type": "websocket.connect"})
+            accepted = await communicator.receive_output(timeout)
+            if accepted["type"] != "websocket.accept":
+                raise CommandError("ChatConsumer не принял соединение")
+            return communicator
+
+        async def receive_frames(communicator, frame_type, count):
+            """Кадры frame_type, пока не наберётся count (остальные пропускаем)"""
+            frames = []
+            while len(frames) < count:
+                output = await communicator.receive_output(timeout)
+                frame = json.loads(output["text"])
+                if frame["type"] == frame_type:
+                    frames.append(frame)
+            return frames
+
+        worker_id = settings.CHAT_WORKER_ID
+
+        async def run(write_behind):
+            settings.CHAT_WRITE_BEHIND = write_behind
+            if settings.CHAT_WORKER_ID is None:
+                settings.CHAT_WORKER_ID = 0  # Один процесс — номер воркера любой
+            senders = [await connect(users[0]) for _ in range(clients - 1)]
+            peer = await connect(users[1])
+            total = len(senders) * per_client
+
+            started = time.perf_counter()
+            for seq in range(per_client):
+                for sender in senders:
+                    text = json.dumps({"message": f"benchmark {seq}"})
+                    await sender.send_input({"type": "websocket.receive", "text": text})
+            delivered = await receive_frames(peer, "chat_message", total)
+            elapsed = time.perf_counter() - started
+
+            # Штатная остановка: закрываем все соединения сразу, не дожидаясь подтверждений
+            for communicator in senders + [peer]:
+                await communicator.send_input(
+                    {"type": "websocket.disconnect", "code": 1001}
+                )
+                await communicator.wait(timeout)
+            return total, delivered, elapsed
+
+        try:
+            for write_behind in (False, True):
+                total, delivered, elapsed = asyncio.run(run(write_behind))
+                delivered_ids = {frame["message_id"] for frame in delivered}
+                saved_ids = set(
+                    ChatMessage.objects.filter(id__in=delivered_ids).values_list(
+                        "id", flat=True
+                    )
+                )
+                mode = "отложенная запись" if write_behind else "запись сразу"
+                self.stdout.write(
+                    f"{mode:<18} {total} сообщений от {clients - 1} соединений за "
+                    f"{elapsed:.2f} с ({total / elapsed:.0f} сообщений/с), "
+                    f"сохранено после остановки {len(saved_ids)}/{len(delivered_ids)}"
+                )
+                if saved_ids != delivered_ids:
+                    raise CommandError(
+                        f"Потеряно {len(delivered_ids - saved_ids)} разосланных сообщений"
+                    )
+            room.refresh_from_db()
+            if room.message_count != ChatMessage.objects.filter(room=room).count():
+                raise CommandError("Счётчик сообщений комнаты не совпадает с историей")
+        finally:
+            settings.CHAT_WRITE_BEHIND = False
+            settings.CHAT_WORKER_ID = worker_id
+            room.delete()
+            for user in users:
+                user.delete()
+        self.stdout.write(self.style.SUCCESS("Потерь сообщений нет"))
+
+    def run_codec(self, options):
+        from chat import codec
+        from users.models import User
+
+        user = User(id=1, first_name="Анна", last_name="Иванова")
+        frame = json.dumps({"message": "Привет! Как прошёл день? " * 4})
+        iterations = options["iterations"]
+
+        def legacy(recipients):
+            # Прежний ChatConsumer: json.loads, get_full_name на сообщение,
+            # словарь события и json.dumps в chat_message у каждого получателя
+            data = json.loads(frame)
+            event = {
+                "message": data["message"],
+                "user_id": user.id,
+                "username": user.get_full_name(),
+                "message_id": 123456789,
+                "created_at": "2026-01-01T12:00:00.000000+00:00",
+            }
+            for _ in range(recipients):
+                json.dumps({**event, "type": "chat_message"})
+
+        def precomputed(loads, dumps, username):
+            def encode(recipients):
+                data = loads(frame)
+                text = dumps(
+                    {
+                        "message": data["message"],
+                        "user_id": user.id,
+                        "username": username,
+                        "message_id": 123456789,
+                        "created_at": "2026-01-01T12:00:00.000000+00:00",
+                        "type": "chat_message",
+                    }
+                )
+                for _ in range(recipients):
+                    event = {"type": "chat_message", "text": text}
+                    event["text"]  # Получатель пересылает готовую строку
+
+            return encode
+
+        username = user.get_full_name()  # В консьюмере — один раз при подключении
+        variants = [
+            ("json на получателя", legacy),
+            ("кадр один раз, json", precomputed(json.loads, codec.json_dumps, username)),
+        ]
+        if codec.orjson is not None:
+            variants.append(
+                (
+                    "кадр один раз, orjson",
+                    precomputed(codec.orjson.loads, codec.orjson_dumps, username),
+                )
+            )
+        else:
+            self.stdout.write("orjson не установлен, вариант с orjson пропущен")
+
+        for recipients in (2, options["fanout"]):
+            self.stdout.write(f"Получателей: {recipients}, сообщений: {iterations}")
+            for name, encode in variants:
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    encode(recipients)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  {name:<24} {elapsed * 1_000_000 / iterations:10.1f} мкс на сообщение"
+                )
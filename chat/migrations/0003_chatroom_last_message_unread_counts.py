@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_room_counters(apps, schema_editor):
+    """Заполняем последнее сообщение и счётчики непрочитанных по истории сообщений"""
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+
+    def unread_for(participant):
+        unread = (
+            ChatMessage.objects.filter(room=OuterRef("pk"), is_read=False)
+            .exclude(user=OuterRef(participant))
+            .values("room")
+            .annotate(unread=Count("id"))
+            .values("unread")
+        )
+        return Coalesce(Subquery(unread), Value(0))
+
+    ChatRoom.objects.update(
+        last_message=Subquery(
+            ChatMessage.objects.filter(room=OuterRef("pk"))
+            .order_by("-created_at", "-id")
+            .values("id")[:1]
+        ),
+        user1_unread_count=unread_for("user1"),
+        user2_unread_count=unread_for("user2"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user1_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user2_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_room_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:20
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    """
+    Переносим флаги is_read и счётчики непрочитанных в отметки прочтения:
+    прочитано = всего сообщений - непрочитанные, последнее прочитанное — максимальный id
+    среди своих сообщений и прочитанных сообщений собеседника
+    """
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+
+    messages_count = (
+        ChatMessage.objects.filter(room=OuterRef("pk"))
+        .values("room")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+
+    def last_read_for(participant):
+        last_read = (
+            ChatMessage.objects.filter(room=OuterRef("pk"))
+            .filter(Q(user=OuterRef(participant)) | Q(is_read=True))
+            .values("room")
+            .annotate(last_read=Max("id"))
+            .values("last_read")
+        )
+        return Subquery(last_read)
+
+    ChatRoom.objects.update(
+        message_count=Coalesce(Subquery(messages_count), Value(0)),
+        user1_last_read_id=last_read_for("user1"),
+        user2_last_read_id=last_read_for("user2"),
+    )
+    ChatRoom.objects.update(
+        user1_read_count=F("message_count") - F("user1_unread_count"),
+        user2_read_count=F("message_count") - F("user2_unread_count"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatmessage_room_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user1_last_read_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user1_read_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user2_last_read_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user2_read_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='chatmessage',
+            name='is_read',
+        ),
+        migrations.RemoveField(
+            model_name='chatroom',
+            name='user1_unread_count',
+        ),
+        migrations.RemoveField(
+            model_name='chatroom',
+            name='user2_unread_count',
+        ),
+    ]
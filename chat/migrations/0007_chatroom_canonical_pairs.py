@@ -0,0 +1,75 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.db.models import Exists, F, OuterRef
+
+BATCH_SIZE = 1000
+
+
+def canonicalize_pairs(apps, schema_editor):
+    """
+    Переставляем участников комнат в порядок user1_id < user2_id вместе с их отметками
+    прочтения. Комнаты перебираются по id пачками, каждая пачка — один UPDATE в своей
+    транзакции. Комната, у пары которой уже есть комната в каноническом порядке
+    (дубль из разных порядков), остаётся как есть: переставить её нарушило бы уникальность
+    """
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    canonical_exists = Exists(
+        ChatRoom.objects.filter(user1=OuterRef("user2"), user2=OuterRef("user1"))
+    )
+
+    last_id = 0
+    while True:
+        batch = list(
+            ChatRoom.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1]
+        with transaction.atomic():
+            # В SET все правые части читают значения строки до обновления — это обмен
+            ChatRoom.objects.filter(id__in=batch, user1__gt=F("user2")).exclude(
+                canonical_exists
+            ).update(
+                user1=F("user2"),
+                user2=F("user1"),
+                user1_read_count=F("user2_read_count"),
+                user2_read_count=F("user1_read_count"),
+                user1_last_read_id=F("user2_last_read_id"),
+                user2_last_read_id=F("user1_last_read_id"),
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False  # Пачки фиксируются по отдельности — без долгой блокировки таблицы комнат
+
+    dependencies = [
+        ('chat', '0006_chatmessage_created_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['user1', 'is_active'], name='chatroom_user1_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['user2', 'is_active'], name='chatroom_user2_active_idx'),
+        ),
+        migrations.AlterField(
+            model_name='chatroom',
+            name='user1',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='chat_rooms_user1', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='chatroom',
+            name='user2',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='chat_rooms_user2', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(canonicalize_pairs, migrations.RunPython.noop),
+    ]
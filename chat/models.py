@@ -1,5 +1,13 @@
 from django.apps import AppConfig
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from users.pairs import PairQuerySet
+
+from .snowflake import next_message_id
 from django.contrib.auth import get_user_model  # Возвращает модель пользователя
 
 User = get_user_model()  # Сохраняем модель пользователя в переменную User
@@ -9,22 +17,193 @@ User = get_user_model()  # Сохраняем модель пользовате
 class ChatRoom(models.Model):
     """Комната чата между двумя пользователями"""
 
+    # Пара хранится в порядке user1_id < user2_id (save), индексы FK покрывают Meta-индексы
     user1 = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="chat_rooms_user1"
+        User, on_delete=models.CASCADE, related_name="chat_rooms_user1", db_index=False
     )
     user2 = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="chat_rooms_user2"
+        User, on_delete=models.CASCADE, related_name="chat_rooms_user2", db_index=False
     )
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    # Денормализованные поля для списка чатов: последнее сообщение и число сообщений в комнате
+    last_message = models.ForeignKey(
+        "ChatMessage",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    message_count = models.PositiveIntegerField(default=0)
+    # Отметки прочтения участников: сколько сообщений комнаты прочитано и id последнего
+    # прочитанного. Непрочитанные = message_count - userN_read_count, без подсчёта по истории
+    user1_read_count = models.PositiveIntegerField(default=0)
+    user2_read_count = models.PositiveIntegerField(default=0)
+    user1_last_read_id = models.BigIntegerField(null=True, blank=True)
+    user2_last_read_id = models.BigIntegerField(null=True, blank=True)
+
+    objects = PairQuerySet.as_manager()
+
     class Meta:
         unique_together = ["user1", "user2"]
         ordering = ["-created_at"]
+        # «Мои чаты» — UNION выборок по каждому индексу (users/pairs.py)
+        indexes = [
+            models.Index(fields=["user1", "is_active"], name="chatroom_user1_active_idx"),
+            models.Index(fields=["user2", "is_active"], name="chatroom_user2_active_idx"),
+        ]
 
     def __str__(self):
         return f"Чат: {self.user1} & {self.user2}"
 
+    def save(self, *args, **kwargs):
+        # Новая комната — в каноническом порядке пары, как Match. У существующей порядок
+        # не меняем: вместе с участниками пришлось бы переставлять их отметки прочтения
+        if self._state.adding and self.user1_id > self.user2_id:
+            self.user1_id, self.user2_id = self.user2_id, self.user1_id
+        super().save(*args, **kwargs)
+        # Комнату могли деактивировать — сбрасываем кэш участников после фиксации транзакции
+        transaction.on_commit(lambda: cache.delete(self.participants_cache_key(self.id)))
+
+    def delete(self, *args, **kwargs):
+        room_id = self.id
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: cache.delete(self.participants_cache_key(room_id)))
+        return result
+
+    @staticmethod
+    def participants_cache_key(room_id):
+        return f"chat_room_participants:{room_id}"
+
+    @classmethod
+    def get_participants(cls, room_id):
+        """
+        id участников активной комнаты (user1_id, user2_id) или None, если комнаты нет
+        или она неактивна. Решение кэшируется на CHAT_MEMBERSHIP_TIMEOUT секунд, поэтому
+        волна переподключений WebSocket не превращается в волну запросов к БД
+        """
+        key = cls.participants_cache_key(room_id)
+        participants = cache.get(key)
+        if participants is None:
+            participants = (
+                cls.objects.filter(id=room_id, is_active=True)
+                .values_list("user1_id", "user2_id")
+                .first()
+            ) or ()  # Отсутствие комнаты тоже кэшируем
+            cache.set(key, tuple(participants), settings.CHAT_MEMBERSHIP_TIMEOUT)
+        return tuple(participants) or None
+
+    def participant_prefix(self, user_id):
+        """Префикс полей участника в комнате: user1 или user2"""
+        return "user1" if user_id == self.user1_id else "user2"
+
+    def unread_count_for(self, user):
+        """Число непрочитанных сообщений в комнате для участника user"""
+        prefix = self.participant_prefix(user.id)
+        return self.message_count - getattr(self, f"{prefix}_read_count")
+
+    def is_read(self, message):
+        """Прочитано ли сообщение собеседником отправителя (по его отметке прочтения)"""
+        recipient = "user2" if message.user_id == self.user1_id else "user1"
+        last_read_id = getattr(self, f"{recipient}_last_read_id")
+        return last_read_id is not None and message.id <= last_read_id
+
+    def mark_read(self, user):
+        """
+        Сдвигаем отметку прочтения участника до последнего сообщения в загруженном
+        состоянии комнаты. Если непрочитанных нет — в БД ничего не пишем.
+        Возвращаем id последнего прочитанного сообщения или None, если отметка не сдвинулась
+        """
+        prefix = self.participant_prefix(user.id)
+        if getattr(self, f"{prefix}_read_count") >= self.message_count:
+            return None
+        ChatRoom.objects.filter(
+            id=self.id, **{f"{prefix}_read_count__lt": self.message_count}
+        ).update(
+            **{
+                f"{prefix}_read_count": self.message_count,
+                f"{prefix}_last_read_id": self.last_message_id,
+            }
+        )
+        setattr(self, f"{prefix}_read_count", self.message_count)
+        setattr(self, f"{prefix}_last_read_id", self.last_message_id)
+        return self.last_message_id
+
+    @staticmethod
+    def register_messages(room_id, messages):
+        """
+        Учитываем новые сообщения комнаты (в порядке отправки) одним UPDATE:
+        последнее сообщение, число сообщений в комнате, а отметка прочтения каждого
+        отправителя сдвигается на его последнее сообщение (своё и всё до него он прочитал).
+        Пачки разных воркеров могут зафиксироваться не по порядку, поэтому last_message
+        и отметки прочтения только растут: пачка старее уже учтённого сообщения их
+        не перезаписывает
+        """
+        last_message_id = max(message.id for message in messages)
+        # Отправитель -> (номер его последнего сообщения в пачке, id этого сообщения)
+        senders = {
+            message.user_id: (position, message.id)
+            for position, message in enumerate(messages, start=1)
+        }
+
+        def read_fields(prefix):
+            def sender_behind(user_id, message_id):
+                """Отправитель user_id — этот участник, и его отметка до message_id"""
+                return Q(**{f"{prefix}_id": user_id}) & (
+                    Q(**{f"{prefix}_last_read_id__isnull": True})
+                    | Q(**{f"{prefix}_last_read_id__lt": message_id})
+                )
+
+            read_count_cases = []
+            for user_id, (position, message_id) in senders.items():
+                read_count_cases += [
+                    When(
+                        sender_behind(user_id, message_id)
+                        & ~Q(last_message_id__gt=message_id),
+                        then=F("message_count") + position,
+                    ),
+                    # В комнате уже учтены сообщения новее пачки — их не считаем прочитанными
+                    When(
+                        sender_behind(user_id, message_id),
+                        then=F(f"{prefix}_read_count") + position,
+                    ),
+                    # Отметка уже дальше пачки: её сообщения старее прочитанного
+                    When(
+                        Q(**{f"{prefix}_id": user_id}),
+                        then=F(f"{prefix}_read_count") + len(messages),
+                    ),
+                ]
+            return {
+                f"{prefix}_read_count": Case(
+                    *read_count_cases,
+                    default=F(f"{prefix}_read_count"),
+                    output_field=models.PositiveIntegerField(),
+                ),
+                f"{prefix}_last_read_id": Case(
+                    *[
+                        When(sender_behind(user_id, message_id), then=Value(message_id))
+                        for user_id, (_, message_id) in senders.items()
+                    ],
+                    default=F(f"{prefix}_last_read_id"),
+                    output_field=models.BigIntegerField(),
+                ),
+            }
+
+        ChatRoom.objects.filter(id=room_id).update(
+            last_message_id=Case(
+                When(
+                    Q(last_message__isnull=True) | Q(last_message_id__lt=last_message_id),
+                    then=Value(last_message_id),
+                ),
+                default=F("last_message_id"),
+                output_field=models.BigIntegerField(),
+            ),
+            message_count=F("message_count") + len(messages),
+            **read_fields("user1"),
+            **read_fields("user2"),
+        )
+
 
 class ChatMessage(models.Model):
     """Сообщение в чате"""
@@ -37,11 +216,106 @@ class ChatMessage(models.Model):
     )
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    # Время отправки; в режиме отложенной записи задаётся при рассылке, а не при вставке
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Ключ сообщения от клиента: повторная отправка с тем же ключом не создаёт дубль
+    client_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["created_at"]
+        # Индекс для keyset-пагинации истории комнаты по (created_at, id)
+        indexes = [
+            models.Index(
+                fields=["room", "created_at", "id"],
+                name="chat_message_room_keyset_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "client_key"], name="chat_message_client_key_uniq"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user}: {self.message[:20]}..."
+
+    def save(self, *args, **kwargs):
+        """Новое сообщение учитываем в счётчиках комнаты в одной транзакции со вставкой"""
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        if self.id is None and settings.CHAT_WRITE_BEHIND:
+            # В режиме отложенной записи все сообщения получают Snowflake-id,
+            # чтобы порядок id совпадал с порядком отправки
+            self.id = next_message_id()
+            kwargs["force_insert"] = True
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ChatRoom.register_messages(self.room_id, [self])
+
+    @classmethod
+    def bulk_insert(cls, messages):
+        """
+        Вставка готовых сообщений (возможно, из разных комнат) одним INSERT и одним UPDATE
+        счётчиков на комнату. bulk_create не вызывает save(), поэтому комнаты обновляем здесь же.
+        Повторы по client_key не вставляются: им присваивается id уже сохранённого сообщения
+        """
+        if not messages:
+            return messages
+        if settings.CHAT_WRITE_BEHIND:
+            for message in messages:
+                if message.id is None:
+                    message.id = next_message_id()
+        with transaction.atomic():
+            new_messages = cls.skip_duplicates(messages)
+            rooms = {}
+            for message in new_messages:
+                rooms.setdefault(message.room_id, []).append(message)
+            cls.objects.bulk_create(new_messages)
+            for room_id, room_messages in rooms.items():
+                ChatRoom.register_messages(room_id, room_messages)
+        return messages
+
+    @classmethod
+    def skip_duplicates(cls, messages):
+        """
+        Сообщения, которых ещё нет в БД. Повтор (тот же user и client_key — уже сохранённое
+        сообщение или предыдущее в этой же пачке) получает id оригинала и не вставляется
+        """
+        keys_by_user = {}
+        for message in messages:
+            if message.client_key:
+                keys_by_user.setdefault(message.user_id, set()).add(message.client_key)
+        if not keys_by_user:
+            return messages
+
+        condition = Q()
+        for user_id, keys in keys_by_user.items():
+            condition |= Q(user_id=user_id, client_key__in=keys)
+        saved = {
+            (user_id, client_key): message_id
+            for message_id, user_id, client_key in cls.objects.filter(condition).values_list(
+                "id", "user_id", "client_key"
+            )
+        }
+        new_messages = []
+        for message in messages:
+            key = (message.user_id, message.client_key)
+            if message.client_key and key in saved:
+                message.id = saved[key]
+                message._state.adding = False
+                continue
+            if message.client_key:
+                saved[key] = message.id
+            new_messages.append(message)
+        return new_messages
+
+    @classmethod
+    def create_batch(cls, room_id, user, texts, client_keys=None):
+        """Пачка сообщений одного отправителя в комнату room_id"""
+        client_keys = client_keys or [None] * len(texts)
+        return cls.bulk_insert(
+            [
+                cls(room_id=room_id, user=user, message=text, client_key=client_key)
+                for text, client_key in zip(texts, client_keys)
+            ]
+        )
@@ -0,0 +1,155 @@
+"""
+Keyset-пагинация по (created_at, id): история сообщений чата (MessageKeysetPagination),
+общая часть для других историй — KeysetPagination (users/pagination.py).
+
+В отличие от PageNumberPagination не делает OFFSET и COUNT(*): страница выбирается
+по индексу (room, created_at, id) условием «строго до/после курсора», поэтому
+прокрутка в обе стороны стоит одинаково на 10-м и на 100 000-м сообщении.
+
+Условие «до курсора» (created_at < c OR created_at = c AND id < i) планировщик не
+превращает в диапазон индекса из-за OR, поэтому к нему добавляется избыточная граница
+created_at <= c: индекс читается с позиции курсора, а OR лишь отбрасывает строки с created_at = c.
+"""
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Общая часть keyset-пагинации по (created_at, id): курсор — позиция строки
+    в base64, размер страницы — ?page_size= не больше max_page_size.
+    Наследник заполняет в paginate_queryset page, has_next и has_previous; ссылка
+    «вперёд» несёт курсор последней строки страницы в next_query_param, «назад» —
+    курсор первой в previous_query_param (None — ссылки в эту сторону нет)
+    """
+
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    invalid_cursor_message = "Некорректный курсор"
+    next_query_param = None
+    previous_query_param = None
+    has_next = False
+    has_previous = False
+
+    @staticmethod
+    def encode_cursor(obj):
+        position = f"{obj.created_at.isoformat()}|{obj.id}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            created_at, obj_id = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            )
+            return datetime.fromisoformat(created_at), int(obj_id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def older_than(queryset, created_at, obj_id):
+        """Строки строго до позиции (created_at, obj_id)"""
+        return queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=obj_id),
+            created_at__lte=created_at,  # Избыточная граница — диапазон индекса
+        )
+
+    @staticmethod
+    def newer_than(queryset, created_at, obj_id):
+        """Строки строго после позиции (created_at, obj_id)"""
+        return queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=obj_id),
+            created_at__gte=created_at,  # Избыточная граница — диапазон индекса
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_cursor_link(self, query_param, other_query_param, obj):
+        url = self.request.build_absolute_uri()
+        if other_query_param:
+            url = remove_query_param(url, other_query_param)
+        return replace_query_param(url, query_param, self.encode_cursor(obj))
+
+    def get_next_link(self):
+        if not self.next_query_param or not self.has_next or not self.page:
+            return None
+        return self.get_cursor_link(
+            self.next_query_param, self.previous_query_param, self.page[-1]
+        )
+
+    def get_previous_link(self):
+        if not self.previous_query_param or not self.has_previous or not self.page:
+            return None
+        return self.get_cursor_link(
+            self.previous_query_param, self.next_query_param, self.page[0]
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class MessageKeysetPagination(KeysetPagination):
+    """
+    Без курсора — последние page_size сообщений (самая свежая часть переписки).
+    ?before=<курсор> — предыдущие (более старые) сообщения, ?after=<курсор> — следующие.
+    Внутри страницы сообщения идут по возрастанию (created_at, id).
+    """
+
+    next_query_param = "after"
+    previous_query_param = "before"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+
+        if after:
+            created_at, message_id = self.decode_cursor(after)
+            page = list(
+                self.newer_than(queryset, created_at, message_id).order_by(
+                    "created_at", "id"
+                )[: page_size + 1]
+            )
+            self.has_next = len(page) > page_size
+            self.has_previous = True
+            self.page = page[:page_size]
+        else:
+            if before:
+                created_at, message_id = self.decode_cursor(before)
+                queryset = self.older_than(queryset, created_at, message_id)
+            page = list(queryset.order_by("-created_at", "-id")[: page_size + 1])
+            self.has_previous = len(page) > page_size
+            self.has_next = bool(before)
+            self.page = page[:page_size][::-1]
+        return self.page
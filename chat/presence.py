@@ -0,0 +1,78 @@
+"""
+Присутствие пользователей онлайн без записи в БД.
+
+Пользователь онлайн, пока в кэше (в продакшене — общий Redis) есть ключ presence:<id>.
+Ключ ставят подключение WebSocket и кадры {"type": "heartbeat"}, живёт он PRESENCE_TIMEOUT
+секунд — клиент шлёт heartbeat чаще (например, раз в PRESENCE_TIMEOUT / 2). Если воркер
+упал, не отключив сокеты, пользователь пропадает из онлайна сам по истечении ключа.
+
+Открытые соединения пользователя считает общий для всех воркеров счётчик
+presence_connections:<id> (cache.incr/decr): ключ presence снимается, когда закрыто
+последнее соединение пользователя во всех процессах, а не в одном. Счётчик живёт
+PRESENCE_TIMEOUT и продлевается heartbeat, поэтому соединения упавшего воркера
+перестают учитываться сами.
+
+User.last_active пишется в БД не чаще раза в LAST_ACTIVE_FLUSH_INTERVAL секунд
+на пользователя, а не при каждом User.save().
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from users.models import User
+
+
+def presence_key(user_id):
+    return f"presence:{user_id}"
+
+
+def connections_key(user_id):
+    return f"presence_connections:{user_id}"
+
+
+def touch(user_id):
+    """Отмечаем пользователя онлайн и при необходимости сбрасываем last_active в БД"""
+    cache.set(presence_key(user_id), 1, settings.PRESENCE_TIMEOUT)
+    cache.touch(connections_key(user_id), settings.PRESENCE_TIMEOUT)
+    flush_last_active(user_id)
+
+
+def flush_last_active(user_id):
+    """
+    Пишем last_active не чаще раза в LAST_ACTIVE_FLUSH_INTERVAL: cache.add атомарно
+    ставит ключ-замок, только если его нет, поэтому UPDATE делает один воркер
+    """
+    if cache.add(f"last_active_flush:{user_id}", 1, settings.LAST_ACTIVE_FLUSH_INTERVAL):
+        User.objects.filter(id=user_id).update(last_active=timezone.now())
+
+
+def connect(user_id):
+    key = connections_key(user_id)
+    # incr не создаёт ключ: первое соединение ставит счётчик атомарным add
+    if not cache.add(key, 1, settings.PRESENCE_TIMEOUT):
+        try:
+            cache.incr(key)
+        except ValueError:  # Счётчик истёк между add и incr
+            cache.add(key, 1, settings.PRESENCE_TIMEOUT)
+    touch(user_id)
+
+
+def disconnect(user_id):
+    """Снимаем присутствие, если это было последнее соединение пользователя во всех процессах"""
+    try:
+        remaining = cache.decr(connections_key(user_id))
+    except ValueError:  # Счётчик истёк: других живых соединений нет
+        remaining = 0
+    if remaining <= 0:
+        cache.delete(presence_key(user_id))
+
+
+def is_online(user_id):
+    return cache.get(presence_key(user_id)) is not None
+
+
+def online_user_ids(user_ids):
+    """Кто из user_ids онлайн — одним запросом get_many к кэшу"""
+    keys = {presence_key(user_id): user_id for user_id in user_ids}
+    return {keys[key] for key in cache.get_many(keys)}
@@ -4,6 +4,7 @@ ws/chat/                            — фиксированная часть п
 (?P<room_id>\w+)                    — получение room_id
 /$                                  — завершающий слэш и символ конца строки адреса
 consumers.ChatConsumer.as_asgi()    - указание на получателя сообщений
+ws/user/                            — одно соединение пользователя для всех комнат и уведомлений (UserConsumer)
 """
 
 from django.urls import re_path
@@ -11,4 +12,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r"ws/chat/(?P<room_id>\w+)/$", consumers.ChatConsumer.as_asgi()),
+    re_path(r"ws/user/$", consumers.UserConsumer.as_asgi()),
 ]
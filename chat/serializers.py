@@ -11,12 +11,20 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     user_profile = UserProfileSerializer(
         source="user", read_only=True
     )  # поле для отображения профиля пользователя
+    is_read = (
+        serializers.SerializerMethodField()
+    )  # прочитано ли сообщение собеседником — по его отметке прочтения в комнате
 
     class Meta:
         model = ChatMessage
         fields = ["id", "user", "user_profile", "message", "created_at", "is_read"]
         read_only_fields = ["id", "user", "created_at", "is_read"]
 
+    def get_is_read(self, obj):
+        return obj.room.is_read(
+            obj
+        )  # комнату сообщениям истории проставляет вьюсет, отдельного запроса нет
+
 
 class ChatRoomSerializer(serializers.ModelSerializer):
     other_user = (
@@ -40,8 +48,8 @@ class ChatRoomSerializer(serializers.ModelSerializer):
             "request"
         )  # получаем объект запроса из контекста сериализатора
         other_user = (
-            obj.user2 if request.user == obj.user1 else obj.user1
-        )  # определяем, кто является собеседником
+            obj.user2 if request.user.id == obj.user1_id else obj.user1
+        )  # определяем, кто является собеседником (по id, без загрузки user1)
         return UserProfileSerializer(
             other_user
         ).data  # возвращаем сериализованные данные о пользователе
@@ -50,8 +58,10 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         self, obj
     ):  # функция для получения последнего сообщения в переписке
         last_message = (
-            obj.messages.last()
-        )  # получаем последнее сообщение из модели ChatMessage
+            obj.last_message
+        )  # денормализованная ссылка на последнее сообщение (select_related во вьюсете)
+        if last_message:
+            last_message.room = obj  # для is_read без повторной загрузки комнаты
         return (
             ChatMessageSerializer(last_message).data if last_message else None
         )  # если сообщение есть, сериализуем его
@@ -59,7 +69,10 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     def get_unread_count(
         self, obj
     ):  # функция для получения количества непрочитанных сообщений
-        return getattr(obj, "unread_count", 0)  # по атрибуту unread_count в комнате
+        request = self.context.get("request")
+        return obj.unread_count_for(
+            request.user
+        )  # по счётчику непрочитанных текущего пользователя в комнате
 
 
 class SendMessageSerializer(serializers.Serializer):
@@ -0,0 +1,74 @@
+"""
+Генератор id сообщений чата в стиле Snowflake.
+
+id = десятки миллисекунд от SNOWFLAKE_EPOCH_MS (37 бит, ~43 года) | номер воркера (6 бит)
+| счётчик в пределах тика (10 бит). Всего 53 бита — id остаётся точным числом в JSON
+для JavaScript-клиентов. id выдаётся без обращения к БД и растёт вместе со временем,
+поэтому сообщение можно разослать собеседнику до вставки в таблицу, а порядок id совпадает
+с порядком отправки (с точностью до тика и расхождения часов воркеров).
+
+Номер воркера задаётся явно (CHAT_WORKER_ID, 0..63, свой у каждого процесса сервера):
+pid для этого не годится — в контейнерах сервер обычно работает с pid 1, и реплики
+выдавали бы одинаковые id.
+"""
+
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+SNOWFLAKE_EPOCH_MS = 1735689600000  # 2025-01-01 00:00:00 UTC
+TICK_MS = 10
+WORKER_ID_BITS = 6
+SEQUENCE_BITS = 10
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class SnowflakeGenerator:
+    """Потокобезопасный генератор id для одного воркера"""
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id & MAX_WORKER_ID
+        self.pid = os.getpid()
+        self.last_tick = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            tick = (int(time.time() * 1000) - SNOWFLAKE_EPOCH_MS) // TICK_MS
+            # Часы не должны идти назад, иначе id перестанут расти
+            tick = max(tick, self.last_tick)
+            if tick == self.last_tick:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:  # Счётчик тика исчерпан — берём следующий тик
+                    tick += 1
+            else:
+                self.sequence = 0
+            self.last_tick = tick
+            return (
+                (tick << (WORKER_ID_BITS + SEQUENCE_BITS))
+                | (self.worker_id << SEQUENCE_BITS)
+                | self.sequence
+            )
+
+
+_generator = None
+
+
+def next_message_id():
+    """Следующий id сообщения; номер воркера — CHAT_WORKER_ID"""
+    global _generator
+    worker_id = settings.CHAT_WORKER_ID
+    if worker_id is None or not 0 <= worker_id <= MAX_WORKER_ID:
+        raise ImproperlyConfigured(
+            f"Для CHAT_WRITE_BEHIND задайте CHAT_WORKER_ID от 0 до {MAX_WORKER_ID}, "
+            "уникальный для каждого процесса сервера"
+        )
+    if _generator is None or _generator.pid != os.getpid() or _generator.worker_id != worker_id:
+        # После fork у процесса свой генератор со счётчиком с нуля
+        _generator = SnowflakeGenerator(worker_id)
+    return _generator()
@@ -0,0 +1,232 @@
+import json
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from users.models import User
+
+from .events import room_group_name
+from .models import ChatMessage, ChatRoom
+from .routing import websocket_urlpatterns
+from .snowflake import next_message_id
+from .writebehind import MessageBuffer
+
+
+@override_settings(CHAT_WRITE_BEHIND=True, CHAT_WORKER_ID=1)
+class WriteBehindTests(TransactionTestCase):
+    """Отложенная запись сообщений: буфер пишется в другом потоке, поэтому TransactionTestCase"""
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(email="writer1@example.com", password="x")
+        self.user2 = User.objects.create_user(email="writer2@example.com", password="x")
+        self.room = ChatRoom.objects.create(user1=self.user1, user2=self.user2)
+
+    def message(self, text, room_id=None):
+        return ChatMessage(
+            id=next_message_id(),
+            room_id=room_id or self.room.id,
+            user=self.user1,
+            message=text,
+        )
+
+    async def test_flush_saves_whole_batch(self):
+        buffer = MessageBuffer(flush_interval_ms=1000, batch_size=1000)
+        messages = [self.message(f"сообщение {number}") for number in range(5)]
+        futures = [buffer.add(message) for message in messages]
+
+        await buffer.flush()
+
+        self.assertTrue(all(future.result() for future in futures))
+        self.assertEqual(buffer.pending, [])
+        saved = await ChatMessage.objects.filter(room=self.room).acount()
+        self.assertEqual(saved, 5)
+        await self.room.arefresh_from_db()
+        self.assertEqual(self.room.message_count, 5)
+        self.assertEqual(self.room.last_message_id, messages[-1].id)
+
+    async def test_failed_row_does_not_block_batch(self):
+        buffer = MessageBuffer(flush_interval_ms=1000, batch_size=1000)
+        good = [self.message("до"), self.message("после")]
+        poison = self.message("в удалённую комнату", room_id=self.room.id + 1000)
+        futures = [buffer.add(message) for message in (good[0], poison, good[1])]
+
+        with self.assertLogs("chat.writebehind", level="ERROR") as logs:
+            await buffer.flush()
+
+        dead_letters = [r for r in logs.records if r.name == "chat.writebehind.dead_letter"]
+        self.assertEqual(len(dead_letters), 1)
+
+        self.assertEqual(buffer.pending, [])
+        self.assertTrue(futures[0].result())
+        self.assertIsNotNone(futures[1].exception())
+        self.assertTrue(futures[2].result())
+        saved_ids = {
+            message_id
+            async for message_id in ChatMessage.objects.values_list("id", flat=True)
+        }
+        self.assertEqual(saved_ids, {message.id for message in good})
+
+    async def test_no_message_loss_on_disconnect(self):
+        """Все разосланные сообщения сохранены после закрытия сокетов (штатная остановка)"""
+        application = URLRouter(websocket_urlpatterns)
+        path = f"/ws/chat/{self.room.id}/"
+        sender = WebsocketCommunicator(application, path)
+        sender.scope["user"] = self.user1
+        peer = WebsocketCommunicator(application, path)
+        peer.scope["user"] = self.user2
+        self.assertTrue((await sender.connect())[0])
+        self.assertTrue((await peer.connect())[0])
+
+        for number in range(20):
+            await sender.send_json_to({"message": f"сообщение {number}"})
+        delivered = set()
+        while len(delivered) < 20:
+            frame = json.loads(await peer.receive_from(timeout=5))
+            if "message_id" in frame:
+                delivered.add(frame["message_id"])
+
+        await sender.disconnect()
+        await peer.disconnect()
+
+        saved = {
+            message_id
+            async for message_id in ChatMessage.objects.filter(
+                id__in=delivered
+            ).values_list("id", flat=True)
+        }
+        self.assertEqual(saved, delivered)
+
+    async def test_resend_with_client_key_is_idempotent(self):
+        """Повтор неподтверждённых сообщений после переподключения не создаёт дублей"""
+        application = URLRouter(websocket_urlpatterns)
+        path = f"/ws/chat/{self.room.id}/"
+        frame = {
+            "messages": [
+                {"message": "первое", "client_key": "key-1"},
+                {"message": "второе", "client_key": "key-2"},
+            ]
+        }
+        acks = []
+        for _ in range(2):  # Отправка и повтор после переподключения
+            sender = WebsocketCommunicator(application, path)
+            sender.scope["user"] = self.user1
+            self.assertTrue((await sender.connect())[0])
+            await sender.send_json_to(frame)
+            while True:
+                reply = json.loads(await sender.receive_from(timeout=5))
+                if reply.get("type") == "ack":
+                    break
+            acks.append((reply["message_ids"], reply["client_keys"]))
+            await sender.disconnect()
+
+        self.assertEqual(acks[0], acks[1])  # Повтор подтверждён id оригиналов
+        message_ids, client_keys = acks[0]
+        self.assertEqual(client_keys, ["key-1", "key-2"])
+        saved = [
+            (message_id, client_key)
+            async for message_id, client_key in ChatMessage.objects.order_by(
+                "id"
+            ).values_list("id", "client_key")
+        ]
+        self.assertEqual(saved, list(zip(message_ids, client_keys)))
+        await self.room.arefresh_from_db()
+        self.assertEqual(self.room.message_count, 2)
+
+    @override_settings(CHAT_WORKER_ID=None)
+    def test_worker_id_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            next_message_id()
+
+
+@override_settings(CHAT_WRITE_BEHIND=False, CHAT_WORKER_ID=1)
+class UserConsumerTests(TransactionTestCase):
+    """Подписки UserConsumer: события комнат приходят через группу user_<id>"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="subscriber@example.com", password="x")
+        self.peer = User.objects.create_user(email="peer@example.com", password="x")
+        self.other = User.objects.create_user(email="other@example.com", password="x")
+        self.room = ChatRoom.objects.create(user1=self.user, user2=self.peer)
+        self.other_room = ChatRoom.objects.create(user1=self.user, user2=self.other)
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def connect(self, path, user):
+        communicator = WebsocketCommunicator(self.application, path)
+        communicator.scope["user"] = user
+        self.assertTrue((await communicator.connect())[0])
+        return communicator
+
+    async def receive_type(self, communicator, frame_type):
+        while True:
+            frame = json.loads(await communicator.receive_from(timeout=5))
+            if frame["type"] == frame_type:
+                return frame
+
+    async def test_only_subscribed_rooms_are_delivered(self):
+        peer = await self.connect(f"/ws/chat/{self.room.id}/", self.peer)
+        other = await self.connect(f"/ws/chat/{self.other_room.id}/", self.other)
+        user = await self.connect("/ws/user/", self.user)
+        await user.send_json_to({"type": "subscribe", "room_id": self.room.id})
+        await self.receive_type(user, "subscribed")
+        # В группе комнаты — только ChatConsumer собеседника, подписка её не меняет
+        room_group = get_channel_layer().groups[room_group_name(self.room.id)]
+        self.assertEqual(len(room_group), 1)
+
+        await other.send_json_to({"message": "в комнату без подписки"})
+        await peer.send_json_to({"message": "в подписанную комнату"})
+        frame = await self.receive_type(user, "chat_message")
+        self.assertEqual(frame["room_id"], self.room.id)
+        self.assertEqual(frame["message"], "в подписанную комнату")
+
+        await user.send_json_to({"type": "unsubscribe", "room_id": self.room.id})
+        await self.receive_type(user, "unsubscribed")
+        await peer.send_json_to({"message": "после отписки"})
+        await self.receive_type(peer, "chat_message")  # Своё сообщение дошло до группы
+        self.assertTrue(await user.receive_nothing(timeout=0.5))
+
+        for communicator in (peer, other, user):
+            await communicator.disconnect()
+
+
+@override_settings(CHAT_WORKER_ID=1)
+class RegisterMessagesTests(TestCase):
+    """Денормализованные поля комнаты при пачках, зафиксированных не по порядку"""
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(email="counter1@example.com", password="x")
+        self.user2 = User.objects.create_user(email="counter2@example.com", password="x")
+        self.room = ChatRoom.objects.create(user1=self.user1, user2=self.user2)
+
+    def create_messages(self, *senders):
+        messages = [
+            ChatMessage(id=next_message_id(), room=self.room, user=sender, message="текст")
+            for sender in senders
+        ]
+        return ChatMessage.objects.bulk_create(messages)
+
+    def test_last_message_never_moves_backwards(self):
+        older = self.create_messages(self.user1)
+        newer = self.create_messages(self.user2)
+
+        ChatRoom.register_messages(self.room.id, newer)
+        ChatRoom.register_messages(self.room.id, older)
+
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_message_id, newer[-1].id)
+        self.assertEqual(self.room.message_count, 2)
+
+    def test_read_watermark_never_moves_backwards(self):
+        older = self.create_messages(self.user1, self.user2)
+        newer = self.create_messages(self.user1)
+
+        ChatRoom.register_messages(self.room.id, newer)
+        ChatRoom.register_messages(self.room.id, older)
+
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.user1_last_read_id, newer[-1].id)
+        self.assertEqual(self.room.user2_last_read_id, older[-1].id)
+        self.assertEqual(self.room.unread_count_for(self.user1), 0)
+        self.assertEqual(self.room.unread_count_for(self.user2), 1)
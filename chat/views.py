@@ -5,8 +5,9 @@
 from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q, Count
+from .events import broadcast_read_receipt
 from .models import ChatRoom, ChatMessage
+from .pagination import MessageKeysetPagination
 from .serializers import (
     ChatRoomSerializer,
     ChatMessageSerializer,
@@ -32,17 +33,17 @@ class ChatRoomViewSet(viewsets.ReadOnlyModelViewSet):
         ):  # Если фейковый запрос (не авториз.user) — возвращаем пустой QS
             return ChatRoom.objects.none()
 
-        return ChatRoom.objects.filter(
-            Q(user1=self.request.user)
-            | Q(user2=self.request.user),  # Фильтрация по текущему пользователю
-            is_active=True,  # Фильтрация по активным комнатам
-        ).annotate(
-            unread_count=Count(
-                "messages",
-                filter=Q(messages__is_read=False)
-                & ~Q(messages__user=self.request.user),
+        # Активные комнаты текущего пользователя: UNION выборок по индексам user1 и user2
+        queryset = ChatRoom.objects.for_user(self.request.user, is_active=True)
+        if self.action in ["list", "retrieve"]:
+            # Последнее сообщение и счётчики непрочитанных денормализованы в ChatRoom:
+            # список чатов — один запрос с JOIN и prefetch фото, без подсчёта по истории
+            queryset = queryset.select_related(
+                "user1", "user2", "last_message__user"
+            ).prefetch_related(
+                "user1__photos", "user2__photos", "last_message__user__photos"
             )
-        )  # Добавляем атрибут unread_count для каждой комнаты - число непрочитанных сообщенй (исключаем сообщения пользователя)
+        return queryset
 
     def get_serializer_context(self):  # Добавляем контекст для сериализатора
         context = super().get_serializer_context()  # Получаем контекст базовым методом
@@ -59,21 +60,23 @@ class ChatRoomViewSet(viewsets.ReadOnlyModelViewSet):
     ):  # Действие messages для получения сообщений комнаты
         """Получение сообщений комнаты"""
         room = self.get_object()
-        messages = room.messages.all()
-
-        # Помечаем сообщения как прочитанные
-        room.messages.filter(is_read=False).exclude(user=request.user).update(
-            is_read=True
-        )
-
-        # Проверяем, нужно ли выполнить пагинацию, и выполняем её, если нужно
-        page = self.paginate_queryset(messages)
-        if page is not None:
-            serializer = ChatMessageSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = ChatMessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        messages = room.messages.select_related("user").prefetch_related(
+            "user__photos"
+        )  # Автор сообщения JOIN-ом, его фото одним запросом — без N+1 в ChatMessageSerializer
+
+        # Сдвигаем отметку прочтения до последнего сообщения комнаты одним UPDATE
+        # (только если есть непрочитанные) и сообщаем собеседнику через WebSocket
+        last_read_id = room.mark_read(request.user)
+        if last_read_id:
+            broadcast_read_receipt(room, request.user.id, last_read_id)
+
+        # Keyset-пагинация по (created_at, id) с курсорами before/after вместо OFFSET и COUNT(*)
+        paginator = MessageKeysetPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        for message in page:
+            message.room = room  # is_read считается по отметкам прочтения комнаты
+        serializer = ChatMessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=["post"])
     def send_message(self, request, pk=None):
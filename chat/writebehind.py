@@ -0,0 +1,136 @@
+"""
+Отложенная запись (write-behind) сообщений чата, включается настройкой CHAT_WRITE_BEHIND.
+
+ChatConsumer присваивает сообщению Snowflake-id и рассылает его собеседнику сразу,
+а в БД сообщение попадает через буфер процесса: пачкой ChatMessage.bulk_insert раз
+в CHAT_FLUSH_INTERVAL_MS мс или как только набралось CHAT_FLUSH_BATCH_SIZE сообщений.
+
+Гарантии сохранности:
+- сообщение сохранено, только когда отправитель получил кадр {"type": "ack"} с его id
+  и client_key; неподтверждённые сообщения клиент отправляет повторно после
+  переподключения с теми же client_key — уже сохранённые повторы не вставляются
+  (уникальность (user, client_key)), а подтверждаются id оригинала;
+- если пачка не записалась, сообщения пишутся по одному: одна плохая строка (удалённая
+  комната или пользователь, повтор id) не блокирует остальные. Сообщения, которые
+  не записались и по одному, уходят в лог chat.writebehind.dead_letter, их future
+  завершается ошибкой — отправитель получает кадр ошибки вместо ack;
+- при штатной остановке буфер сбрасывается при отключении каждого сокета и, на всякий
+  случай, синхронно при выходе из процесса (atexit). Теряются только сообщения,
+  не подтверждённые к моменту аварийного завершения процесса (SIGKILL, OOM).
+
+Snowflake-id больше id из последовательности таблицы. Перед выключением режима на PostgreSQL
+последовательность chat_chatmessage_id_seq нужно сдвинуть за максимальный id (setval),
+иначе новые сообщения получат меньшие id и отметки прочтения будут сравнивать их неверно.
+"""
+
+import asyncio
+import atexit
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+dead_letter_logger = logging.getLogger(f"{__name__}.dead_letter")
+
+
+def insert_one_by_one(messages):
+    """
+    Записываем сообщения по одному (каждое в своей транзакции).
+    Возвращает исключение для каждого сообщения (None — записано)
+    """
+    errors = []
+    for message in messages:
+        try:
+            ChatMessage.bulk_insert([message])
+        except Exception as error:
+            dead_letter_logger.error(
+                "Сообщение %s не записано (комната %s, пользователь %s): %r",
+                message.id,
+                message.room_id,
+                message.user_id,
+                error,
+                extra={"chat_message": message.message},
+            )
+            errors.append(error)
+        else:
+            errors.append(None)
+    return errors
+
+
+class MessageBuffer:
+    """Буфер несохранённых сообщений одного процесса (одного цикла событий)"""
+
+    def __init__(self, flush_interval_ms, batch_size):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.pending = []  # (сообщение, future подтверждения записи)
+        self.flush_lock = asyncio.Lock()
+        self.timer = None
+
+    def add(self, message):
+        """Ставим сообщение в очередь на запись, возвращаем future, завершаемую после записи"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        if len(self.pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        elif self.timer is None:
+            self.timer = asyncio.ensure_future(self.flush_later())
+        return future
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self.timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Записываем все накопленные сообщения одной пачкой"""
+        async with self.flush_lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            messages = [message for message, _ in batch]
+            try:
+                await database_sync_to_async(ChatMessage.bulk_insert)(messages)
+                errors = [None] * len(batch)
+            except Exception:
+                logger.exception(
+                    "Пачка из %d сообщений чата не записана, пишем по одному", len(batch)
+                )
+                errors = await database_sync_to_async(insert_one_by_one)(messages)
+            for (_, future), error in zip(batch, errors):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(True)
+                else:
+                    future.set_exception(error)
+
+    def flush_sync(self):
+        """Синхронный сброс остатка при выходе из процесса, когда цикл событий уже остановлен"""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        messages = [message for message, _ in batch]
+        try:
+            ChatMessage.bulk_insert(messages)
+        except Exception:
+            logger.exception("Пачка из %d сообщений чата не записана при выходе", len(batch))
+            insert_one_by_one(messages)
+
+
+_buffers = {}
+
+
+def get_buffer():
+    """Буфер текущего цикла событий (у каждого ASGI-воркера свой)"""
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = _buffers[loop] = MessageBuffer(
+            settings.CHAT_FLUSH_INTERVAL_MS, settings.CHAT_FLUSH_BATCH_SIZE
+        )
+        atexit.register(buffer.flush_sync)
+    return buffer
@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from datetime import timedelta  # для установки времени жизни токена
 from decouple import config  # импортируем модуль для работы с переменными окружения
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -98,13 +99,88 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "dating_app.wsgi.application"
 
+# Общий Redis для кэша и channel layer всех воркеров в продакшене (пусто — память процесса)
+REDIS_URL = config("REDIS_URL", default="")
+
 # Channels для WebSocket
 ASGI_APPLICATION = "dating_app.asgi.application"
+
+# Channel layer: memory — группы только внутри одного процесса (разработка, один ASGI-воркер),
+# redis — channels_redis на списках Redis, redis-pubsub — channels_redis на Redis Pub/Sub.
+# С Redis сообщение group_send доходит до сокетов во всех воркерах
+CHANNEL_LAYER_BACKENDS = {
+    "memory": "channels.layers.InMemoryChannelLayer",
+    "redis": "channels_redis.core.RedisChannelLayer",
+    "redis-pubsub": "channels_redis.pubsub.RedisPubSubChannelLayer",
+}
+CHANNEL_LAYER = config("CHANNEL_LAYER", default="redis" if REDIS_URL else "memory")
+if CHANNEL_LAYER not in CHANNEL_LAYER_BACKENDS:
+    raise ImproperlyConfigured(
+        f"CHANNEL_LAYER={CHANNEL_LAYER}, допустимо: {', '.join(CHANNEL_LAYER_BACKENDS)}"
+    )
+CHANNEL_REDIS_URL = config("CHANNEL_REDIS_URL", default=REDIS_URL)
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        "BACKEND": CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER],
     },
 }
+if CHANNEL_LAYER != "memory":
+    CHANNEL_LAYERS["default"]["CONFIG"] = {"hosts": [CHANNEL_REDIS_URL]}
+
+# Кэш: по умолчанию память процесса, в продакшене — общий Redis для всех воркеров
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Отложенная запись сообщений чата: ChatConsumer рассылает сообщение сразу, а в БД пишет
+# пачками (bulk_create) раз в CHAT_FLUSH_INTERVAL_MS мс или по CHAT_FLUSH_BATCH_SIZE сообщений.
+# id сообщений — Snowflake (chat/snowflake.py), CHAT_WORKER_ID — номер воркера 0..63, обязателен
+# при CHAT_WRITE_BEHIND и должен быть уникальным для каждого процесса сервера (реплики, воркеры)
+CHAT_WRITE_BEHIND = config("CHAT_WRITE_BEHIND", default=False, cast=bool)
+CHAT_FLUSH_INTERVAL_MS = config("CHAT_FLUSH_INTERVAL_MS", default=50, cast=int)
+CHAT_FLUSH_BATCH_SIZE = config("CHAT_FLUSH_BATCH_SIZE", default=100, cast=int)
+CHAT_WORKER_ID = config("CHAT_WORKER_ID", default="")
+CHAT_WORKER_ID = int(CHAT_WORKER_ID) if CHAT_WORKER_ID else None
+
+# Присутствие онлайн (chat/presence.py): время жизни ключа без heartbeat от клиента, сек.,
+# и минимальный интервал записи User.last_active в БД для одного пользователя, сек.
+PRESENCE_TIMEOUT = config("PRESENCE_TIMEOUT", default=60, cast=int)
+LAST_ACTIVE_FLUSH_INTERVAL = config("LAST_ACTIVE_FLUSH_INTERVAL", default=60 * 5, cast=int)
+
+# Время жизни в кэше участников комнаты чата для проверки доступа к WebSocket, сек.
+CHAT_MEMBERSHIP_TIMEOUT = config("CHAT_MEMBERSHIP_TIMEOUT", default=60 * 5, cast=int)
+
+# Время жизни в кэше битовой карты просмотренных анкет (seen set) пользователя, сек.
+SEEN_SET_TIMEOUT = config("SEEN_SET_TIMEOUT", default=60 * 60 * 24, cast=int)
+
+# Счётчик лайков популярных анкет: при LIKES_COUNTER_SHARDS > 0 лайки пользователей,
+# у которых уже не меньше LIKES_COUNTER_SHARD_THRESHOLD лайков, копятся в LIKES_COUNTER_SHARDS
+# строках-шардах (LikeCounterShard) и переносятся в User.likes_count командой fold_like_counters
+LIKES_COUNTER_SHARDS = config("LIKES_COUNTER_SHARDS", default=0, cast=int)
+LIKES_COUNTER_SHARD_THRESHOLD = config("LIKES_COUNTER_SHARD_THRESHOLD", default=10000, cast=int)
+
+# Очередь свайпов (users/swipes.py): лайки, дизлайки и просмотры пишутся в SwipeEvent,
+# а в UserAction/Match их пачками по SWIPE_BATCH_SIZE применяет команда process_swipes
+SWIPE_QUEUE = config("SWIPE_QUEUE", default=False, cast=bool)
+SWIPE_BATCH_SIZE = config("SWIPE_BATCH_SIZE", default=200, cast=int)
+
+# Версии фото пользователя (users/renditions.py): ширины в пикселях и форматы, которые
+# генерируются один раз при загрузке. Оригинал сохраняется без изменений; форматы,
+# которые не поддерживает установленный Pillow, пропускаются
+PHOTO_RENDITION_WIDTHS = [
+    int(width) for width in config("PHOTO_RENDITION_WIDTHS", default="160,320,640,1080").split(",")
+]
+PHOTO_RENDITION_FORMATS = config("PHOTO_RENDITION_FORMATS", default="avif,webp").split(",")
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -120,6 +196,12 @@ DATABASES = {
         "PORT": config("SQL_PORT"),
     }
 }
+if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+    # Локальная SQLite: транзакция сразу берёт блокировку записи (BEGIN IMMEDIATE) и ждёт её
+    # до timeout секунд, а тестовая БД — файл, а не общая память, где параллельные
+    # транзакции тестов получают "database table is locked" без ожидания
+    DATABASES["default"]["OPTIONS"] = {"transaction_mode": "IMMEDIATE", "timeout": 20}
+    DATABASES["default"]["TEST"] = {"NAME": BASE_DIR / "test_db.sqlite3"}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,243 @@
+"""
+Подбор случайных анкет для свайпов без ORDER BY RANDOM().
+
+Каждому пользователю при создании присваивается случайный ключ random_key в [0, 1).
+Для выборки берём случайную точку круга и идём keyset-запросами по индексам пулов
+кандидатов из User.Meta.indexes (ключ >= точки, затем с начала круга).
+Стоимость запроса не зависит от размера таблицы users_user.
+
+Уже оценённые/просмотренные анкеты отсекаются не подзапросом NOT IN по всей
+истории UserAction, а проверкой в SeenSet — битовой карте id в кэше (в Redis — по пачке
+кандидатов за одну команду).
+"""
+
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import User, UserAction
+
+CANDIDATE_BATCH_SIZE = 20  # Размер пачки кандидатов в одном keyset-запросе
+MAX_SCANNED_CANDIDATES = 200  # Сколько кандидатов просматриваем до точного запроса в БД
+
+
+def redis_client():
+    """Клиент Redis, если кэш Django хранится в Redis (REDIS_URL), иначе None"""
+    backend = caches["default"]
+    if isinstance(backend, RedisCache):
+        return backend._cache.get_client(write=True)
+    return None
+
+
+class SeenSet:
+    """
+    Множество id анкет, которые пользователь уже видел, лайкал или дизлайкал.
+    Хранится в кэше битовой картой: бит с номером id установлен — анкета просмотрена,
+    бит 0 (id 0 не бывает) — карта собрана из UserAction. При промахе кэша карта один
+    раз собирается из истории, дальше дополняется инкрементально из like/dislike/view.
+
+    С кэшем в Redis биты ставятся командой SETBIT, а пачка кандидатов проверяется одной
+    командой BITFIELD: одновременные add() из разных воркеров не затирают биты друг друга,
+    а по сети не передаётся вся карта, размер которой растёт с максимальным id.
+    С кэшем в памяти процесса карта изменяется под блокировкой.
+    """
+
+    READY_BIT = 0
+    _lock = threading.Lock()
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.key = f"seen_set:{user_id}"
+        self.client = redis_client()
+        if self.client is not None:
+            self.redis_key = cache.make_and_validate_key(self.key)
+
+    def history_ids(self):
+        return (
+            UserAction.objects.filter(user_from_id=self.user_id)
+            .values_list("user_to_id", flat=True)
+            .iterator(chunk_size=5000)
+        )
+
+    def contains_many(self, user_ids):
+        """Для каждого id из user_ids — просмотрена ли анкета"""
+        if self.client is None:
+            with self._lock:
+                bitmap = cache.get(self.key)
+                if bitmap is None:
+                    bitmap = self._rebuild_bitmap()
+            return [self._get_bit(bitmap, user_id) for user_id in user_ids]
+
+        bits = self._read_bits(user_ids)
+        if not bits[0]:
+            self._rebuild_redis()
+            bits = self._read_bits(user_ids)
+        return [bool(bit) for bit in bits[1:]]
+
+    def __contains__(self, user_id):
+        return self.contains_many([user_id])[0]
+
+    def add(self, *user_ids):
+        """Отмечаем анкеты просмотренными"""
+        if self.client is None:
+            with self._lock:
+                bitmap = cache.get(self.key)
+                bitmap = bytearray(bitmap) if bitmap is not None else self._rebuild_bitmap()
+                for user_id in user_ids:
+                    self._set_bit(bitmap, user_id)
+                cache.set(self.key, bytes(bitmap), settings.SEEN_SET_TIMEOUT)
+            return
+
+        # Без бита READY_BIT карта при чтении будет собрана из истории поверх этих битов
+        pipeline = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.setbit(self.redis_key, user_id, 1)
+        pipeline.expire(self.redis_key, settings.SEEN_SET_TIMEOUT)
+        pipeline.execute()
+
+    def _read_bits(self, user_ids):
+        """Бит READY_BIT и биты user_ids одной командой BITFIELD"""
+        bitfield = self.client.bitfield(self.redis_key)
+        for offset in (self.READY_BIT, *user_ids):
+            bitfield.get("u1", offset)
+        return bitfield.execute()
+
+    def _rebuild_redis(self):
+        """Ставим биты из истории действий (поверх уже поставленных add) и бит READY_BIT"""
+        pipeline = self.client.pipeline(transaction=False)
+        for number, user_id in enumerate(self.history_ids(), start=1):
+            pipeline.setbit(self.redis_key, user_id, 1)
+            if number % 5000 == 0:
+                pipeline.execute()
+        pipeline.setbit(self.redis_key, self.READY_BIT, 1)
+        pipeline.expire(self.redis_key, settings.SEEN_SET_TIMEOUT)
+        pipeline.execute()
+
+    def _rebuild_bitmap(self):
+        """Собираем карту из истории действий пользователя и кладём в кэш"""
+        bitmap = bytearray()
+        self._set_bit(bitmap, self.READY_BIT)
+        for user_id in self.history_ids():
+            self._set_bit(bitmap, user_id)
+        cache.set(self.key, bytes(bitmap), settings.SEEN_SET_TIMEOUT)
+        return bitmap
+
+    @staticmethod
+    def _get_bit(bitmap, user_id):
+        index, bit = divmod(user_id, 8)
+        return index < len(bitmap) and bool(bitmap[index] & (1 << bit))
+
+    @staticmethod
+    def _set_bit(bitmap, user_id):
+        index, bit = divmod(user_id, 8)
+        if index >= len(bitmap):
+            bitmap.extend(bytes(index - len(bitmap) + 1))
+        bitmap[index] |= 1 << bit
+
+
+def mark_seen(user_id, *seen_user_ids):
+    """Дополняем SeenSet пользователя после фиксации транзакции с UserAction"""
+    transaction.on_commit(lambda: SeenSet(user_id).add(*seen_user_ids))
+
+
+def candidate_queryset(user, params):
+    """
+    Пул кандидатов для пользователя user с фильтрами из query_params:
+    gender, min_age, max_age, city, status. Исключаются сам пользователь
+    и приватные профили; просмотренные анкеты отсекает SeenSet.
+    ValueError, если min_age или max_age — не целое число
+    """
+    queryset = User.objects.filter(is_private=False).exclude(id=user.id)
+
+    gender = params.get("gender")
+    min_age = params.get("min_age")
+    max_age = params.get("max_age")
+    city = params.get("city")
+    status = params.get("status")
+
+    if gender:
+        queryset = queryset.filter(gender=gender)
+    if min_age:
+        queryset = queryset.filter(age__gte=int(min_age))
+    if max_age:
+        queryset = queryset.filter(age__lte=int(max_age))
+    if city:
+        # Точное совпадение, чтобы город входил в пул индекса (User.Meta.indexes)
+        queryset = queryset.filter(city=city.strip())
+    if status:
+        queryset = queryset.filter(status=status)
+
+    return queryset
+
+
+def exclude_seen(queryset, user):
+    """Точное исключение просмотренных анкет подзапросом к UserAction (запасной путь)"""
+    excluded_actions = UserAction.objects.filter(user_from=user).values_list(
+        "user_to_id", flat=True
+    )
+    return queryset.exclude(id__in=excluded_actions)
+
+
+def iter_candidate_batches(queryset, pivot, batch_size=CANDIDATE_BATCH_SIZE):
+    """Пачки по batch_size кандидатов по кругу random_key, начиная с точки pivot"""
+    for segment in (Q(random_key__gte=pivot), Q(random_key__lt=pivot)):
+        segment_queryset = queryset.filter(segment).order_by("random_key")
+        last_key = None
+        while True:
+            page = segment_queryset
+            if last_key is not None:
+                page = page.filter(random_key__gt=last_key)
+            batch = list(page[:batch_size])
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                break
+            last_key = batch[-1].random_key
+
+
+def sample_candidates(queryset, seen, count, pivot=None):
+    """
+    До count случайных непросмотренных анкет из пула по кругу random_key от точки pivot
+    (случайной, если не задана). Если среди первых MAX_SCANNED_CANDIDATES кандидатов
+    набрать count не удалось (почти исчерпанный пул), добираем остаток одним точным
+    запросом с исключением по истории действий.
+    """
+    if pivot is None:
+        pivot = random.random()
+    batch_size = max(CANDIDATE_BATCH_SIZE, count * 2)
+    candidates = []
+    scanned = 0
+    for batch in iter_candidate_batches(queryset, pivot, batch_size):
+        # Вся пачка проверяется по SeenSet за одно обращение к кэшу
+        is_seen = seen.contains_many([candidate.id for candidate in batch])
+        for candidate, candidate_seen in zip(batch, is_seen):
+            if not candidate_seen:
+                candidates.append(candidate)
+                if len(candidates) == count:
+                    return candidates
+        scanned += len(batch)
+        if scanned >= MAX_SCANNED_CANDIDATES + count:
+            break
+    else:
+        return candidates
+
+    remaining = exclude_seen(queryset, User(id=seen.user_id)).exclude(
+        id__in=[candidate.id for candidate in candidates]
+    )
+    for segment in (Q(random_key__gte=pivot), Q(random_key__lt=pivot)):
+        need = count - len(candidates)
+        if not need:
+            break
+        candidates.extend(remaining.filter(segment).order_by("random_key")[:need])
+    return candidates
+
+
+def sample_candidate(queryset, seen):
+    """Одна случайная непросмотренная анкета из пула или None"""
+    candidates = sample_candidates(queryset, seen, 1)
+    return candidates[0] if candidates else None
@@ -0,0 +1,257 @@
+"""
+Запись лайка одной транзакцией с минимумом запросов к БД.
+
+Обычный лайк (без мэтча) на PostgreSQL — три запроса:
+1. анкета второй стороны вместе с уже существующим мэтчем пары (и блокировкой пары);
+2. INSERT ... ON CONFLICT DO UPDATE лайка, который в RETURNING сразу сообщает о встречном лайке,
+   а вложенным INSERT (data-modifying CTE) добавляет строку входящих лайков без ответа
+   (PendingLike) второй стороны — если та ещё не ответила;
+3. атомарное увеличение likes_count и pending_likes_count одним UPDATE (только для нового лайка).
+В SQLite нет INSERT внутри WITH, поэтому строка PendingLike вставляется четвёртым запросом.
+Мэтч и комната чата (Match.chat_room) создаются только при взаимном лайке.
+Дизлайк (record_dislike) мэтчей не создаёт, а только расторгает существующий активный.
+
+Входящие лайки без ответа поддерживаются здесь же: ответный лайк или дизлайк убирает
+строку из входящих ответившего, дизлайк после лайка — из входящих второй стороны.
+Счётчик User.pending_likes_count меняется в тех же транзакциях; с нуля входящие
+пересобираются по UserAction (rebuild_pending_likes, команда rebuild_like_inbox).
+
+Одновременные встречные лайки пары сериализуются: на PostgreSQL — транзакционной
+advisory-блокировкой пары (pg_advisory_xact_lock), на SQLite — блокировкой записи БД,
+которую транзакция берёт при открытии (BEGIN IMMEDIATE, settings.DATABASES). Вторая транзакция видит лайк первой, поэтому мэтч
+и комната создаются ровно один раз.
+"""
+
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from chat.models import ChatRoom
+
+from .models import Match, PendingLike, User, UserAction
+from .pairs import ordered_pair
+
+
+def pairs_filter(pairs, from_field="user_from_id", to_field="user_to_id"):
+    """Q по списку пар (кто, кому) для выборки одним запросом"""
+    condition = Q()
+    for user_from_id, user_to_id in pairs:
+        condition |= Q(**{from_field: user_from_id, to_field: user_to_id})
+    return condition
+
+
+def update_pending_counts(counts, sign):
+    """Меняем pending_likes_count на ±прирост: один UPDATE на каждое значение прироста"""
+    users_by_amount = {}
+    for user_id, amount in counts.items():
+        users_by_amount.setdefault(amount, []).append(user_id)
+    for amount, user_ids in users_by_amount.items():
+        User.objects.filter(id__in=user_ids).update(
+            pending_likes_count=F("pending_likes_count") + sign * amount
+        )
+
+
+def add_pending_likes(pairs):
+    """Добавляем во входящие лайки пар (кто лайкнул, кому)"""
+    if not pairs:
+        return
+    PendingLike.objects.bulk_create(
+        [PendingLike(from_user_id=f, to_user_id=t) for f, t in pairs],
+        ignore_conflicts=True,
+    )
+    update_pending_counts(Counter(to_user_id for _, to_user_id in pairs), 1)
+
+
+def resolve_pending_likes(pairs):
+    """Убираем из входящих лайки пар (кому, от кого) — на них ответили или их отозвали"""
+    if not pairs:
+        return
+    rows = list(
+        PendingLike.objects.filter(pairs_filter(pairs, "to_user_id", "from_user_id"))
+        .values_list("id", "to_user_id")
+    )
+    if not rows:
+        return
+    PendingLike.objects.filter(id__in=[row_id for row_id, _ in rows]).delete()
+    update_pending_counts(Counter(to_user_id for _, to_user_id in rows), -1)
+
+
+def rebuild_pending_likes(chunk_size=5000):
+    """
+    Пересобираем входящие лайки без ответа и pending_likes_count по UserAction
+    одной транзакцией, лайки читаются keyset-проходом по id пачками по chunk_size.
+    Возвращает число входящих лайков
+    """
+    answered = UserAction.objects.filter(
+        user_from=OuterRef("user_to"),
+        user_to=OuterRef("user_from"),
+        action_type__in=["like", "dislike"],
+    )
+    pending = UserAction.objects.filter(action_type="like").exclude(Exists(answered))
+
+    total = 0
+    with transaction.atomic():
+        PendingLike.objects.all().delete()
+        last_id = 0
+        while True:
+            chunk = list(
+                pending.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "user_from_id", "user_to_id", "created_at")[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            PendingLike.objects.bulk_create(
+                [
+                    PendingLike(from_user_id=f, to_user_id=t, created_at=created_at)
+                    for _, f, t, created_at in chunk
+                ],
+                ignore_conflicts=True,
+            )
+            total += len(chunk)
+
+        counts = (
+            PendingLike.objects.filter(to_user=OuterRef("pk"))
+            .values("to_user")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        User.objects.update(pending_likes_count=Coalesce(Subquery(counts), 0))
+    return total
+
+
+def pair_lock_sql(user_a_id, user_b_id):
+    """
+    Выражение для SELECT, которое берёт транзакционную advisory-блокировку пары.
+    Вне PostgreSQL блокировку заменяет блокировка записи БД, выражение не нужно
+    """
+    if connection.vendor != "postgresql":
+        return None
+    return RawSQL(
+        "(SELECT 1 FROM pg_advisory_xact_lock(hashtextextended(%s, 0)))",
+        ["pair:%d:%d" % ordered_pair(user_a_id, user_b_id)],
+        output_field=IntegerField(),
+    )
+
+
+def upsert_like(user_from_id, user_to_id):
+    """
+    Ставим лайк: INSERT ... ON CONFLICT DO UPDATE одним запросом.
+    Возвращает (поставлен ли лайк, встречное действие второй стороны или None,
+    добавлен ли лайк во входящие второй стороны); лайк не ставится, если он уже стоял.
+    На PostgreSQL лайк без ответа (встречного лайка или дизлайка нет) тем же запросом
+    попадает в PendingLike — вложенным INSERT в WITH; в остальных СУБД это делает record_like
+    """
+    table = connection.ops.quote_name(UserAction._meta.db_table)
+    sql = f"""
+        INSERT INTO {table} (user_from_id, user_to_id, action_type, created_at)
+        VALUES (%s, %s, 'like', %s)
+        ON CONFLICT (user_from_id, user_to_id) DO UPDATE
+            SET action_type = excluded.action_type
+            WHERE {table}.action_type <> excluded.action_type
+        RETURNING user_from_id, user_to_id, created_at, (
+            SELECT reverse_action.action_type FROM {table} AS reverse_action
+            WHERE reverse_action.user_from_id = %s
+              AND reverse_action.user_to_id = %s
+        ) AS reverse_action_type
+    """
+    pending_in_query = connection.vendor == "postgresql"
+    if pending_in_query:
+        pending_table = connection.ops.quote_name(PendingLike._meta.db_table)
+        sql = f"""
+            WITH liked AS ({sql}),
+            pending AS (
+                INSERT INTO {pending_table} (from_user_id, to_user_id, created_at)
+                SELECT user_from_id, user_to_id, created_at FROM liked
+                WHERE reverse_action_type IS NULL
+                   OR reverse_action_type NOT IN ('like', 'dislike')
+                ON CONFLICT DO NOTHING
+            )
+            SELECT user_from_id, user_to_id, created_at, reverse_action_type FROM liked
+        """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql, [user_from_id, user_to_id, timezone.now(), user_to_id, user_from_id]
+        )
+        row = cursor.fetchone()
+    return (False, None, False) if row is None else (True, row[3], pending_in_query)
+
+
+@transaction.atomic
+def record_like(user, target_id):
+    """
+    Лайк пользователя user анкете target_id.
+    Возвращает (анкета, мэтч или None, комната чата — если мэтч создан этим лайком);
+    User.DoesNotExist, если анкеты нет
+    """
+    user1_id, user2_id = ordered_pair(user.id, target_id)
+    pair_match = Match.objects.pair(user1_id, user2_id)
+    annotations = {
+        "match_id": Subquery(pair_match.values("id")[:1]),
+        "match_is_active": Subquery(pair_match.values("is_active")[:1]),
+    }
+    lock = pair_lock_sql(user.id, target_id)
+    if lock is not None:
+        annotations["pair_lock"] = lock
+    target = User.objects.annotate(**annotations).get(id=target_id)
+
+    match = None
+    if target.match_id is not None:
+        match = Match(
+            id=target.match_id,
+            user1_id=user1_id,
+            user2_id=user2_id,
+            is_active=target.match_is_active,
+        )
+
+    liked, reverse_action, pending_saved = upsert_like(user.id, target.id)
+    if not liked:  # Лайк уже стоял: счётчики и мэтч не трогаем
+        return target, match, None
+
+    # Вторая сторона ещё не ответила (нет лайка и дизлайка) — лайк попадает в её входящие
+    # (на PostgreSQL — уже в upsert_like), а pending_likes_count растёт тем же UPDATE,
+    # что и likes_count
+    pending = reverse_action not in ("like", "dislike")
+    target.add_like(pending=pending)
+    if pending and not pending_saved:
+        PendingLike.objects.bulk_create(
+            [PendingLike(from_user=user, to_user=target)], ignore_conflicts=True
+        )
+    if reverse_action != "like":
+        return target, match, None
+
+    # Ответный лайк: строка второй стороны уходит из входящих пользователя
+    resolve_pending_likes([(user.id, target.id)])
+    if match is not None:
+        return target, match, None
+
+    # Мэтча у пары нет (запрос 1), а пара заблокирована — мэтч и комната создаются один раз
+    room = ChatRoom.objects.create(user1_id=user1_id, user2_id=user2_id)
+    match = Match.objects.create(user1_id=user1_id, user2_id=user2_id, chat_room=room)
+    return target, match, room
+
+
+@transaction.atomic
+def record_dislike(user, target_id):
+    """
+    Дизлайк пользователя user анкете target_id.
+    Возвращает (анкета, расторгнут ли мэтч); User.DoesNotExist, если анкеты нет
+    """
+    target = User.objects.get(id=target_id)
+    UserAction.objects.bulk_create(
+        [UserAction(user_from=user, user_to=target, action_type="dislike")],
+        update_conflicts=True,
+        unique_fields=["user_from", "user_to"],
+        update_fields=["action_type"],
+    )
+    # Ответ на входящий лайк второй стороны или отзыв собственного лайка
+    resolve_pending_likes([(user.id, target.id), (target.id, user.id)])
+    unmatched = (
+        Match.objects.pair(user, target).filter(is_active=True).update(is_active=False)
+    )
+    return target, bool(unmatched)
@@ -0,0 +1,270 @@
+"""
+Нагрузочная проверка взаимодействий пользователей (лайков).
+
+Режим counter: --threads потоков одновременно делают по --likes лайков одной временной
+анкете тремя способами — прежним likes_count += 1 и save(), атомарным User.add_like()
+(UPDATE ... SET likes_count = likes_count + 1) и через шарды LikeCounterShard с переносом
+fold(). Команда сравнивает итоговый likes_count с числом лайков: прежний способ теряет
+одновременные увеличения, остальные — нет. Временный пользователь удаляется.
+
+Режим match: --pairs пар временных пользователей одновременно лайкают друг друга
+(users/interactions.py record_like, по потоку на каждый лайк). Для каждой пары должны
+получиться ровно один мэтч и одна комната чата; команда выводит число SQL-запросов на лайк.
+На SQLite встречная транзакция может получить «database is locked» — её лайк повторяется,
+как повторил бы клиент. Временные пользователи удаляются.
+
+Режим queue: те же взаимные лайки --pairs пар (с предварительными просмотрами) идут через
+очередь SwipeEvent (users/swipes.py), затем их применяет воркер process_swipes в этом же
+процессе пачками по --batch-size. Команда сравнивает время записи лайков в очередь
+с синхронным record_like и проверяет мэтчи, комнаты и likes_count после обработки.
+
+    python manage.py benchmark_interactions --mode counter --threads 8 --likes 50
+    python manage.py benchmark_interactions --mode match --pairs 20
+    python manage.py benchmark_interactions --mode queue --pairs 200 --batch-size 100
+"""
+
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from chat.models import ChatRoom
+from users.interactions import record_like
+from users.models import LikeCounterShard, Match, SwipeEvent, User
+from users.swipes import enqueue_swipes, process_swipes
+
+
+class QueryCounter:
+    """Счётчик SQL-запросов для connection.execute_wrapper (без журнала запросов)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_threads(targets):
+    """Запускаем каждую функцию из targets в своём потоке одновременно, возвращаем время"""
+    barrier = threading.Barrier(len(targets))
+
+    def worker(target):
+        try:
+            barrier.wait()
+            target()
+        finally:
+            connection.close()  # У каждого потока своё соединение с БД
+
+    workers = [threading.Thread(target=worker, args=[target]) for target in targets]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Нагрузочная проверка взаимодействий пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode", choices=["counter", "match", "queue"], default="counter"
+        )
+        parser.add_argument(
+            "--threads", type=int, default=8, help="Число одновременных потоков"
+        )
+        parser.add_argument(
+            "--likes", type=int, default=50, help="Число лайков от каждого потока"
+        )
+        parser.add_argument(
+            "--shards", type=int, default=8, help="Число шардов счётчика в режиме counter"
+        )
+        parser.add_argument(
+            "--pairs", type=int, default=20, help="Число пар взаимных лайков (match, queue)"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Размер пачки воркера в режиме queue"
+        )
+
+    def handle(self, *args, **options):
+        getattr(self, f"run_{options['mode']}")(options)
+
+    def run_counter(self, options):
+        threads = options["threads"]
+        likes = options["likes"]
+        expected = threads * likes
+        target = User.objects.create_user(
+            email=f"benchmark-{uuid.uuid4().hex[:8]}@example.com",
+            first_name="Benchmark",
+            last_name="Likes",
+        )
+
+        def save_likes():
+            for _ in range(likes):  # Прежний InteractionViewSet.like
+                user = User.objects.get(id=target.id)
+                user.likes_count += 1
+                user.save()
+
+        def atomic_likes():
+            for _ in range(likes):
+                User.objects.get(id=target.id).add_like()
+
+        def fold():
+            return LikeCounterShard.fold()
+
+        variants = [
+            ("save()", save_likes, None),
+            ("F() UPDATE", atomic_likes, None),
+            (f"шарды ({options['shards']})", atomic_likes, fold),
+        ]
+        shards, threshold = settings.LIKES_COUNTER_SHARDS, settings.LIKES_COUNTER_SHARD_THRESHOLD
+        lost = {}
+        try:
+            for name, like, after in variants:
+                User.objects.filter(id=target.id).update(likes_count=0)
+                settings.LIKES_COUNTER_SHARDS = options["shards"] if after else 0
+                settings.LIKES_COUNTER_SHARD_THRESHOLD = 0
+                elapsed = run_threads([like] * threads)
+                if after:
+                    after()
+                counted = User.objects.get(id=target.id).likes_count
+                lost[name] = expected - counted
+                self.stdout.write(
+                    f"{name:<14} {expected / elapsed:8.0f} лайков/с, "
+                    f"учтено {counted}/{expected}, потеряно {expected - counted}"
+                )
+        finally:
+            settings.LIKES_COUNTER_SHARDS = shards
+            settings.LIKES_COUNTER_SHARD_THRESHOLD = threshold
+            target.delete()
+
+        if any(count for name, count in lost.items() if name != "save()"):
+            raise CommandError("Атомарный счётчик потерял лайки")
+        self.stdout.write(self.style.SUCCESS("Атомарные счётчики не теряют лайков"))
+
+    def run_match(self, options):
+        users, pairs = self.create_pairs(options["pairs"])
+        lock = threading.Lock()
+        stats = {"likes": 0, "queries": 0, "retries": 0}
+
+        def like(user, target):
+            def run():
+                while True:
+                    counter = QueryCounter()  # Запросы только успешной попытки
+                    with connection.execute_wrapper(counter):
+                        try:
+                            record_like(user, target.id)
+                        except OperationalError:  # SQLite: БД заблокирована встречной записью
+                            with lock:
+                                stats["retries"] += 1
+                            time.sleep(0.01)
+                            continue
+                    with lock:
+                        stats["likes"] += 1
+                        stats["queries"] += counter.count
+                    return
+
+            return run
+
+        try:
+            targets = []
+            for user_a, user_b in pairs:
+                targets += [like(user_a, user_b), like(user_b, user_a)]
+            elapsed = run_threads(targets)
+
+            failures = self.check_pairs(pairs)
+            self.stdout.write(
+                f"{stats['likes']} лайков от {len(pairs)} пар за {elapsed:.2f} с, "
+                f"{stats['queries'] / stats['likes']:.2f} запросов на лайк "
+                f"(с повторами после блокировки: {stats['retries']})"
+            )
+        finally:
+            for user in users:
+                user.delete()
+
+        if failures:
+            raise CommandError(f"У {failures} пар не ровно один мэтч и одна комната")
+        self.stdout.write(self.style.SUCCESS("У каждой пары ровно один мэтч и одна комната"))
+
+    def create_pairs(self, pairs):
+        """Временные пользователи, разбитые на пары"""
+        suffix = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(
+                email=f"benchmark-{suffix}-{number}@example.com",
+                first_name="Benchmark",
+                last_name=str(number),
+            )
+            for number in range(pairs * 2)
+        ]
+        return users, list(zip(users[::2], users[1::2]))
+
+    def check_pairs(self, pairs):
+        """Число пар, у которых не ровно один мэтч и одна комната"""
+        failures = 0
+        for user_a, user_b in pairs:
+            if (
+                Match.objects.pair(user_a, user_b).count() != 1
+                or ChatRoom.objects.pair(user_a, user_b).count() != 1
+            ):
+                failures += 1
+        return failures
+
+    def run_queue(self, options):
+        users, pairs = self.create_pairs(options["pairs"])
+        sync_users, sync_pairs = self.create_pairs(options["pairs"])
+        likes = len(pairs) * 2
+        try:
+            started = time.perf_counter()
+            for user_a, user_b in sync_pairs:
+                record_like(user_a, user_b.id)
+                record_like(user_b, user_a.id)
+            sync_elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for user_a, user_b in pairs:
+                enqueue_swipes(user_a, [user_b.id], "view")
+                enqueue_swipes(user_b, [user_a.id], "view")
+                enqueue_swipes(user_a, [user_b.id], "like")
+                enqueue_swipes(user_b, [user_a.id], "like")
+            enqueue_elapsed = time.perf_counter() - started
+
+            counter = QueryCounter()
+            batches = 0
+            started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                while process_swipes(options["batch_size"]):
+                    batches += 1
+            process_elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f"синхронно (record_like)  {likes / sync_elapsed:8.0f} лайков/с\n"
+                f"в очередь (SwipeEvent)   {likes / enqueue_elapsed:8.0f} лайков/с\n"
+                f"воркер: {likes * 2} событий за {process_elapsed:.2f} с, "
+                f"{batches} пачек, {counter.count / batches:.1f} запросов на пачку"
+            )
+
+            failures = self.check_pairs(pairs)
+            wrong_counts = User.objects.filter(
+                id__in=[user.id for user in users]
+            ).exclude(likes_count=1).count()
+            leftover = SwipeEvent.objects.filter(
+                user_from__in=[user.id for user in users]
+            ).count()
+        finally:
+            for user in users + sync_users:
+                user.delete()
+
+        if failures or wrong_counts or leftover:
+            raise CommandError(
+                f"Пар без мэтча и комнаты: {failures}, неверных likes_count: {wrong_counts}, "
+                f"необработанных событий: {leftover}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS("Очередь применена: у каждой пары один мэтч и одна комната")
+        )
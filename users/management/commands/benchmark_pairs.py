@@ -0,0 +1,126 @@
+"""
+Нагрузочная проверка выборок «мои мэтчи» и «мои чаты» (users/pairs.py).
+
+Команда создаёт --users временных пользователей и --pairs случайных пар, для каждой —
+мэтч и комнату чата (в каноническом порядке user1_id < user2_id), затем для --samples
+случайных пользователей меряет медианное время первой страницы активных мэтчей и комнат
+двумя способами: user1 = u OR user2 = u и PairQuerySet.for_user (UNION двух индексных
+выборок), и выводит план UNION-запроса. Все данные создаются в транзакции и откатываются.
+
+Запуск с растущим --pairs показывает, что время for_user не растёт с размером таблиц:
+
+    python manage.py benchmark_pairs --users 100000 --pairs 1000000
+    python manage.py benchmark_pairs --users 1000 --pairs 20000   # SQLite
+"""
+
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from chat.models import ChatRoom
+from users.models import Match, User
+from users.pairs import ordered_pair
+
+PAGE_SIZE = 20
+CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Время выборок «мои мэтчи» и «мои чаты» на сгенерированном объёме пар"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000, help="Число временных пользователей"
+        )
+        parser.add_argument(
+            "--pairs", type=int, default=20000, help="Число пар (мэтч + комната)"
+        )
+        parser.add_argument(
+            "--samples", type=int, default=50, help="Число пользователей для замеров"
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_ids = self.create_users(options["users"])
+            started = time.perf_counter()
+            created = self.create_pairs(user_ids, options["pairs"])
+            self.stdout.write(
+                f"Создано пар: {created} за {time.perf_counter() - started:.1f} с"
+            )
+            self.measure(random.sample(user_ids, min(options["samples"], len(user_ids))))
+            transaction.set_rollback(True)  # Данные проверки в БД не оставляем
+
+    def create_users(self, count):
+        suffix = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create(
+            [
+                User(
+                    email=f"benchmark-{suffix}-{number}@example.com",
+                    first_name="Benchmark",
+                    last_name=str(number),
+                    password="!",  # Вход без пароля невозможен
+                )
+                for number in range(count)
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+        return [user.id for user in users]
+
+    def create_pairs(self, user_ids, count):
+        pairs = set()
+        while len(pairs) < count:
+            user_a, user_b = random.sample(user_ids, 2)
+            pairs.add(ordered_pair(user_a, user_b))
+        pairs = list(pairs)
+        for start in range(0, len(pairs), CHUNK_SIZE):
+            chunk = pairs[start : start + CHUNK_SIZE]
+            rooms = ChatRoom.objects.bulk_create(
+                [ChatRoom(user1_id=user1_id, user2_id=user2_id) for user1_id, user2_id in chunk]
+            )
+            Match.objects.bulk_create(
+                [
+                    Match(user1_id=user1_id, user2_id=user2_id, chat_room=room)
+                    for (user1_id, user2_id), room in zip(chunk, rooms)
+                ]
+            )
+        return len(pairs)
+
+    def measure(self, sample_ids):
+        paths = {
+            "мэтчи, OR": lambda user_id: Match.objects.filter(
+                Q(user1_id=user_id) | Q(user2_id=user_id), is_active=True
+            ),
+            "мэтчи, UNION": lambda user_id: Match.objects.for_user(
+                user_id, is_active=True
+            ),
+            "чаты, OR": lambda user_id: ChatRoom.objects.filter(
+                Q(user1_id=user_id) | Q(user2_id=user_id), is_active=True
+            ),
+            "чаты, UNION": lambda user_id: ChatRoom.objects.for_user(
+                user_id, is_active=True
+            ),
+        }
+        for name, queryset in paths.items():
+            timings = []
+            for user_id in sample_ids:
+                page = queryset(user_id).order_by("-created_at").values_list("id", flat=True)
+                started = time.perf_counter()
+                list(page[:PAGE_SIZE])
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{name:<14} медиана {statistics.median(timings):7.2f} мс, "
+                f"максимум {max(timings):7.2f} мс"
+            )
+
+        plan = (
+            paths["мэтчи, UNION"](sample_ids[0])
+            .order_by("-created_at")
+            .values_list("id", flat=True)[:PAGE_SIZE]
+            .explain()
+        )
+        self.stdout.write(f"План «мои мэтчи»:\n{plan}")
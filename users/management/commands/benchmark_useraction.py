@@ -0,0 +1,150 @@
+"""
+Нагрузочная проверка хранения действий пользователей (users_useraction).
+
+Команда создаёт --users временных пользователей и --actions случайных действий между ними
+(на PostgreSQL — одним INSERT ... SELECT FROM generate_series, иначе bulk_create пачками),
+затем меряет медианное время первой страницы каждого пути доступа HistoryViewSet
+и встречного лайка для --samples случайных пользователей и выводит план запроса
+«кто лайкнул меня». Все данные создаются в транзакции и откатываются.
+
+Десятки миллионов действий имеет смысл генерировать только на PostgreSQL;
+сравнение с секционированной таблицей — после partition_useraction на копии БД:
+
+    python manage.py benchmark_useraction --users 100000 --actions 20000000
+    python manage.py benchmark_useraction --users 1000 --actions 100000   # SQLite
+"""
+
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import User, UserAction
+
+PAGE_SIZE = 20
+CHUNK_SIZE = 5000
+ACTION_TYPES = ["view", "like", "dislike"]
+
+
+class Command(BaseCommand):
+    help = "Время запросов истории действий на сгенерированном объёме users_useraction"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000, help="Число временных пользователей"
+        )
+        parser.add_argument(
+            "--actions", type=int, default=100000, help="Число сгенерированных действий"
+        )
+        parser.add_argument(
+            "--samples", type=int, default=50, help="Число пользователей для замеров"
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_ids = self.create_users(options["users"])
+            started = time.perf_counter()
+            self.create_actions(user_ids, options["actions"])
+            self.stdout.write(
+                f"Сгенерировано действий: {options['actions']} "
+                f"за {time.perf_counter() - started:.1f} с"
+            )
+            self.measure(random.sample(user_ids, min(options["samples"], len(user_ids))))
+            transaction.set_rollback(True)  # Данные проверки в БД не оставляем
+
+    def create_users(self, count):
+        suffix = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create(
+            [
+                User(
+                    email=f"benchmark-{suffix}-{number}@example.com",
+                    first_name="Benchmark",
+                    last_name=str(number),
+                    password="!",  # Вход без пароля невозможен
+                )
+                for number in range(count)
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+        return [user.id for user in users]
+
+    def create_actions(self, user_ids, count):
+        if connection.vendor == "postgresql":
+            # Случайные пары из диапазона id временных пользователей, дубли пар отбрасываются
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO users_useraction (user_from_id, user_to_id, action_type, created_at)
+                    SELECT
+                        %(low)s + floor(random() * %(span)s)::bigint,
+                        %(low)s + floor(random() * %(span)s)::bigint,
+                        (ARRAY['view', 'like', 'dislike'])[1 + floor(random() * 3)::int],
+                        now() - random() * interval '365 days'
+                    FROM generate_series(1, %(count)s)
+                    ON CONFLICT (user_from_id, user_to_id) DO NOTHING
+                    """,
+                    {"low": min(user_ids), "span": len(user_ids), "count": count},
+                )
+            return
+
+        now = timezone.now()
+        for start in range(0, count, CHUNK_SIZE):
+            UserAction.objects.bulk_create(
+                [
+                    UserAction(
+                        user_from_id=random.choice(user_ids),
+                        user_to_id=random.choice(user_ids),
+                        action_type=random.choice(ACTION_TYPES),
+                        created_at=now - timedelta(seconds=random.randrange(365 * 24 * 3600)),
+                    )
+                    for _ in range(min(CHUNK_SIZE, count - start))
+                ],
+                ignore_conflicts=True,
+            )
+
+    def measure(self, sample_ids):
+        paths = {
+            "кто лайкнул меня": lambda user_id: UserAction.objects.filter(
+                user_to_id=user_id, action_type="like"
+            ),
+            "мои лайки": lambda user_id: UserAction.objects.filter(
+                user_from_id=user_id, action_type="like"
+            ),
+            "мои дизлайки": lambda user_id: UserAction.objects.filter(
+                user_from_id=user_id, action_type="dislike"
+            ),
+            "мои просмотры": lambda user_id: UserAction.objects.filter(
+                user_from_id=user_id, action_type="view"
+            ),
+            "встречный лайк": lambda user_id: UserAction.objects.filter(
+                user_from_id=user_id, user_to_id=sample_ids[0], action_type="like"
+            ),
+        }
+        for name, queryset in paths.items():
+            timings = []
+            for user_id in sample_ids:
+                page = (
+                    queryset(user_id)
+                    .order_by("-created_at", "-id")
+                    .values_list("id", flat=True)
+                )
+                started = time.perf_counter()
+                list(page[:PAGE_SIZE])
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{name:<18} медиана {statistics.median(timings):7.2f} мс, "
+                f"максимум {max(timings):7.2f} мс"
+            )
+
+        plan = (
+            paths["кто лайкнул меня"](sample_ids[0])
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)[:PAGE_SIZE]
+            .explain()
+        )
+        self.stdout.write(f"План «кто лайкнул меня»:\n{plan}")
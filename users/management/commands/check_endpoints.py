@@ -0,0 +1,204 @@
+"""
+Регрессионная проверка API-эндпойнтов роутера users/urls.py по числу SQL-запросов и времени ответа.
+
+Каждый эндпойнт вызывается через DRF APIClient от имени пользователя с наибольшим числом
+мэтчей (или --email), число запросов считается CaptureQueriesContext, время — по медиане
+из --repeat прогонов. Все изменения в БД (просмотры, лайки, сообщения) откатываются.
+Ответ должен иметь ожидаемый статус (ENDPOINT_STATUSES, по умолчанию 200): ошибка
+или 404 на пустых данных — тоже провал. При провале хотя бы одного эндпойнта команда
+завершается с кодом 1.
+
+Это ручная проверка на заполненной БД (например, после make mock-data): точное число
+запросов на тестовой БД проверяет EndpointQueryTests в users/tests.py (make test).
+
+    python manage.py check_endpoints                 # проверка на текущих данных
+"""
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from chat.models import ChatRoom
+from users.models import User, UserAction
+
+# Бюджеты эндпойнтов: имя маршрута (с параметрами запроса после "?") ->
+# (макс. число SQL-запросов, макс. время ответа в мс).
+# Бюджет по запросам не должен зависеть от числа строк на странице — иначе это N+1.
+ENDPOINT_BUDGETS = {
+    "user-list": (3, 500),
+    "user-profile": (2, 200),
+    "user-detail": (2, 200),
+    "photo-list": (2, 200),
+    "interaction-random-profile": (10, 300),
+    "interaction-feed": (12, 500),
+    # Обычный лайк: 3 запроса users/interactions.py на PostgreSQL (4 на SQLite)
+    # + SAVEPOINT/RELEASE транзакции record_like
+    "interaction-like": (6, 300),
+    "interaction-dislike": (8, 300),  # проверяется отзыв лайка: + удаление из входящих
+    "history-received-likes": (2, 500),
+    "history-received-likes?view=summary": (1, 500),
+    "history-inbox": (2, 500),
+    "history-inbox?view=summary": (2, 500),
+    "history-inbox-count": (0, 100),
+    "history-likes": (2, 500),
+    "history-dislikes": (2, 500),
+    "history-views": (2, 500),
+    "match-list": (4, 500),
+    "match-online": (2, 200),
+    "invitation-list": (4, 500),
+    "contactexchange-list": (2, 200),
+    "chatroom-list": (6, 500),
+    "chatroom-messages": (5, 500),
+    "chatroom-send-message": (10, 300),
+}
+
+# Ожидаемый статус ответа, если не 200
+ENDPOINT_STATUSES = {
+    "chatroom-send-message": 201,
+}
+
+
+class Command(BaseCommand):
+    help = "Проверка числа SQL-запросов и времени ответа API-эндпойнтов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--email",
+            help="Email пользователя для запросов (по умолчанию — с наибольшим числом мэтчей)",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=3, help="Число прогонов каждого эндпойнта"
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["email"])
+        admin = User.objects.filter(is_staff=True).first()  # Список пользователей — IsAdminUser
+        self.stdout.write(f"Проверка эндпойнтов от имени {user.email}")
+
+        setup_test_environment()  # Разрешаем хост testserver для APIClient
+        try:
+            with transaction.atomic():
+                failures = self.check_endpoints(user, admin, options["repeat"])
+                transaction.set_rollback(True)  # Данные проверки в БД не оставляем
+        finally:
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError(
+                f"Не прошли проверку {len(failures)} эндпойнтов: {', '.join(failures)}"
+            )
+        self.stdout.write(self.style.SUCCESS("Все эндпойнты уложились в бюджет"))
+
+    def get_user(self, email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {email} не найден")
+        user = (
+            User.objects.annotate(
+                matches_count=Count("matches_as_user1", distinct=True)
+                + Count("matches_as_user2", distinct=True)
+            )
+            .order_by("-matches_count", "id")
+            .first()
+        )
+        if user is None:
+            raise CommandError("В БД нет пользователей, заполните её командой generate_mock_data")
+        return user
+
+    def get_requests(self, user, admin):
+        """Список (имя маршрута, метод, аргументы url, пользователь) для проверки"""
+        requests = [
+            ("user-profile", "get", [], user),
+            ("user-detail", "get", [user.id], user),
+            ("photo-list", "get", [], user),
+            ("interaction-random-profile", "get", [], user),
+            ("interaction-feed", "get", [], user),
+            ("history-received-likes", "get", [], user),
+            ("history-received-likes?view=summary", "get", [], user),
+            ("history-inbox", "get", [], user),
+            ("history-inbox?view=summary", "get", [], user),
+            ("history-inbox-count", "get", [], user),
+            ("history-likes", "get", [], user),
+            ("history-dislikes", "get", [], user),
+            ("history-views", "get", [], user),
+            ("match-list", "get", [], user),
+            ("match-online", "get", [], user),
+            ("invitation-list", "get", [], user),
+            ("contactexchange-list", "get", [], user),
+            ("chatroom-list", "get", [], user),
+        ]
+        if admin:
+            requests.append(("user-list", "get", [], admin))
+
+        # Цель для лайка/дизлайка — пользователь, с которым ещё не было действий
+        target = (
+            User.objects.exclude(id=user.id)
+            .exclude(
+                id__in=UserAction.objects.filter(user_from=user).values("user_to_id")
+            )
+            .first()
+        )
+        if target:
+            requests.append(("interaction-like", "post", [target.id], user))
+            requests.append(("interaction-dislike", "post", [target.id], user))
+
+        room = ChatRoom.objects.for_user(user, is_active=True).first()
+        if room:
+            requests.append(("chatroom-messages", "get", [room.id], user))
+            requests.append(("chatroom-send-message", "post", [room.id], user))
+        return requests
+
+    def check_endpoints(self, user, admin, repeat):
+        client = APIClient()
+        failures = []
+        requests = self.get_requests(user, admin)
+        checked = {name for name, *_ in requests}
+        for name in sorted(ENDPOINT_BUDGETS.keys() - checked):
+            # Нет данных для вызова (анкеты для лайка, комнаты чата) — это тоже провал
+            self.stdout.write(self.style.ERROR(f"{name:<36} не проверен: нет данных"))
+            failures.append(name)
+
+        for name, method, url_args, request_user in requests:
+            route, _, query = name.partition("?")
+            url = reverse(route, args=url_args) + (f"?{query}" if query else "")
+            client.force_authenticate(request_user)
+            max_queries, max_ms = ENDPOINT_BUDGETS[name]
+            queries = []
+            timings = []
+            for _ in range(repeat):
+                data = {"message": "check_endpoints"} if method == "post" else None
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(url, data, format="json")
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(context.captured_queries))
+
+            query_count = max(queries)
+            elapsed_ms = statistics.median(timings)
+            ok = (
+                response.status_code == ENDPOINT_STATUSES.get(name, 200)
+                and query_count <= max_queries
+                and elapsed_ms <= max_ms
+            )
+            line = (
+                f"{name:<36} {method.upper():<5} {response.status_code}  "
+                f"запросов {query_count:>3}/{max_queries:<3}  {elapsed_ms:7.1f}/{max_ms} мс"
+            )
+            if ok:
+                self.stdout.write(line)
+            else:
+                self.stdout.write(self.style.ERROR(line))
+                failures.append(name)
+        return failures
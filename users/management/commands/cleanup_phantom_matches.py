@@ -0,0 +1,79 @@
+"""
+Удаление фантомных мэтчей, которые прежний InteractionViewSet.dislike создавал
+через Match.objects.get_or_create для пар, которые никогда не совпадали.
+
+Фантомный мэтч — запись Match, для пары которой нет комнаты чата (настоящий мэтч
+создаётся вместе с комнатой) и нет взаимных лайков. Мэтчи пар с взаимными лайками
+не удаляются, даже если комнаты нет.
+
+Таблица просматривается keyset-проходом по id пачками по --chunk-size записей, каждая
+пачка удаляется отдельным запросом в своей транзакции — долгих блокировок на большой
+таблице нет, команду можно прервать и запустить повторно.
+
+    python manage.py cleanup_phantom_matches --dry-run
+    python manage.py cleanup_phantom_matches --chunk-size 5000
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from chat.models import ChatRoom
+from users.models import Match, UserAction
+
+
+class Command(BaseCommand):
+    help = "Удаление мэтчей, созданных дизлайками для пар без взаимного лайка"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000, help="Размер пачки мэтчей"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Только посчитать, ничего не удалять"
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        room = ChatRoom.objects.filter(
+            Q(user1=OuterRef("user1"), user2=OuterRef("user2"))
+            | Q(user1=OuterRef("user2"), user2=OuterRef("user1"))
+        )
+        like_1_to_2 = UserAction.objects.filter(
+            user_from=OuterRef("user1"), user_to=OuterRef("user2"), action_type="like"
+        )
+        like_2_to_1 = UserAction.objects.filter(
+            user_from=OuterRef("user2"), user_to=OuterRef("user1"), action_type="like"
+        )
+        phantoms = Match.objects.exclude(Exists(room)).exclude(
+            Exists(like_1_to_2) & Exists(like_2_to_1)
+        )
+
+        last_id = 0
+        scanned = deleted = 0
+        while True:
+            chunk = list(
+                Match.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            scanned += len(chunk)
+
+            phantom_ids = list(
+                phantoms.filter(id__in=chunk).values_list("id", flat=True)
+            )
+            if phantom_ids and not options["dry_run"]:
+                with transaction.atomic():
+                    Match.objects.filter(id__in=phantom_ids).delete()
+            deleted += len(phantom_ids)
+            self.stdout.write(
+                f"Просмотрено {scanned}, фантомных мэтчей {deleted} (id до {last_id})"
+            )
+
+        verb = "Найдено" if options["dry_run"] else "Удалено"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} фантомных мэтчей: {deleted} из {scanned}")
+        )
@@ -0,0 +1,21 @@
+"""
+Перенос лайков, накопленных в шардах LikeCounterShard, в User.likes_count.
+
+Шарды используются при LIKES_COUNTER_SHARDS > 0 для анкет, у которых уже не меньше
+LIKES_COUNTER_SHARD_THRESHOLD лайков. Команду запускают периодически (cron, раз в минуту):
+до переноса likes_count популярной анкеты отстаёт на число лайков в шардах.
+
+    python manage.py fold_like_counters
+"""
+
+from django.core.management.base import BaseCommand
+
+from users.models import LikeCounterShard
+
+
+class Command(BaseCommand):
+    help = "Перенос лайков из шардов счётчика в User.likes_count"
+
+    def handle(self, *args, **options):
+        folded = LikeCounterShard.fold()
+        self.stdout.write(self.style.SUCCESS(f"Перенесено лайков: {folded}"))
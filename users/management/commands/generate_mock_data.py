@@ -19,20 +19,23 @@ import os
 import uuid                                             # Для генерации уник.идентификат. для фото
 
 
-# Очистка таблиц, включая связанные, и сброс последовательностей первичного ключа
-with connection.cursor() as cursor:
-    stdout.write(f"Очистка таблиц{'\n'}")
-    tables = [
-        "users_user",
-        "users_userphoto",
-        "socialaccount_socialaccount",
-        #   "token_blacklist_blacklistedtoken",
-        #   "token_blacklist_outstandingtoken"
-    ]
-    for table in tables:
-        cursor.execute(f"TRUNCATE TABLE {table} CASCADE")
-        cursor.execute(f"ALTER SEQUENCE {table}_id_seq RESTART WITH 1")
-stdout.write(f"таблицы {tables} очищены{'\n'}")
+# Очистка таблиц, включая связанные, и сброс последовательностей первичного ключа.
+# Вызывается из handle(), а не при импорте модуля: иначе таблицы очищались бы
+# при любой загрузке команды (например, call_command из check_endpoints или --help)
+def clear_tables():
+    with connection.cursor() as cursor:
+        stdout.write(f"Очистка таблиц{'\n'}")
+        tables = [
+            "users_user",
+            "users_userphoto",
+            "socialaccount_socialaccount",
+            #   "token_blacklist_blacklistedtoken",
+            #   "token_blacklist_outstandingtoken"
+        ]
+        for table in tables:
+            cursor.execute(f"TRUNCATE TABLE {table} CASCADE")
+            cursor.execute(f"ALTER SEQUENCE {table}_id_seq RESTART WITH 1")
+    stdout.write(f"таблицы {tables} очищены{'\n'}")
 
 
 # сброс последовательностей первичного ключа в таблицах указанных django-приложений
@@ -46,22 +49,21 @@ def reset_id_sec():
     return stdout.write(f"Первичные ключи в приложениях {apps} сброшены{'\n'}")
 
 
-reset_id_sec()
-
 # Создаём иконку приложения
-stdout.write("Создаём иконку приложения...\n")
-favicon_ico = os.path.join(settings.BASE_DIR, "static", "favicon.ico")
-favicon_jpg = os.path.join(settings.BASE_DIR, "static", "favicon.jpg")
-if not os.path.exists(favicon_ico):
-    try:
-        img = Image.open(favicon_jpg)
-        img = img.resize((64, 64), Image.Resampling.LANCZOS)
-        img.save(favicon_ico, format="ICO", sizes=[(64, 64), (32, 32), (16, 16)])
-        stdout.write("favicon.ico успешно создан\n")
-    except Exception as e:
-        stdout.write(f"Ошибка при создании favicon: {e}\n")
-else:
-    stdout.write("favicon.ico уже существует\n")
+def create_favicon():
+    stdout.write("Создаём иконку приложения...\n")
+    favicon_ico = os.path.join(settings.BASE_DIR, "static", "favicon.ico")
+    favicon_jpg = os.path.join(settings.BASE_DIR, "static", "favicon.jpg")
+    if not os.path.exists(favicon_ico):
+        try:
+            img = Image.open(favicon_jpg)
+            img = img.resize((64, 64), Image.Resampling.LANCZOS)
+            img.save(favicon_ico, format="ICO", sizes=[(64, 64), (32, 32), (16, 16)])
+            stdout.write("favicon.ico успешно создан\n")
+        except Exception as e:
+            stdout.write(f"Ошибка при создании favicon: {e}\n")
+    else:
+        stdout.write("favicon.ico уже существует\n")
 
 
 class Command(BaseCommand):
@@ -79,6 +81,10 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        clear_tables()
+        reset_id_sec()
+        create_favicon()
+
         """Создание или получение суперпользователя с id=1, ORM методом create_superuser"""
         self.stdout.write("Создание или получение суперпользователя admin@admin.ru")
 
@@ -223,6 +229,8 @@ class Command(BaseCommand):
                     True,  # is_active
                     False,  # is_private
                     0,  # likes_count
+                    0,  # pending_likes_count
+                    random.random(),  # random_key для случайной выборки анкет
                 )
             )
 
@@ -253,7 +261,9 @@ class Command(BaseCommand):
                 is_superuser,
                 is_active,
                 is_private,
-                likes_count
+                likes_count,
+                pending_likes_count,
+                random_key
                 )
                 VALUES %s
                 RETURNING id
@@ -300,7 +310,8 @@ class Command(BaseCommand):
                 # created_at = f"{timezone.now()}"
 
                 """Пополняем список кортежей с данными фото пользователей"""
-                photos.append((user_id, filename, is_main, created_at))
+                # Копии фото (renditions) не создаём — их досоздаёт generate_photo_renditions
+                photos.append((user_id, filename, is_main, created_at, "{}"))
         with connection.cursor() as cursor:
             # Используем 1 SQL запрос для пакетного создания пользователей со значениями полей из списка кортежей users
             # с помощью параметризованного запроса VALUES %s, который принимает список кортежей users
@@ -313,7 +324,8 @@ class Command(BaseCommand):
                 user_id,
                 image,
                 is_main,
-                created_at
+                created_at,
+                renditions
                 )
                 VALUES %s
                 RETURNING id
@@ -340,6 +352,9 @@ class Command(BaseCommand):
             user2 = random.choice(all_users)
 
             if user1 != user2:
+                if user1.id > user2.id:  # Пара в каноническом порядке, как в Match.save()
+                    user1, user2 = user2, user1
+
                 # Создаем взаимные лайки
                 UserAction.objects.get_or_create(
                     user_from=user1, user_to=user2, action_type="like"
@@ -353,5 +368,7 @@ class Command(BaseCommand):
                 match, created = Match.objects.get_or_create(user1=user1, user2=user2)
 
                 if created:
-                    # Создаем чат комнату
-                    ChatRoom.objects.get_or_create(user1=user1, user2=user2)
+                    # Создаем чат комнату и связываем её с мэтчем
+                    room, _ = ChatRoom.objects.get_or_create(user1=user1, user2=user2)
+                    match.chat_room = room
+                    match.save(update_fields=["chat_room"])
@@ -0,0 +1,53 @@
+"""
+Создание уменьшенных копий (users/renditions.py) для фото, у которых их ещё нет:
+загруженных до появления версий или после смены PHOTO_RENDITION_WIDTHS/FORMATS (--force).
+
+Фото перебираются keyset-проходом по id пачками по --chunk-size; фото, файл которого
+не удалось прочитать, пропускается и попадает в счётчик ошибок. Команду можно прервать
+и запустить повторно.
+
+    python manage.py generate_photo_renditions
+    python manage.py generate_photo_renditions --force
+"""
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from users.models import UserPhoto
+
+
+class Command(BaseCommand):
+    help = "Создание уменьшенных копий фото пользователей в форматах AVIF/WebP"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=100, help="Размер пачки фото"
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Пересоздать копии у всех фото"
+        )
+
+    def handle(self, *args, **options):
+        photos = UserPhoto.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["force"]:
+            photos = photos.filter(renditions={})
+
+        last_id = 0
+        done = failed = 0
+        while True:
+            chunk = list(photos.filter(id__gt=last_id).order_by("id")[: options["chunk_size"]])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            for photo in chunk:
+                try:
+                    photo.update_renditions()
+                    done += 1
+                except ValidationError as error:
+                    failed += 1
+                    self.stderr.write(f"Фото {photo.id}: {error.messages[0]}")
+            self.stdout.write(f"Обработано фото: {done}, ошибок: {failed} (id до {last_id})")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Созданы копии для {done} фото, ошибок: {failed}")
+        )
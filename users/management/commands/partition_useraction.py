@@ -0,0 +1,49 @@
+"""
+Секционирование users_useraction на hash-секции по user_from_id (PostgreSQL, users/partitioning.py)
+для БД, где миграция users 0007 прошла до того, как стала секционировать таблицу
+(16 секций на PostgreSQL).
+
+    python manage.py partition_useraction --partitions 16 --dry-run   # только вывести SQL
+    python manage.py partition_useraction --partitions 16
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from users.partitioning import is_partitioned, partition_statements, partition_useraction
+
+
+class Command(BaseCommand):
+    help = "Секционирование таблицы действий пользователей (PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=16,
+            help="Число hash-секций",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Вывести SQL, ничего не выполняя"
+        )
+
+    def handle(self, *args, **options):
+        partitions = options["partitions"]
+        if partitions < 2:
+            raise CommandError("Нужно не меньше 2 секций")
+        if options["dry_run"]:
+            for statement in partition_statements(partitions):
+                self.stdout.write(f"{statement};")
+            return
+        if connection.vendor != "postgresql":
+            raise CommandError("Секционирование поддерживается только на PostgreSQL")
+        if is_partitioned():
+            raise CommandError("Таблица users_useraction уже секционирована")
+
+        with transaction.atomic():
+            statements = partition_useraction(partitions)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"users_useraction разбита на {partitions} секций ({len(statements)} запросов)"
+            )
+        )
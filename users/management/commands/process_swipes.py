@@ -0,0 +1,57 @@
+"""
+Воркер очереди свайпов (SWIPE_QUEUE, users/swipes.py): применяет события SwipeEvent
+пачками по --batch-size к UserAction, User.likes_count, Match и ChatRoom.
+
+Работает, пока его не остановят; при пустой очереди ждёт --interval секунд.
+С --once обрабатывает очередь до конца и завершается (cron, проверка в одном процессе).
+Несколько воркеров делят очередь по парам пользователей: --shards N --shard 0..N-1.
+
+    python manage.py process_swipes
+    python manage.py process_swipes --shards 4 --shard 0
+    python manage.py process_swipes --once
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.swipes import process_swipes
+
+
+class Command(BaseCommand):
+    help = "Применение событий очереди свайпов к лайкам, мэтчам и чатам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.SWIPE_BATCH_SIZE,
+            help="Число событий в пачке",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=0.5, help="Пауза при пустой очереди, сек."
+        )
+        parser.add_argument("--shard", type=int, default=0, help="Номер шарда очереди")
+        parser.add_argument("--shards", type=int, default=1, help="Число шардов очереди")
+        parser.add_argument(
+            "--once", action="store_true", help="Обработать очередь и завершиться"
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options["shard"] < options["shards"]:
+            raise CommandError("--shard должен быть от 0 до --shards - 1")
+
+        total = 0
+        while True:
+            processed = process_swipes(
+                options["batch_size"], options["shard"], options["shards"]
+            )
+            total += processed
+            if processed:
+                self.stdout.write(f"Обработано событий: {processed} (всего {total})")
+            elif options["once"]:
+                break
+            else:
+                time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Очередь пуста, обработано событий: {total}"))
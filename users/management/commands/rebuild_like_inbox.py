@@ -0,0 +1,27 @@
+"""
+Пересборка входящих лайков без ответа (PendingLike) и User.pending_likes_count по UserAction.
+
+Обычно входящие поддерживаются при каждом лайке и дизлайке (users/interactions.py,
+users/swipes.py), команда нужна после ручных правок UserAction или для сверки счётчиков.
+Пересборка идёт одной транзакцией — запускайте при остановленной записи лайков.
+
+    python manage.py rebuild_like_inbox
+    python manage.py rebuild_like_inbox --chunk-size 20000
+"""
+
+from django.core.management.base import BaseCommand
+
+from users.interactions import rebuild_pending_likes
+
+
+class Command(BaseCommand):
+    help = "Пересборка входящих лайков без ответа и их счётчиков"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=5000, help="Размер пачки лайков"
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_pending_likes(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Входящих лайков без ответа: {total}"))
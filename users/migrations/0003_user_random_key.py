@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:06
+
+import random
+
+import users.models
+from django.db import migrations, models
+
+
+def randomize_keys(apps, schema_editor):
+    """AddField проставляет всем существующим строкам одно значение default — раздаём ключи заново"""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("UPDATE users_user SET random_key = random()")
+        return
+    User = apps.get_model("users", "User")
+    batch = []
+    for user in User.objects.only("id").iterator(chunk_size=2000):
+        user.random_key = random.random()
+        batch.append(user)
+        if len(batch) >= 2000:
+            User.objects.bulk_update(batch, ["random_key"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["random_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_alter_useraction_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='random_key',
+            field=models.FloatField(default=users.models.generate_random_key, editable=False, verbose_name='ключ случайной выборки'),
+        ),
+        migrations.RunPython(randomize_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_private', 'random_key'], name='user_discovery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_private', 'gender', 'random_key'], name='user_discovery_gender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_private', 'gender', 'status', 'random_key'], name='user_discovery_segment_idx'),
+        ),
+    ]
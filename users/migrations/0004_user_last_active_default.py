@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_random_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='last_active',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='последняя активность'),
+        ),
+    ]
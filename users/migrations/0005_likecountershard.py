@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_last_active_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LikeCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='шард')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='лайков')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_counter_shards', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'шард счётчика лайков',
+                'verbose_name_plural': 'шарды счётчика лайков',
+                'unique_together': {('user', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_likecountershard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SwipeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_type', models.CharField(choices=[('view', 'Просмотр'), ('like', 'Лайк'), ('dislike', 'Дизлайк')], max_length=20, verbose_name='тип действия')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата события')),
+                ('user_from', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='от пользователя')),
+                ('user_to', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='пользователю')),
+            ],
+            options={
+                'verbose_name': 'событие свайпа',
+                'verbose_name_plural': 'события свайпов',
+            },
+        ),
+    ]
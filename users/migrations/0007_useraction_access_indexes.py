@@ -0,0 +1,80 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Hash-секции users_useraction по user_from_id (только PostgreSQL). SQL зафиксирован здесь,
+# а не берётся из users/partitioning.py: миграция не должна меняться вместе с кодом
+PARTITIONS = 16
+TABLE = "users_useraction"
+OLD_TABLE = "users_useraction_unpartitioned"
+
+PARTITION_SQL = [
+    f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}",
+    f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS) PARTITION BY HASH (user_from_id)",
+    *[
+        f"CREATE TABLE {TABLE}_p{remainder} PARTITION OF {TABLE} "
+        f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+        for remainder in range(PARTITIONS)
+    ],
+    f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}",
+    f"DROP TABLE {OLD_TABLE}",
+    f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id",
+    f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)",
+    f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')",
+    f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, user_from_id)",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_from_id_user_to_id_uniq "
+    f"UNIQUE (user_from_id, user_to_id)",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_from_id_fk_users_user_id "
+    f"FOREIGN KEY (user_from_id) REFERENCES users_user (id) DEFERRABLE INITIALLY DEFERRED",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_to_id_fk_users_user_id "
+    f"FOREIGN KEY (user_to_id) REFERENCES users_user (id) DEFERRABLE INITIALLY DEFERRED",
+    f"CREATE INDEX useraction_received_idx ON {TABLE} "
+    f"(user_to_id, action_type, created_at DESC, id DESC)",
+    f"CREATE INDEX useraction_sent_idx ON {TABLE} "
+    f"(user_from_id, action_type, created_at DESC, id DESC)",
+]
+
+
+def partition_useraction_table(apps, schema_editor):
+    """Секционируем users_useraction на PARTITIONS hash-секций (только PostgreSQL)"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE]
+        )
+        if cursor.fetchone() is not None:
+            return
+        for statement in PARTITION_SQL:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_swipeevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useraction',
+            index=models.Index(fields=['user_to', 'action_type', '-created_at', '-id'], name='useraction_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useraction',
+            index=models.Index(fields=['user_from', 'action_type', '-created_at', '-id'], name='useraction_sent_idx'),
+        ),
+        migrations.AlterField(
+            model_name='useraction',
+            name='user_from',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='actions_sent', to=settings.AUTH_USER_MODEL, verbose_name='от пользователя'),
+        ),
+        migrations.AlterField(
+            model_name='useraction',
+            name='user_to',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='actions_received', to=settings.AUTH_USER_MODEL, verbose_name='пользователю'),
+        ),
+        migrations.RunPython(partition_useraction_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_pending_likes(apps, schema_editor):
+    """
+    Входящие лайки без ответа и pending_likes_count по UserAction: лайки, на которые
+    вторая сторона не ответила лайком или дизлайком, keyset-проходом по id пачками
+    """
+    PendingLike = apps.get_model("users", "PendingLike")
+    UserAction = apps.get_model("users", "UserAction")
+    User = apps.get_model("users", "User")
+
+    answered = UserAction.objects.filter(
+        user_from=OuterRef("user_to"),
+        user_to=OuterRef("user_from"),
+        action_type__in=["like", "dislike"],
+    )
+    pending = UserAction.objects.filter(action_type="like").exclude(Exists(answered))
+
+    last_id = 0
+    while True:
+        chunk = list(
+            pending.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "user_from_id", "user_to_id", "created_at")[:5000]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        PendingLike.objects.bulk_create(
+            [
+                PendingLike(from_user_id=f, to_user_id=t, created_at=created_at)
+                for _, f, t, created_at in chunk
+            ],
+            ignore_conflicts=True,
+        )
+
+    counts = (
+        PendingLike.objects.filter(to_user=OuterRef("pk"))
+        .values("to_user")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    User.objects.update(pending_likes_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_useraction_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='pending_likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='входящих лайков без ответа'),
+        ),
+        migrations.CreateModel(
+            name='PendingLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата лайка')),
+                ('from_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='от пользователя')),
+                ('to_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_likes', to=settings.AUTH_USER_MODEL, verbose_name='пользователю')),
+            ],
+            options={
+                'verbose_name': 'входящий лайк',
+                'verbose_name_plural': 'входящие лайки',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['to_user', '-created_at', '-id'], name='pendinglike_inbox_idx')],
+                'unique_together': {('to_user', 'from_user')},
+            },
+        ),
+        migrations.RunPython(fill_pending_likes, migrations.RunPython.noop),
+    ]
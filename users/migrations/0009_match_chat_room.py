@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:56
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def link_chat_rooms(apps, schema_editor):
+    """
+    Связываем мэтчи с комнатами пары: комната могла быть создана с любым порядком
+    участников. Мэтчи перебираются по id пачками, каждая пачка — один UPDATE в своей транзакции
+    """
+    Match = apps.get_model("users", "Match")
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+
+    same_order = ChatRoom.objects.filter(
+        user1=OuterRef("user1"), user2=OuterRef("user2")
+    ).values("id")[:1]
+    reversed_order = ChatRoom.objects.filter(
+        user1=OuterRef("user2"), user2=OuterRef("user1")
+    ).values("id")[:1]
+
+    last_id = 0
+    while True:
+        batch = list(
+            Match.objects.filter(id__gt=last_id, chat_room__isnull=True)
+            .order_by("id")
+            .values_list("id", flat=True)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1]
+        with transaction.atomic():
+            Match.objects.filter(id__in=batch).update(
+                chat_room=Coalesce(Subquery(same_order), Subquery(reversed_order))
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False  # Пачки фиксируются по отдельности — без долгой блокировки таблицы мэтчей
+
+    dependencies = [
+        ('chat', '0006_chatmessage_created_at_default'),
+        ('users', '0008_pendinglike'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='chat_room',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='match', to='chat.chatroom', verbose_name='комната чата'),
+        ),
+        migrations.RunPython(link_chat_rooms, migrations.RunPython.noop),
+    ]
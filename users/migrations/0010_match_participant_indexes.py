@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_chatroom_canonical_pairs'),
+        ('users', '0009_match_chat_room'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['user1', 'is_active'], name='match_user1_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['user2', 'is_active'], name='match_user2_active_idx'),
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='user1',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='matches_as_user1', to=settings.AUTH_USER_MODEL, verbose_name='пользователь 1'),
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='user2',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='matches_as_user2', to=settings.AUTH_USER_MODEL, verbose_name='пользователь 2'),
+        ),
+    ]
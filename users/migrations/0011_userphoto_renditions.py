@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_match_participant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userphoto',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='версии фото'),
+        ),
+    ]
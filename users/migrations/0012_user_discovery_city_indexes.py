@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0011_userphoto_renditions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_private', 'city', 'random_key'], name='user_discovery_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_private', 'gender', 'city', 'random_key'], name='user_discovery_gender_city_idx'),
+        ),
+    ]
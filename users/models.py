@@ -1,10 +1,22 @@
+import random
+
 from django.apps import AppConfig
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError
-from PIL import (
-    Image as PILImage,
-)  # Импортируем класс Image из библиотеки PIL для обработки изображений
+from django.utils import timezone
+
+from .pairs import PairQuerySet
+from .renditions import delete_renditions, generate_renditions
+
+
+def generate_random_key():
+    """Случайный ключ пользователя в диапазоне [0, 1) для выборки анкет"""
+    return random.random()
 
 
 class UserManager(BaseUserManager):
@@ -62,12 +74,23 @@ class User(AbstractUser):
 
     # Системные поля
     likes_count = models.PositiveIntegerField("количество лайков", default=0)
+    # Число строк входящих лайков без ответа (PendingLike) — бейдж «вас лайкнули» без подсчёта
+    pending_likes_count = models.PositiveIntegerField(
+        "входящих лайков без ответа", default=0, editable=False
+    )
     is_private = models.BooleanField("приватный профиль", default=False)
     phone = models.CharField("телефон", max_length=50, blank=True)
 
     # Служебные поля
     is_verified = models.BooleanField("верифицирован", default=False)
-    last_active = models.DateTimeField("последняя активность", auto_now=True)
+    # Обновляется не при каждом save(), а не чаще раза в LAST_ACTIVE_FLUSH_INTERVAL (chat/presence.py)
+    last_active = models.DateTimeField(
+        "последняя активность", default=timezone.now, editable=False
+    )
+    # Случайный ключ для выборки анкет без ORDER BY RANDOM() (см. users/discovery.py)
+    random_key = models.FloatField(
+        "ключ случайной выборки", default=generate_random_key, editable=False
+    )
 
     # Убираем username (чтобы использовать email в качестве логина)
     username = None
@@ -87,6 +110,30 @@ class User(AbstractUser):
         verbose_name = "пользователь"
         verbose_name_plural = "пользователи"
         ordering = ["-date_joined"]
+        # Пулы кандидатов для случайной выборки: общий, по полу, по полу+статусу
+        # и по городу (с полом и без). Возраст в пулы не входит: диапазон min_age..max_age
+        # нарушил бы порядок random_key внутри пула, он проверяется на строках пула
+        indexes = [
+            models.Index(
+                fields=["is_private", "random_key"], name="user_discovery_idx"
+            ),
+            models.Index(
+                fields=["is_private", "gender", "random_key"],
+                name="user_discovery_gender_idx",
+            ),
+            models.Index(
+                fields=["is_private", "gender", "status", "random_key"],
+                name="user_discovery_segment_idx",
+            ),
+            models.Index(
+                fields=["is_private", "city", "random_key"],
+                name="user_discovery_city_idx",
+            ),
+            models.Index(
+                fields=["is_private", "gender", "city", "random_key"],
+                name="user_discovery_gender_city_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.email})"
@@ -97,6 +144,82 @@ class User(AbstractUser):
     def get_short_name(self):
         return self.first_name
 
+    def add_like(self, pending=False):
+        """
+        Атомарно увеличиваем счётчик лайков: UPDATE одного столбца likes_count = likes_count + 1
+        вместо save() всей строки, поэтому одновременные лайки не теряются.
+        Лайки популярных анкет при включённых шардах копятся в LikeCounterShard,
+        чтобы не упираться в блокировку одной строки User.
+        pending=True — лайк попал во входящие без ответа: тем же UPDATE растёт pending_likes_count
+        """
+        counters = {"pending_likes_count": F("pending_likes_count") + 1} if pending else {}
+        if (
+            settings.LIKES_COUNTER_SHARDS
+            and self.likes_count >= settings.LIKES_COUNTER_SHARD_THRESHOLD
+        ):
+            LikeCounterShard.increment(self.id)
+        else:
+            counters["likes_count"] = F("likes_count") + 1
+        if counters:
+            User.objects.filter(id=self.id).update(**counters)
+
+
+class LikeCounterShard(models.Model):
+    """
+    Несохранённая в User.likes_count часть лайков пользователя, разложенная по шардам.
+    Лайк увеличивает случайный шард, fold() переносит суммы в likes_count и удаляет шарды
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="like_counter_shards",
+        verbose_name="пользователь",
+    )
+    shard = models.PositiveSmallIntegerField("шард")
+    count = models.PositiveIntegerField("лайков", default=0)
+
+    class Meta:
+        verbose_name = "шард счётчика лайков"
+        verbose_name_plural = "шарды счётчика лайков"
+        unique_together = ["user", "shard"]
+
+    def __str__(self):
+        return f"{self.user_id}/{self.shard}: {self.count}"
+
+    @classmethod
+    def increment(cls, user_id, amount=1):
+        shard = random.randrange(settings.LIKES_COUNTER_SHARDS)
+        shards = cls.objects.filter(user_id=user_id, shard=shard)
+        if shards.update(count=F("count") + amount):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, shard=shard, count=amount)
+        except IntegrityError:  # Шард успел создать параллельный лайк
+            shards.update(count=F("count") + amount)
+
+    @classmethod
+    def fold(cls):
+        """Переносим накопленные лайки в User.likes_count, возвращаем число перенесённых"""
+        folded = 0
+        user_ids = cls.objects.values_list("user_id", flat=True).distinct()
+        for user_id in list(user_ids):
+            with transaction.atomic():
+                # Блокируем шарды: лайки в них подождут, новые шарды попадут в следующий перенос
+                shards = list(
+                    cls.objects.select_for_update()
+                    .filter(user_id=user_id)
+                    .values_list("id", "count")
+                )
+                total = sum(count for _, count in shards)
+                User.objects.filter(id=user_id).update(
+                    likes_count=F("likes_count") + total
+                )
+                cls.objects.filter(id__in=[shard_id for shard_id, _ in shards]).delete()
+            folded += total
+        return folded
+
 
 class UserPhoto(models.Model):
     """Фотографии пользователя"""
@@ -112,33 +235,43 @@ class UserPhoto(models.Model):
     )
     is_main = models.BooleanField("главная фотография", default=False)
     created_at = models.DateTimeField("дата загрузки", auto_now_add=True)
+    # Пути уменьшенных копий по форматам и ширинам (users/renditions.py), оригинал — в image
+    renditions = models.JSONField("версии фото", default=dict, blank=True, editable=False)
 
     class Meta:
         verbose_name = "фотография пользователя"
         verbose_name_plural = "фотографии пользователей"
         ordering = ["-is_main", "created_at"]   # Сначала гл.фото остальные по дате создания
 
-    """При сохранении нового фото проверяем флаг is_main и устанвливаем единый размер фото по высоте с сохранением пропороций"""
+    """При сохранении нового фото проверяем флаг is_main и один раз создаём уменьшенные копии, оригинал не меняем"""
 
     def save(self, *args, **kwargs):  # переопределяем метод save
         """При сохранении главного фото снимаем флаг is_main у других фото пользователя"""
         if self.is_main:
             UserPhoto.objects.filter(user=self.user, is_main=True).update(is_main=False)
+        # Новый файл ещё не записан в хранилище: копии нужно создать после сохранения
+        image_changed = bool(self.image) and not self.image._committed
         super().save(
             *args, **kwargs
         )  # вызываем родительский метод save для сохранения  фото
-        
-        """Устанавливаем единую высоту для всех фотографий, не меняя пропорции"""
-        if self.image:
-            img = PILImage.open(self.image.path)
-            try:
-                new_height = 300
-                new_width = int(new_height * (img.width / img.height))
-                img = img.resize([new_width, new_height])
-                img.save(self.image.path)
-                return self.image
-            except Exception as e:
-                raise ValidationError(f"Ошибка при изменении размера фото: {e}")
+        if image_changed:
+            self.update_renditions()
+
+    def update_renditions(self):
+        """Пересоздаём копии фото, записываем их пути одним UPDATE и удаляем прежние файлы"""
+        previous = self.renditions
+        try:
+            self.renditions = generate_renditions(self) if self.image else {}
+        except Exception as e:
+            raise ValidationError(f"Ошибка при создании версий фото: {e}")
+        UserPhoto.objects.filter(id=self.id).update(renditions=self.renditions)
+        current = {path for paths in self.renditions.values() for path in paths.values()}
+        delete_renditions(
+            {
+                name: {width: path for width, path in paths.items() if path not in current}
+                for name, paths in previous.items()
+            }
+        )
 
     def __str__(self):
         if self.is_main:
@@ -147,6 +280,17 @@ class UserPhoto(models.Model):
             return f"Дополнительное фото пользователя {self.user.get_full_name}"
 
 
+@receiver(post_delete, sender=UserPhoto)
+def delete_photo_renditions(sender, instance, **kwargs):
+    """
+    Файлы копий удаляем после фиксации транзакции: сигнал срабатывает и при каскадном
+    удалении (вместе с пользователем) и при удалении через QuerySet, в отличие от delete()
+    """
+    renditions = instance.renditions
+    if renditions:
+        transaction.on_commit(lambda: delete_renditions(renditions))
+
+
 class UserAction(models.Model):
     """Действия пользователей (просмотры, лайки, дизлайки)"""
 
@@ -156,17 +300,21 @@ class UserAction(models.Model):
         ("dislike", "Дизлайк"),
     ]
 
+    # Отдельные индексы внешних ключей не нужны: user_from — префикс unique_together,
+    # user_to — префикс useraction_received_idx
     user_from = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="actions_sent",
         verbose_name="от пользователя",
+        db_index=False,
     )
     user_to = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="actions_received",
         verbose_name="пользователю",
+        db_index=False,
     )
     action_type = models.CharField(
         "тип действия", max_length=20, choices=ACTION_CHOICES
@@ -178,6 +326,19 @@ class UserAction(models.Model):
         verbose_name_plural = "действия пользователей"
         unique_together = ["user_from", "user_to"]      # При смене действия существующая запись обновится, а не добавится новая
         ordering = ["-created_at"]
+        # Пути доступа HistoryViewSet: кто лайкнул меня (user_to), мои лайки/дизлайки/просмотры
+        # (user_from) — в порядке -created_at без сортировки. Встречный лайк и SeenSet
+        # идут по unique_together (user_from, user_to)
+        indexes = [
+            models.Index(
+                fields=["user_to", "action_type", "-created_at", "-id"],
+                name="useraction_received_idx",
+            ),
+            models.Index(
+                fields=["user_from", "action_type", "-created_at", "-id"],
+                name="useraction_sent_idx",
+            ),
+        ]
 
     def __str__(self):
         action_icons = {"view": "👀", "like": "❤️", "dislike": "👎"}
@@ -186,37 +347,123 @@ class UserAction(models.Model):
         )
 
 
+class PendingLike(models.Model):
+    """
+    Входящий лайк без ответа: from_user лайкнул to_user, а to_user ещё не лайкнул
+    и не дизлайкнул его в ответ. Поддерживается при каждом лайке/дизлайке
+    (users/interactions.py), счётчик строк — User.pending_likes_count
+    """
+
+    to_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="pending_likes",
+        verbose_name="пользователю",
+    )
+    from_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="от пользователя",
+    )
+    created_at = models.DateTimeField("дата лайка", default=timezone.now)
+
+    class Meta:
+        verbose_name = "входящий лайк"
+        verbose_name_plural = "входящие лайки"
+        unique_together = ["to_user", "from_user"]
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["to_user", "-created_at", "-id"], name="pendinglike_inbox_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.from_user_id} ❤️ {self.to_user_id}"
+
+
+class SwipeEvent(models.Model):
+    """
+    Событие свайпа в очереди (SWIPE_QUEUE): записывается запросом и удаляется
+    воркером process_swipes после применения к UserAction (users/swipes.py)
+    """
+
+    user_from = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="от пользователя",
+    )
+    user_to = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="пользователю",
+    )
+    action_type = models.CharField(
+        "тип действия", max_length=20, choices=UserAction.ACTION_CHOICES
+    )
+    created_at = models.DateTimeField("дата события", default=timezone.now)
+
+    class Meta:
+        verbose_name = "событие свайпа"
+        verbose_name_plural = "события свайпов"
+
+    def __str__(self):
+        return f"{self.user_from_id} → {self.user_to_id}: {self.action_type}"
+
+
 class Match(models.Model):
     """Взаимные лайки (совпадения) между пользователями"""
 
+    # Отдельные индексы FK не нужны: их покрывают (user1, user2) и индексы Meta.indexes
     user1 = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="matches_as_user1",
         verbose_name="пользователь 1",
+        db_index=False,
     )
     user2 = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="matches_as_user2",
         verbose_name="пользователь 2",
+        db_index=False,
     )
     created_at = models.DateTimeField("дата совпадения", auto_now_add=True)
     is_active = models.BooleanField("активно", default=True)
+    # Комната чата пары создаётся вместе с мэтчем: список мэтчей берёт её id без поиска по паре
+    chat_room = models.OneToOneField(
+        "chat.ChatRoom",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="match",
+        verbose_name="комната чата",
+    )
+
+    objects = PairQuerySet.as_manager()
 
     class Meta:
         verbose_name = "совпадение"
         verbose_name_plural = "совпадения"
         unique_together = ["user1", "user2"]
         ordering = ["-created_at"]
+        # «Мои мэтчи» — UNION выборок по каждому индексу (users/pairs.py)
+        indexes = [
+            models.Index(fields=["user1", "is_active"], name="match_user1_active_idx"),
+            models.Index(fields=["user2", "is_active"], name="match_user2_active_idx"),
+        ]
     """
     Чтобы не дублировать мэтчи при взаимных лайках пары пользователей в разное время,
     сохраняем одну запись. Для этого переопределим save() и сохраним только один мэтч 
     с пользователями в порядке возрастания id
     """
     def save(self, *args, **kwargs):
-        if self.user1.id > self.user2.id:
-            self.user1, self.user2 = self.user2, self.user1
+        if self.user1_id > self.user2_id:
+            self.user1_id, self.user2_id = self.user2_id, self.user1_id
         super().save(*args, **kwargs)
 
 
@@ -0,0 +1,29 @@
+"""
+Keyset-пагинация истории действий (HistoryViewSet) по (created_at, id), от новых к старым.
+
+Страница читается по индексам useraction_received_idx/useraction_sent_idx без OFFSET
+и COUNT(*): ?cursor=<курсор> — следующая (более старая) страница.
+"""
+
+from chat.pagination import KeysetPagination
+
+
+class HistoryKeysetPagination(KeysetPagination):
+    """
+    Без курсора — последние page_size действий, ?cursor= — действия старше курсора.
+    История листается только вглубь, ссылки «назад» нет
+    """
+
+    next_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.next_query_param)
+        if cursor:
+            created_at, action_id = self.decode_cursor(cursor)
+            queryset = self.older_than(queryset, created_at, action_id)
+        page = list(queryset.order_by("-created_at", "-id")[: page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
@@ -0,0 +1,43 @@
+"""
+Запросы к таблицам пар пользователей (Match, ChatRoom).
+
+Пара хранится в каноническом порядке user1_id < user2_id (Match.save, ChatRoom.save),
+поэтому запись пары ищется одним условием по уникальному индексу (user1, user2)
+без OR двух порядков.
+
+«Мои мэтчи» и «мои чаты» — записи, где пользователь в user1 или в user2. Условие
+user1 = u OR user2 = u не укладывается в один индекс, поэтому выборка строится как
+id IN (SELECT id ... user1 = u UNION SELECT id ... user2 = u): каждая половина читает
+свой индекс (user1, is_active) или (user2, is_active), время не растёт с размером таблицы.
+"""
+
+from django.db import models
+
+
+def ordered_pair(user_a_id, user_b_id):
+    """id пары в порядке возрастания, как в Match.save() и ChatRoom.save()"""
+    return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
+
+
+def user_id_of(user):
+    return getattr(user, "id", user)
+
+
+class PairQuerySet(models.QuerySet):
+    """QuerySet моделей с полями user1/user2 (менеджер objects у Match и ChatRoom)"""
+
+    def for_user(self, user, **filters):
+        """Записи с участием user (объект или id): UNION двух индексных выборок"""
+        user_id = user_id_of(user)
+        base = self.model._base_manager.filter(**filters).order_by()
+        ids = (
+            base.filter(user1_id=user_id)
+            .values("id")
+            .union(base.filter(user2_id=user_id).values("id"))
+        )
+        return self.filter(id__in=ids)
+
+    def pair(self, user_a, user_b):
+        """Запись пары (в любом порядке аргументов) по уникальному индексу (user1, user2)"""
+        user1_id, user2_id = ordered_pair(user_id_of(user_a), user_id_of(user_b))
+        return self.filter(user1_id=user1_id, user2_id=user2_id)
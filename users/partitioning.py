@@ -0,0 +1,79 @@
+"""
+Секционирование таблицы users_useraction на PostgreSQL (команда partition_useraction).
+
+Таблица делится на N hash-секций по user_from_id: ключ секционирования должен входить
+в каждый уникальный индекс, а уникальность (user_from, user_to) — основа upsert лайков
+(users/interactions.py). Запросы «мои лайки/дизлайки/просмотры» и встречный лайк
+читают одну секцию, «кто лайкнул меня» — индекс useraction_received_idx в каждой секции.
+Секции по времени не подходят: created_at пришлось бы добавить в unique_together.
+
+Преобразование делается одной транзакцией: старая таблица переименовывается, создаётся
+секционированная с теми же столбцами, строки копируются, затем восстанавливаются
+последовательность id, первичный ключ (id, user_from_id), уникальность, внешние ключи
+и индексы модели. Таблица заблокирована на время копирования — на большой таблице
+запускайте в окно обслуживания.
+"""
+
+from django.db import connection as default_connection
+
+TABLE = "users_useraction"
+OLD_TABLE = f"{TABLE}_unpartitioned"
+
+
+def is_partitioned(connection=default_connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def partition_statements(partitions):
+    """SQL преобразования users_useraction в partitions hash-секций"""
+    statements = [
+        f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}",
+        f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS) "
+        f"PARTITION BY HASH (user_from_id)",
+    ]
+    statements += [
+        f"CREATE TABLE {TABLE}_p{remainder} PARTITION OF {TABLE} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+    statements += [
+        f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}",
+        f"DROP TABLE {OLD_TABLE}",
+        # id — из своей последовательности (identity старой таблицы удалена вместе с ней)
+        f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id",
+        f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)",
+        f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')",
+        f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, user_from_id)",
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_from_id_user_to_id_uniq "
+        f"UNIQUE (user_from_id, user_to_id)",
+    ]
+    statements += [
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_{column}_fk_users_user_id "
+        f"FOREIGN KEY ({column}) REFERENCES users_user (id) DEFERRABLE INITIALLY DEFERRED"
+        for column in ("user_from_id", "user_to_id")
+    ]
+    statements += [
+        f"CREATE INDEX useraction_received_idx ON {TABLE} "
+        f"(user_to_id, action_type, created_at DESC, id DESC)",
+        f"CREATE INDEX useraction_sent_idx ON {TABLE} "
+        f"(user_from_id, action_type, created_at DESC, id DESC)",
+    ]
+    return statements
+
+
+def partition_useraction(partitions, connection=default_connection):
+    """
+    Секционируем users_useraction, если это PostgreSQL и таблица ещё не секционирована.
+    Возвращает выполненные запросы (пустой список — ничего не сделано)
+    """
+    if connection.vendor != "postgresql" or partitions < 1 or is_partitioned(connection):
+        return []
+    statements = partition_statements(partitions)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    return statements
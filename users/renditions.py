@@ -0,0 +1,100 @@
+"""
+Версии (renditions) фотографий пользователя.
+
+Оригинал загруженного фото хранится как есть, а при загрузке один раз генерируются
+уменьшенные копии ширин PHOTO_RENDITION_WIDTHS в форматах PHOTO_RENDITION_FORMATS
+(AVIF и WebP, если их поддерживает Pillow). Копии больше оригинала не создаются:
+последней берётся ширина самого оригинала.
+
+Пути копий хранятся в UserPhoto.renditions: {"webp": {"160": "user_photos/renditions/..."}}.
+Сериализаторы отдают их картой srcset (формат -> ширина -> URL), и клиент скачивает
+наименьшую подходящую версию. Фото без копий (загруженные до появления версий)
+досоздаются командой generate_photo_renditions.
+"""
+
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+# Формат -> (имя кодека Pillow, параметры сохранения)
+ENCODERS = {
+    "avif": ("AVIF", {"quality": 60, "speed": 8}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+}
+RENDITIONS_DIR = "user_photos/renditions"
+
+
+def available_formats():
+    """Форматы из настроек, которые умеет записывать установленный Pillow"""
+    return [
+        name
+        for name in settings.PHOTO_RENDITION_FORMATS
+        if name in ENCODERS and features.check(name)
+    ]
+
+
+def rendition_widths(original_width):
+    """Ширины копий: из настроек меньше оригинала и сам оригинал, если он меньше максимальной"""
+    widths = sorted(width for width in settings.PHOTO_RENDITION_WIDTHS if width < original_width)
+    if original_width <= max(settings.PHOTO_RENDITION_WIDTHS):
+        widths.append(original_width)
+    return widths
+
+
+def generate_renditions(photo):
+    """
+    Генерируем копии фото photo.image во всех ширинах и форматах и сохраняем их в хранилище.
+    Возвращает карту путей для UserPhoto.renditions
+    """
+    with photo.image.open("rb") as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)  # Поворот по EXIF до уменьшения
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    formats = available_formats()
+    renditions = {name: {} for name in formats}
+    for width in rendition_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for name in formats:
+            codec, options = ENCODERS[name]
+            buffer = BytesIO()
+            resized.save(buffer, codec, **options)
+            path = default_storage.save(
+                f"{RENDITIONS_DIR}/{photo.id}/{width}.{name}", ContentFile(buffer.getvalue())
+            )
+            renditions[name][str(width)] = path
+    return renditions
+
+
+def delete_renditions(renditions):
+    """Удаляем файлы копий из хранилища"""
+    for paths in (renditions or {}).values():
+        for path in paths.values():
+            default_storage.delete(path)
+
+
+def thumbnail_path(renditions, preferred_format="webp"):
+    """Путь наименьшей копии (предпочтительно WebP — его понимают все клиенты) или None"""
+    renditions = renditions or {}
+    paths = renditions.get(preferred_format) or next(
+        (paths for paths in renditions.values() if paths), None
+    )
+    if not paths:
+        return None
+    return paths[min(paths, key=int)]
+
+
+def srcset(renditions, request=None):
+    """Карта для клиентов: формат -> ширина -> URL (абсолютный, если передан request)"""
+    result = {}
+    for name, paths in (renditions or {}).items():
+        urls = {}
+        for width, path in sorted(paths.items(), key=lambda item: int(item[0])):
+            url = default_storage.url(path)
+            urls[width] = request.build_absolute_uri(url) if request is not None else url
+        result[name] = urls
+    return result
@@ -1,8 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from django.db import models
-from .models import User, UserPhoto, UserAction, Match, Invitation, ContactExchange
-from chat.models import ChatRoom
+from django.core.files.storage import default_storage
+from .renditions import srcset, thumbnail_path
+from .models import (
+    User,
+    UserPhoto,
+    UserAction,
+    Match,
+    Invitation,
+    ContactExchange,
+    PendingLike,
+)
 
 # Для кастомизации сериалайзера TokenObtainSerializer при работе с токеном
 from django.contrib.auth import authenticate, get_user_model
@@ -44,9 +52,15 @@ class EmailTokenObtainPairSerializer(TokenObtainSerializer):
 
 
 class UserPhotoSerializer(serializers.ModelSerializer):
+    # Уменьшенные копии: формат -> ширина -> URL, клиент берёт наименьшую подходящую
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = UserPhoto
-        fields = ["id", "image", "is_main", "created_at"]
+        fields = ["id", "image", "srcset", "is_main", "created_at"]
+
+    def get_srcset(self, obj):
+        return srcset(obj.renditions, self.context.get("request"))
 
 
 class UserRegisterSerializer(serializers.ModelSerializer):
@@ -111,10 +125,15 @@ class UserProfileSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "email", "likes_count"]
 
-    # Получаем главную фотографию пользователя (первую попавшуюся)
+    # Получаем главную фотографию пользователя из списка photos: при prefetch_related("photos")
+    # во вьюсете список уже загружен и отдельный запрос на каждого пользователя не нужен
     def get_main_photo(self, obj):
-        main_photo = obj.photos.filter(is_main=True).first()
-        return UserPhotoSerializer(main_photo).data if main_photo else None
+        main_photo = next((photo for photo in obj.photos.all() if photo.is_main), None)
+        return (
+            UserPhotoSerializer(main_photo, context=self.context).data
+            if main_photo
+            else None
+        )
 
 
 class UserActionToSerializer(serializers.ModelSerializer):
@@ -137,13 +156,23 @@ class UserActionFromSerializer(serializers.ModelSerializer):
         fields = ["id", "user_from_profile", "action_type", "created_at"]
 
 
+class PendingLikeSerializer(serializers.ModelSerializer):
+    """Входящий лайк без ответа с данными лайкнувшего пользователя"""
+
+    from_user_profile = UserProfileSerializer(source="from_user", read_only=True)
+
+    class Meta:
+        model = PendingLike
+        fields = ["id", "from_user_profile", "created_at"]
+
+
 class MatchSerializer(serializers.ModelSerializer):
     other_user = (
         serializers.SerializerMethodField()
     )  # Создаём вычисляемое поле для другого пользователя
-    chat_room_id = (
-        serializers.SerializerMethodField()
-    )  # Создаём вычисляемое поле для id чата
+    chat_room_id = serializers.IntegerField(
+        read_only=True
+    )  # id чата — столбец Match.chat_room_id, без запроса к ChatRoom
 
     class Meta:
         model = Match
@@ -151,16 +180,9 @@ class MatchSerializer(serializers.ModelSerializer):
 
     def get_other_user(self, obj):
         request = self.context.get("request")
-        other_user = obj.user2 if obj.user1 == request.user else obj.user1
+        other_user = obj.user2 if obj.user1_id == request.user.id else obj.user1
         return UserProfileSerializer(other_user).data
 
-    def get_chat_room_id(self, obj):
-        try:
-            chat_room = ChatRoom.objects.get(user1=obj.user1, user2=obj.user2)
-            return chat_room.id
-        except ChatRoom.DoesNotExist:
-            return None
-
 
 class ContactExchangeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -227,14 +249,48 @@ class CreateInvitationSerializer(serializers.ModelSerializer):
                 "Нельзя отправить приглашение самому себе"
             )
 
-        # Проверяем, что есть актуальный мэтч между пользователями (объединяем условия мэтч в один запрос)
-        if not Match.objects.filter(
-            (models.Q(user1=request.user) & models.Q(user2=to_user))
-            | (models.Q(user1=to_user) & models.Q(user2=request.user)),
-            is_active=True,
-        ).exists():
+        # Проверяем, что есть актуальный мэтч между пользователями (пара в каноническом порядке)
+        if not Match.objects.pair(request.user, to_user).filter(is_active=True).exists():
             raise serializers.ValidationError(
                 "Можно отправлять приглашения только взаимным лайкам"
             )
 
         return attrs
+
+
+class UserActionSummarySerializer(serializers.ModelSerializer):
+    """
+    Компактная строка истории: вторая сторона — только id, имя и URL миниатюры главного фото
+    (наименьшая копия WebP, без копий — оригинал).
+    Ожидает queryset из HistoryViewSet.get_summary_actions (main_photo, main_photo_renditions — аннотации),
+    в context — profile_field ("user_from", "user_to" или "from_user") и request
+    """
+
+    user = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserAction
+        fields = ["id", "action_type", "created_at", "user"]
+
+    def get_user(self, obj):
+        profile = getattr(obj, self.context["profile_field"])
+        main_photo_url = None
+        path = thumbnail_path(obj.main_photo_renditions) or obj.main_photo
+        if path:
+            main_photo_url = default_storage.url(path)
+            request = self.context.get("request")
+            if request is not None:
+                main_photo_url = request.build_absolute_uri(main_photo_url)
+        return {
+            "id": profile.id,
+            "name": profile.get_full_name(),
+            "main_photo_url": main_photo_url,
+        }
+
+
+class PendingLikeSummarySerializer(UserActionSummarySerializer):
+    """Компактная строка входящих лайков без ответа"""
+
+    class Meta:
+        model = PendingLike
+        fields = ["id", "created_at", "user"]
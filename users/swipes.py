@@ -0,0 +1,191 @@
+"""
+Очередь свайпов (включается настройкой SWIPE_QUEUE).
+
+В режиме очереди InteractionViewSet не пишет лайки, дизлайки и просмотры в UserAction,
+а добавляет события в таблицу SwipeEvent (один INSERT) и сразу отвечает 202.
+Фоновый воркер (команда process_swipes) забирает события пачками и применяет их
+к UserAction, User.likes_count, входящим лайкам (PendingLike), Match и ChatRoom
+несколькими пакетными запросами на пачку.
+О новых мэтчах оба пользователя узнают уведомлением "match" на сокет ws/user/.
+
+Порядок событий: для пары (кто, кому) побеждает последнее событие лайк/дизлайк;
+просмотр записывается, только если у пары ещё нет действия — как в синхронном режиме.
+
+Воркеров может быть несколько: --shards N и --shard 0..N-1 делят очередь по паре
+пользователей (min(id) % N), поэтому встречные лайки пары применяет один воркер
+и мэтч не теряется между двумя параллельными пачками. Внутри шарда события
+забираются select_for_update(skip_locked=True) — на шард нужен один процесс.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Least, Mod
+
+from chat.events import notify_user
+from chat.models import ChatRoom
+
+from .interactions import add_pending_likes, pairs_filter, resolve_pending_likes
+from .models import LikeCounterShard, Match, SwipeEvent, User, UserAction
+from .pairs import ordered_pair
+
+
+def enqueue_swipes(user, target_ids, action_type):
+    """Добавляем события свайпов в очередь одним INSERT"""
+    SwipeEvent.objects.bulk_create(
+        [
+            SwipeEvent(user_from=user, user_to_id=target_id, action_type=action_type)
+            for target_id in target_ids
+        ]
+    )
+
+
+def apply_swipes(events):
+    """
+    Применяем пачку событий (отсортированных по id) к UserAction, счётчикам лайков и мэтчам.
+    Возвращает список созданных мэтчей
+    """
+    views = set()
+    decisions = {}  # (кто, кому) -> последний лайк/дизлайк
+    for event in events:
+        pair = (event.user_from_id, event.user_to_id)
+        if event.user_from_id == event.user_to_id:
+            continue
+        if event.action_type == "view":
+            views.add(pair)
+        else:
+            decisions[pair] = event.action_type
+    views -= decisions.keys()
+
+    # Просмотры: уже существующие действия не трогаем
+    UserAction.objects.bulk_create(
+        [UserAction(user_from_id=f, user_to_id=t, action_type="view") for f, t in views],
+        ignore_conflicts=True,
+    )
+    if not decisions:
+        return []
+
+    previous = {
+        (action.user_from_id, action.user_to_id): action.action_type
+        for action in UserAction.objects.filter(pairs_filter(decisions)).only(
+            "user_from_id", "user_to_id", "action_type"
+        )
+    }
+    UserAction.objects.bulk_create(
+        [
+            UserAction(user_from_id=f, user_to_id=t, action_type=action_type)
+            for (f, t), action_type in decisions.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["user_from", "user_to"],
+        update_fields=["action_type"],
+    )
+
+    # Счётчики лайков: новые лайки по анкетам, один UPDATE на каждое значение прироста
+    new_likes = [
+        pair
+        for pair, action_type in decisions.items()
+        if action_type == "like" and previous.get(pair) != "like"
+    ]
+    likes_by_target = Counter(user_to_id for _, user_to_id in new_likes)
+    if settings.LIKES_COUNTER_SHARDS and likes_by_target:
+        # Популярные анкеты — в шарды счётчика, как в User.add_like
+        popular = User.objects.filter(
+            id__in=likes_by_target,
+            likes_count__gte=settings.LIKES_COUNTER_SHARD_THRESHOLD,
+        ).values_list("id", flat=True)
+        for user_id in list(popular):
+            LikeCounterShard.increment(user_id, likes_by_target.pop(user_id))
+    targets_by_amount = {}
+    for user_to_id, amount in likes_by_target.items():
+        targets_by_amount.setdefault(amount, []).append(user_to_id)
+    for amount, user_ids in targets_by_amount.items():
+        User.objects.filter(id__in=user_ids).update(likes_count=F("likes_count") + amount)
+
+    # Встречные действия уже после записи пачки (в том числе из этой же пачки)
+    reverse = {
+        (action.user_to_id, action.user_from_id): action.action_type
+        for action in UserAction.objects.filter(
+            pairs_filter(decisions, "user_to_id", "user_from_id"),
+            action_type__in=["like", "dislike"],
+        ).only("user_from_id", "user_to_id", "action_type")
+    }
+
+    # Входящие лайки: лайк без ответа второй стороны добавляется к ней, любое решение
+    # убирает встречный лайк из входящих решившего, дизлайк после лайка — отзыв лайка
+    resolved = [(f, t) for f, t in decisions]
+    resolved += [
+        (t, f)
+        for (f, t), action_type in decisions.items()
+        if action_type == "dislike" and previous.get((f, t)) == "like"
+    ]
+    resolve_pending_likes(resolved)
+    add_pending_likes([pair for pair in new_likes if pair not in reverse])
+
+    # Дизлайк расторгает существующий активный мэтч пары
+    dislikes = [
+        ordered_pair(*pair)
+        for pair, action_type in decisions.items()
+        if action_type == "dislike"
+    ]
+    if dislikes:
+        Match.objects.filter(
+            pairs_filter(dislikes, "user1_id", "user2_id"), is_active=True
+        ).update(is_active=False)
+
+    if not new_likes:
+        return []
+
+    # Взаимные лайки: встречный лайк уже в UserAction
+    mutual = {ordered_pair(*pair) for pair in new_likes if reverse.get(pair) == "like"}
+    if not mutual:
+        return []
+    existing = set(
+        Match.objects.filter(pairs_filter(mutual, "user1_id", "user2_id")).values_list(
+            "user1_id", "user2_id"
+        )
+    )
+    new_pairs = sorted(mutual - existing)
+    if not new_pairs:
+        return []
+
+    rooms = ChatRoom.objects.bulk_create(
+        [ChatRoom(user1_id=user1_id, user2_id=user2_id) for user1_id, user2_id in new_pairs]
+    )
+    matches = Match.objects.bulk_create(
+        [
+            Match(user1_id=user1_id, user2_id=user2_id, chat_room=room)
+            for (user1_id, user2_id), room in zip(new_pairs, rooms)
+        ]
+    )
+    # bulk_create обходит ChatRoom.save: кэш участников (в нём могло остаться «комнаты нет»)
+    # сбрасываем сами после фиксации транзакции
+    room_keys = [ChatRoom.participants_cache_key(room.id) for room in rooms]
+    transaction.on_commit(lambda: cache.delete_many(room_keys))
+    for match, room in zip(matches, rooms):
+        for user_id in (match.user1_id, match.user2_id):
+            notify_user(user_id, "match", match_id=match.id, chat_room_id=room.id)
+    return matches
+
+
+def process_swipes(batch_size=200, shard=0, shards=1):
+    """
+    Забираем из очереди до batch_size событий шарда и применяем их одной транзакцией.
+    Возвращает число обработанных событий (0 — очередь шарда пуста)
+    """
+    queue = SwipeEvent.objects.order_by("id")
+    if shards > 1:
+        queue = queue.annotate(
+            pair_shard=Mod(Least("user_from_id", "user_to_id"), shards)
+        ).filter(pair_shard=shard)
+
+    with transaction.atomic():
+        events = list(queue.select_for_update(skip_locked=True)[:batch_size])
+        if not events:
+            return 0
+        apply_swipes(events)
+        SwipeEvent.objects.filter(id__in=[event.id for event in events]).delete()
+    return len(events)
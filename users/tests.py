@@ -0,0 +1,501 @@
+import json
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from unittest import mock
+
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from chat.models import ChatMessage, ChatRoom
+
+from .interactions import rebuild_pending_likes, record_dislike, record_like
+from .models import (
+    ContactExchange,
+    Invitation,
+    LikeCounterShard,
+    Match,
+    PendingLike,
+    SwipeEvent,
+    User,
+    UserAction,
+    UserPhoto,
+)
+from .swipes import process_swipes
+
+
+class LikeCounterTests(TransactionTestCase):
+    """Счётчик лайков при одновременных лайках одной анкеты (транзакции в разных потоках)"""
+
+    likers_count = 8
+
+    def setUp(self):
+        self.target = User.objects.create_user(email="target@example.com", password="x")
+        self.likers = [
+            User.objects.create_user(email=f"liker{number}@example.com", password="x")
+            for number in range(self.likers_count)
+        ]
+
+    def like_concurrently(self):
+        barrier = threading.Barrier(len(self.likers))
+        errors = []
+
+        def like(user):
+            try:
+                barrier.wait()
+                record_like(user, self.target.id)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=like, args=(user,)) for user in self.likers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def total_likes(self):
+        self.target.refresh_from_db()
+        sharded = LikeCounterShard.objects.filter(user=self.target).aggregate(
+            total=Sum("count")
+        )["total"]
+        return self.target.likes_count + (sharded or 0)
+
+    def test_concurrent_likes(self):
+        self.like_concurrently()
+
+        self.assertEqual(self.total_likes(), self.likers_count)
+        self.assertEqual(self.target.pending_likes_count, self.likers_count)
+
+    @override_settings(LIKES_COUNTER_SHARDS=4, LIKES_COUNTER_SHARD_THRESHOLD=0)
+    def test_concurrent_likes_sharded(self):
+        self.like_concurrently()
+
+        self.assertEqual(self.total_likes(), self.likers_count)
+        self.assertEqual(LikeCounterShard.fold(), self.likers_count)
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.likes_count, self.likers_count)
+
+    @override_settings(LIKES_COUNTER_SHARDS=4, LIKES_COUNTER_SHARD_THRESHOLD=0)
+    def test_swipe_likes_sharded(self):
+        SwipeEvent.objects.bulk_create(
+            [
+                SwipeEvent(user_from=user, user_to=self.target, action_type="like")
+                for user in self.likers
+            ]
+        )
+
+        process_swipes()
+
+        self.assertEqual(self.total_likes(), self.likers_count)
+        self.assertEqual(self.target.likes_count, 0)  # Всё в шардах до fold
+
+
+class MutualLikeTests(TransactionTestCase):
+    """Одновременные встречные лайки пар создают ровно один мэтч и одну комнату на пару"""
+
+    pairs_count = 4
+
+    def setUp(self):
+        self.pairs = [
+            (
+                User.objects.create_user(email=f"left{number}@example.com", password="x"),
+                User.objects.create_user(email=f"right{number}@example.com", password="x"),
+            )
+            for number in range(self.pairs_count)
+        ]
+
+    def test_concurrent_mutual_likes(self):
+        likes = [(a, b) for a, b in self.pairs] + [(b, a) for a, b in self.pairs]
+        barrier = threading.Barrier(len(likes))
+        errors = []
+
+        def like(user, target):
+            try:
+                barrier.wait()
+                record_like(user, target.id)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=like, args=pair) for pair in likes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for a, b in self.pairs:
+            with self.subTest(pair=(a.id, b.id)):
+                match = Match.objects.pair(a, b).get()
+                self.assertTrue(match.is_active)
+                room = ChatRoom.objects.pair(a, b).get()
+                self.assertEqual(match.chat_room_id, room.id)
+        self.assertEqual(Match.objects.count(), self.pairs_count)
+        self.assertEqual(ChatRoom.objects.count(), self.pairs_count)
+        self.assertFalse(PendingLike.objects.exists())  # Все лайки отвечены
+
+
+class PendingLikeTests(TestCase):
+    """Входящие лайки, которые ведутся при каждом действии, совпадают с пересборкой"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(email=f"inbox{number}@example.com", password="x")
+            for number in range(5)
+        ]
+
+    def inbox_state(self):
+        rows = set(PendingLike.objects.values_list("to_user_id", "from_user_id"))
+        counts = dict(User.objects.values_list("id", "pending_likes_count"))
+        return rows, counts
+
+    def test_incremental_inbox_matches_rebuild(self):
+        a, b, c, d, e = self.users
+        for action_type, user, target in (
+            ("like", a, b),
+            ("like", c, b),
+            ("like", b, a),  # Взаимный лайк: мэтч
+            ("dislike", b, c),  # Ответ дизлайком на входящий лайк
+            ("like", d, a),
+            ("dislike", d, a),  # Отзыв своего лайка
+            ("view", a, d),
+            ("like", a, d),  # Лайк после просмотра; d уже ответила дизлайком
+            ("like", e, d),
+            ("like", d, e),  # Мэтч
+            ("dislike", d, e),  # Расторжение мэтча
+            ("like", a, c),
+            ("like", a, c),  # Повторный лайк ничего не меняет
+            ("dislike", e, c),
+            ("like", c, e),  # Лайк в ответ на дизлайк — не во входящие
+            ("like", b, e),
+        ):
+            if action_type == "like":
+                record_like(user, target.id)
+            elif action_type == "dislike":
+                record_dislike(user, target.id)
+            else:
+                UserAction.objects.create(user_from=user, user_to=target, action_type="view")
+
+        incremental = self.inbox_state()
+        total = rebuild_pending_likes()
+
+        self.assertEqual(self.inbox_state(), incremental)
+        self.assertEqual(total, len(incremental[0]))
+        # (кому, от кого): лайк a анкете d отвечен ранним дизлайком d
+        self.assertEqual(incremental[0], {(c.id, a.id), (e.id, b.id)})
+        self.assertEqual(Match.objects.filter(is_active=True).count(), 1)
+
+
+class SwipeQueueTests(TestCase):
+    """Воркер очереди свайпов (process_swipes) в том же процессе"""
+
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(email="swiper1@example.com", password="x")
+        self.user2 = User.objects.create_user(email="swiper2@example.com", password="x")
+        self.user3 = User.objects.create_user(email="swiper3@example.com", password="x")
+
+    def test_mutual_likes_create_room_with_fresh_participants_cache(self):
+        existing_room = ChatRoom.objects.create(user1=self.user1, user2=self.user3)
+        next_room_id = existing_room.id + 1
+        # Сокет постучался в ещё не созданную комнату — в кэше «комнаты нет»
+        self.assertIsNone(ChatRoom.get_participants(next_room_id))
+        SwipeEvent.objects.bulk_create(
+            [
+                SwipeEvent(user_from=self.user1, user_to=self.user2, action_type="like"),
+                SwipeEvent(user_from=self.user2, user_to=self.user1, action_type="like"),
+            ]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_swipes(), 2)
+
+        match = Match.objects.get()
+        self.assertEqual(match.chat_room_id, next_room_id)
+        self.assertEqual(
+            ChatRoom.get_participants(next_room_id), (self.user1.id, self.user2.id)
+        )
+        self.assertFalse(SwipeEvent.objects.exists())
+
+
+@override_settings(CHAT_WORKER_ID=1)
+class EndpointQueryTests(TestCase):
+    """
+    Число SQL-запросов эндпойнтов users/urls.py на заполненной тестовой БД.
+    У списков с вложенными профилями оно не зависит от числа строк: N+1 во вложенных
+    сериализаторах ломает make test. Время ответа на реальных данных — команда check_endpoints
+    """
+
+    others_count = 5
+    strangers_count = 3
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="lister@example.com", password="x")
+        self.others = [
+            User.objects.create_user(email=f"other{number}@example.com", password="x")
+            for number in range(self.others_count)
+        ]
+        # Анкеты без действий — кандидаты для ленты и цели лайка/дизлайка
+        self.strangers = [
+            User.objects.create_user(email=f"stranger{number}@example.com", password="x")
+            for number in range(self.strangers_count)
+        ]
+        UserPhoto.objects.bulk_create(
+            [
+                UserPhoto(
+                    user=user, image=f"user_photos/{user.id}_{number}.jpg", is_main=number == 0
+                )
+                for user in [self.user, *self.others, *self.strangers]
+                for number in range(2)
+            ]
+        )
+        UserAction.objects.bulk_create(
+            [
+                UserAction(user_from=user_from, user_to=user_to, action_type="like")
+                for other in self.others
+                for user_from, user_to in ((self.user, other), (other, self.user))
+            ]
+        )
+        for other in self.others:
+            self.room = ChatRoom.objects.create(user1=self.user, user2=other)
+            Match.objects.create(user1=self.user, user2=other, chat_room=self.room)
+            Invitation.objects.create(
+                from_user=self.user, to_user=other, invitation_type="contact"
+            )
+            ChatMessage.objects.create(room=self.room, user=other, message="привет")
+        ChatMessage.objects.bulk_create(
+            [
+                ChatMessage(room=self.room, user=self.user, message=f"сообщение {number}")
+                for number in range(self.others_count - 1)
+            ]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertListQueries(self, count, name, *args):
+        with self.assertNumQueries(count):
+            response = self.client.get(reverse(name, args=args))
+        self.assertEqual(response.status_code, 200)
+        results = response.data.get("results", response.data)
+        self.assertEqual(len(results), self.others_count)
+
+    def test_history(self):
+        self.assertListQueries(2, "history-likes")
+        self.assertListQueries(2, "history-received-likes")
+
+    def test_matches(self):
+        self.assertListQueries(4, "match-list")
+
+    def test_invitations(self):
+        self.assertListQueries(4, "invitation-list")
+
+    def test_chat_rooms(self):
+        self.assertListQueries(5, "chatroom-list")
+
+    def test_chat_messages(self):
+        self.assertListQueries(4, "chatroom-messages", self.room.id)
+
+    def assertEndpointQueries(self, count, name, *args, method="get", data=None, status=200):
+        with self.assertNumQueries(count):
+            response = getattr(self.client, method)(
+                reverse(name, args=args), data, format="json"
+            )
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_profile(self):
+        self.assertEndpointQueries(2, "user-profile")
+        self.assertEndpointQueries(2, "user-detail", self.user.id)
+        self.assertEndpointQueries(2, "photo-list")
+
+    def test_user_list(self):
+        admin = User.objects.create_superuser(email="admin@example.com", password="x")
+        self.client.force_authenticate(admin)
+        self.assertEndpointQueries(3, "user-list")
+
+    def test_discovery(self):
+        # Точка круга random_key — начало: весь пул в первом сегменте (второй пуст),
+        # иначе число keyset-запросов и prefetch фото зависит от случайной точки
+        with mock.patch("users.discovery.random.random", return_value=0.0):
+            with self.captureOnCommitCallbacks(execute=True):  # Просмотр попадает в SeenSet
+                response = self.assertEndpointQueries(4, "interaction-random-profile")
+            self.assertIn(response.data["user"]["id"], [user.id for user in self.strangers])
+            response = self.assertEndpointQueries(4, "interaction-feed")
+        self.assertEqual(len(response.data["results"]), self.strangers_count - 1)
+
+    def test_invalid_age_filter(self):
+        for name in ("interaction-random-profile", "interaction-feed"):
+            for params in ({"min_age": "abc"}, {"max_age": "3.5"}):
+                with self.subTest(name, **params):
+                    response = self.client.get(reverse(name), params)
+                    self.assertEqual(response.status_code, 400)
+
+    def test_like_and_dislike(self):
+        target = self.strangers[0]
+        # users/interactions.py: 3 запроса на PostgreSQL, 4 на SQLite, + SAVEPOINT/RELEASE
+        like_queries = 5 if connection.vendor == "postgresql" else 6
+        self.assertEndpointQueries(like_queries, "interaction-like", target.id, method="post")
+        # Отзыв лайка: + удаление из входящих
+        self.assertEndpointQueries(8, "interaction-dislike", target.id, method="post")
+
+    def test_history_summary(self):
+        record_like(self.strangers[0], self.user.id)  # Входящий лайк без ответа
+        UserAction.objects.bulk_create(
+            [
+                UserAction(user_from=self.user, user_to=self.strangers[1], action_type="dislike"),
+                UserAction(user_from=self.user, user_to=self.strangers[2], action_type="view"),
+            ]
+        )
+        for name, query, query_count in (
+            ("history-received-likes", "?view=summary", 1),
+            ("history-inbox", "?view=summary", 1),
+            ("history-inbox", "", 2),
+            ("history-inbox-count", "", 0),
+            ("history-dislikes", "", 2),
+            ("history-views", "", 2),
+        ):
+            with self.subTest(name + query):
+                with self.assertNumQueries(query_count):
+                    response = self.client.get(reverse(name) + query)
+                self.assertEqual(response.status_code, 200)
+
+    def test_online_and_contacts(self):
+        ContactExchange.objects.create(invitation=Invitation.objects.first())
+        self.assertEndpointQueries(1, "match-online")  # Присутствие — из кэша
+        self.assertEndpointQueries(2, "contactexchange-list")
+
+    def test_send_message(self):
+        self.assertEndpointQueries(
+            10,
+            "chatroom-send-message",
+            self.room.id,
+            method="post",
+            data={"message": "привет"},
+            status=201,
+        )
+
+
+class HistoryExportTests(TestCase):
+    """Выгрузка истории ?export=ndjson"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="exporter@example.com", password="x")
+        likers = [
+            User.objects.create_user(email=f"fan{number}@example.com", password="x")
+            for number in range(3)
+        ]
+        UserAction.objects.bulk_create(
+            [
+                UserAction(user_from=liker, user_to=self.user, action_type="like")
+                for liker in likers
+            ]
+        )
+        self.liker_ids = [liker.id for liker in reversed(likers)]  # От новых к старым
+
+    async def test_export_is_streamed(self):
+        """Под ASGI строки отдаются асинхронным генератором, а не собранным списком"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse("history-received-likes"), {"export": "ndjson"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), len(self.liker_ids))  # По строке на действие
+        rows = [json.loads(chunk) for chunk in chunks]
+        self.assertEqual([row["user"]["id"] for row in rows], self.liker_ids)
+
+
+@override_settings(PHOTO_RENDITION_WIDTHS=[160, 320], PHOTO_RENDITION_FORMATS=["webp"])
+class PhotoRenditionTests(TestCase):
+    """Уменьшенные копии фото, srcset в API и удаление файлов копий"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create_user(email="photographer@example.com", password="x")
+
+    def upload(self, width, height, name="photo.png"):
+        buffer = BytesIO()
+        Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def rendition_paths(self, photo):
+        return [path for paths in photo.renditions.values() for path in paths.values()]
+
+    def test_renditions_generated(self):
+        photo = UserPhoto.objects.create(user=self.user, image=self.upload(400, 200))
+
+        self.assertEqual(list(photo.renditions), ["webp"])
+        self.assertEqual(sorted(photo.renditions["webp"], key=int), ["160", "320"])
+        for width, path in photo.renditions["webp"].items():
+            with default_storage.open(path) as file, Image.open(file) as image:
+                self.assertEqual(image.format, "WEBP")
+                self.assertEqual(image.size, (int(width), int(width) // 2))
+        photo.refresh_from_db()  # Пути записаны в БД
+        self.assertEqual(sorted(photo.renditions["webp"], key=int), ["160", "320"])
+
+    def test_small_original_is_not_upscaled(self):
+        photo = UserPhoto.objects.create(user=self.user, image=self.upload(100, 100))
+
+        self.assertEqual(list(photo.renditions["webp"]), ["100"])
+
+    def test_srcset_in_api(self):
+        photo = UserPhoto.objects.create(user=self.user, image=self.upload(400, 200))
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(reverse("photo-list"))
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data.get("results", response.data)
+        srcset = results[0]["srcset"]
+        self.assertEqual(list(srcset["webp"]), ["160", "320"])
+        self.assertEqual(
+            srcset["webp"]["160"],
+            "http://testserver" + default_storage.url(photo.renditions["webp"]["160"]),
+        )
+
+    def test_files_deleted_with_photo(self):
+        photo = UserPhoto.objects.create(user=self.user, image=self.upload(400, 200))
+        paths = self.rendition_paths(photo)
+        self.assertTrue(all(default_storage.exists(path) for path in paths))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+
+        self.assertFalse(any(default_storage.exists(path) for path in paths))
+
+    def test_replaced_image_drops_old_renditions(self):
+        photo = UserPhoto.objects.create(user=self.user, image=self.upload(400, 200))
+        old_paths = self.rendition_paths(photo)
+
+        photo.image = self.upload(300, 300, name="other.png")
+        photo.save()
+
+        self.assertEqual(sorted(photo.renditions["webp"], key=int), ["160", "300"])
+        self.assertTrue(all(default_storage.exists(path) for path in self.rendition_paths(photo)))
+        stale = set(old_paths) - set(self.rendition_paths(photo))
+        self.assertTrue(stale)
+        self.assertFalse(any(default_storage.exists(path) for path in stale))
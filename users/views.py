@@ -9,7 +9,8 @@ from rest_framework.reverse import reverse as drf_reverse  # для получе
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
-from django.db.models import Q
+from django.db.models import OuterRef, Q, Subquery, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.shortcuts import render, redirect
 from django.contrib import messages
@@ -18,19 +19,41 @@ from django.contrib.auth.mixins import (LoginRequiredMixin,)    # защита 
 from django.views.generic.detail import DetailView              # для веб-интерфейса модели User (детали user)
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from chat.models import ChatRoom
-from .models import User, UserPhoto, UserAction, Match, Invitation, ContactExchange
+from chat import codec, presence
+from chat.events import notify_user
+from .discovery import (
+    SeenSet,
+    candidate_queryset,
+    mark_seen,
+    sample_candidate,
+    sample_candidates,
+)
+from .interactions import record_dislike, record_like
+from .models import (
+    User,
+    UserPhoto,
+    UserAction,
+    Match,
+    Invitation,
+    ContactExchange,
+    PendingLike,
+)
+from .pagination import HistoryKeysetPagination
 from .serializers import (
     UserRegisterSerializer,
     UserProfileSerializer,
     UserPhotoSerializer,
     UserActionToSerializer,
     UserActionFromSerializer,
+    UserActionSummarySerializer,
+    PendingLikeSerializer,
+    PendingLikeSummarySerializer,
     MatchSerializer,
     InvitationSerializer,
     CreateInvitationSerializer,
     ContactExchangeSerializer,
 )
+from .swipes import enqueue_swipes
 
 # Для социальной авторизации
 from allauth.account.utils import (
@@ -63,13 +86,15 @@ from sys import stdout
 
 
 FRONTEND_URL = getattr(settings, "FRONTEND_URL", "http://localhost:3000")
+FEED_PAGE_SIZE = 10  # Размер колоды анкет в InteractionViewSet.feed по умолчанию
+FEED_MAX_PAGE_SIZE = 50
 
 # ВЬЮСЕТЫ
 
 class UserViewSet(viewsets.ModelViewSet):
     """ViewSet для управления пользователями"""
 
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related("photos")
     permission_classes = [permissions.IsAuthenticated]
     template_name = "rest_framework/api.html"  # Подключаем встроенный шаблон для html
 
@@ -190,44 +215,37 @@ class InteractionViewSet(viewsets.ViewSet):
         Получение случайного профиля с фильтрами
         B Browsable API: отображает профиль и формы для like/dislike    
         """
-        excluded_actions = UserAction.objects.filter(
-            user_from=request.user
-        ).values_list("user_to_id", flat=True)
-
-        queryset = User.objects.exclude(
-            Q(id=request.user.id) | Q(id__in=excluded_actions) | Q(is_private=True)
-        )
+        # Пул кандидатов с фильтрами gender, min_age, max_age, city, status
+        try:
+            queryset = candidate_queryset(request.user, request.query_params)
+        except ValueError:
+            return Response(
+                {"error": "Некорректный параметр min_age или max_age"}, status=400
+            )
 
-        # Фильтры
-        gender = request.query_params.get("gender")
-        min_age = request.query_params.get("min_age")
-        max_age = request.query_params.get("max_age")
-        city = request.query_params.get("city")
-        status = request.query_params.get("status")
-
-        if gender:
-            queryset = queryset.filter(gender=gender)
-        if min_age:
-            queryset = queryset.filter(age__gte=int(min_age))
-        if max_age:
-            queryset = queryset.filter(age__lte=int(max_age))
-        if city:
-            queryset = queryset.filter(city__icontains=city)
-        if status:
-            queryset = queryset.filter(status=status)
-
-        user = queryset.order_by("?").first()
+        # Случайная анкета по индексу random_key вместо order_by("?"),
+        # просмотренные анкеты отсекаем по битовой карте SeenSet
+        user = sample_candidate(queryset, SeenSet(request.user.id))
 
         if not user:
             return Response(
                 {"error": "Нет подходящих профилей для просмотра"}, status=404
             )
 
-        # Логирование просмотренных профилей
-        UserAction.objects.get_or_create(
-            user_from=request.user, user_to=user, action_type="view"
-        )
+        # Логирование просмотренных профилей (в режиме очереди — событием для process_swipes)
+        if settings.SWIPE_QUEUE:
+            enqueue_swipes(request.user, [user.id], "view")
+        else:
+            # Уже лайкнутую/дизлайкнутую анкету (её мог вернуть устаревший SeenSet)
+            # не трогаем: уникальность (user_from, user_to) отсекает вставку без ошибки
+            UserAction.objects.bulk_create(
+                [UserAction(user_from=request.user, user_to=user, action_type="view")],
+                ignore_conflicts=True,
+            )
+        mark_seen(request.user.id, user.id)
 
+        # Фото загружаем один раз для полей photos и main_photo сериализатора
+        prefetch_related_objects([user], "photos")
         serializer = UserProfileSerializer(user)
 
         # Формируем URL для like/dislike
@@ -262,116 +280,143 @@ class InteractionViewSet(viewsets.ViewSet):
 
         return Response(data)
 
-    @action(detail=True, methods=["post"], url_path="like", url_name="like")
-    def like(self, request, pk=None):
+    @action(detail=False, methods=["get"])
+    def feed(self, request):
+        """
+        Колода из size случайных анкет (по умолчанию 10, максимум 50) с теми же фильтрами,
+        что и random_profile. Просмотры записываются одним пакетным INSERT.
+        Параметр cursor из ответа (next_cursor) продолжает выдачу со следующей колоды,
+        чтобы клиент мог подгружать её заранее, пока пользователь свайпает текущую.
+        """
         try:
-            target_user = User.objects.get(id=pk)
-            user_ = target_user.get_full_name
-        except User.DoesNotExist:
-            return Response({"error": "Пользователь не найден"}, status=404)
-
-        if target_user == request.user:
-            return Response({"error": "Нельзя лайкнуть себя"}, status=400)
+            size = min(
+                int(request.query_params.get("size", FEED_PAGE_SIZE)),
+                FEED_MAX_PAGE_SIZE,
+            )
+            cursor = request.query_params.get("cursor")
+            pivot = float(cursor) if cursor else None
+        except ValueError:
+            size, pivot = 0, None
+        if size < 1 or (pivot is not None and not 0 <= pivot < 1):
+            return Response(
+                {"error": "Некорректный параметр size или cursor"}, status=400
+            )
 
-         # Обновляем или создаём действие
-        action, created = UserAction.objects.update_or_create(
-            user_from=request.user, 
-            user_to=target_user, 
-            defaults={"action_type": "like"}
+        try:
+            queryset = candidate_queryset(
+                request.user, request.query_params
+            ).prefetch_related("photos")
+        except ValueError:
+            return Response(
+                {"error": "Некорректный параметр min_age или max_age"}, status=400
+            )
+        users = sample_candidates(
+            queryset, SeenSet(request.user.id), size, pivot=pivot
         )
 
-        # Увеличиваем счётчик лайков только если действие изменилось на 'like' или создано
-        if created or action.action_type != 'like':
-            # Увеличиваем счётчик
-            target_user.likes_count += 1
-            target_user.save()
-
-        mutual_like = UserAction.objects.filter(
-            user_from=target_user, user_to=request.user, action_type="like"
-        ).first()
-        # Проверяем взаимный лайк
-        if mutual_like:
-            # Нормализуем порядок для поиска мэтча: user1.id всегда < user2.id (по модели Match.save())
-            if request.user.id < target_user.id: 
-                u1, u2 = (request.user, target_user) 
-            else: 
-                u1, u2 = (target_user, request.user)
-            
-            match, match_created = Match.objects.update_or_create(
-                user1=u1, user2=u2
+        # Логирование просмотров одним INSERT (уже существующие действия не трогаем)
+        if settings.SWIPE_QUEUE:
+            enqueue_swipes(request.user, [user.id for user in users], "view")
+        else:
+            UserAction.objects.bulk_create(
+                [
+                    UserAction(user_from=request.user, user_to=user, action_type="view")
+                    for user in users
+                ],
+                ignore_conflicts=True,
+            )
+        mark_seen(request.user.id, *[user.id for user in users])
+
+        next_cursor = None
+        next_url = None
+        if len(users) == size:
+            next_cursor = repr(users[-1].random_key)
+            params = request.query_params.copy()
+            params["cursor"] = next_cursor
+            next_url = request.build_absolute_uri(
+                f"{request.path}?{params.urlencode()}"
             )
 
-            if match_created:
-                ChatRoom.objects.get_or_create(
-                    user1=request.user, user2=target_user
-                )
-                message = f"Лайк пользователю {user_} отправлен. Мэтч! Взаимный лайк"
-                details = "Создан чат"
-                is_match = match.is_active
-                match_id = match.id
-            else:
-                message = f"Лайк пользователю {user_} отправлен. Мэтч подтверждён"
-                details = "Вы ранее уже были в мэтче"
-                is_match = match.is_active
-                match_id = match.id
+        serializer = UserProfileSerializer(users, many=True)
+        return Response(
+            {
+                "results": serializer.data,
+                "next_cursor": next_cursor,
+                "next": next_url,
+            }
+        )
+
+    def enqueue(self, request, target_id, action_type):
+        """
+        Режим очереди: событие свайпа пишется в SwipeEvent, ответ — сразу (202).
+        Мэтч вычисляет воркер process_swipes, о нём придёт уведомление на ws/user/
+        """
+        if not User.objects.filter(id=target_id).exists():
+            return Response({"error": "Пользователь не найден"}, status=404)
+        enqueue_swipes(request.user, [target_id], action_type)
+        mark_seen(request.user.id, target_id)
+        return Response(
+            {"message": "Действие принято в обработку", "queued": True}, status=202
+        )
+
+    @action(detail=True, methods=["post"], url_path="like", url_name="like")
+    def like(self, request, pk=None):
+        if not str(pk).isdigit():
+            return Response({"error": "Пользователь не найден"}, status=404)
+        if int(pk) == request.user.id:
+            return Response({"error": "Нельзя лайкнуть себя"}, status=400)
+        if settings.SWIPE_QUEUE:
+            return self.enqueue(request, int(pk), "like")
+
+        # Лайк, счётчик лайков, мэтч и чат — одна транзакция (users/interactions.py)
+        try:
+            target_user, match, room = record_like(request.user, int(pk))
+        except User.DoesNotExist:
+            return Response({"error": "Пользователь не найден"}, status=404)
+        mark_seen(request.user.id, target_user.id)
+        user_ = target_user.get_full_name()
+
+        if room is not None:  # Мэтч создан этим лайком
+            # Обоим участникам — уведомление о мэтче на сокет ws/user/
+            for user_id in (match.user1_id, match.user2_id):
+                notify_user(user_id, "match", match_id=match.id, chat_room_id=room.id)
+            message = f"Лайк пользователю {user_} отправлен. Мэтч! Взаимный лайк"
+            details = "Создан чат"
+        elif match is not None:
+            message = f"Лайк пользователю {user_} отправлен. Мэтч подтверждён"
+            details = "Вы ранее уже были в мэтче"
         else:
             message = f"Лайк пользователю {user_} отправлен или подтверждён"
             details = "Ожидайте взаимного лайка"
-            is_match = False
-            match_id = None
         return Response(
             {
                 "message": message,
                 "details": details,
-                "is_match": is_match,
-                "match_id": match_id,
+                "is_match": match.is_active if match else False,
+                "match_id": match.id if match else None,
             }
         )
 
     @action(detail=True, methods=["post"], url_path="dislike", url_name="dislike")
     def dislike(self, request, pk=None):
-        try:
-            target_user = User.objects.get(id=pk)
-            user_ = target_user.first_name + " " + target_user.last_name
-        except User.DoesNotExist:
+        if not str(pk).isdigit():
             return Response({"error": "Пользователь не найден"}, status=404)
-        
-        if target_user == request.user:
+        if int(pk) == request.user.id:
             return Response({"error": "Нельзя дизлайкнуть себя"}, status=400)
+        if settings.SWIPE_QUEUE:
+            return self.enqueue(request, int(pk), "dislike")
 
-        # Получаем и запоминаем предыдущее действие
-        previous_action = UserAction.objects.filter(
-            user_from=request.user, user_to=target_user
-        ).first()
-        was_like = previous_action and previous_action.action_type == "like"
-        was_dislike = previous_action and previous_action.action_type == "dislike"
-        was_view = previous_action and previous_action.action_type == "view"
-
-        # Нормализуем порядок для поиска мэтча: user1.id всегда < user2.id (по модели Match.save())
-        if request.user.id < target_user.id: 
-            u1, u2 = (request.user, target_user) 
-        else: 
-            u1, u2 = (target_user, request.user)
-        match, match_created = Match.objects.get_or_create(
-            user1=u1, user2=u2
-        )
+        # Дизлайк и расторжение существующего мэтча (новых мэтчей дизлайк не создаёт)
+        try:
+            target_user, unmatched = record_dislike(request.user, int(pk))
+        except User.DoesNotExist:
+            return Response({"error": "Пользователь не найден"}, status=404)
+        mark_seen(request.user.id, target_user.id)
 
-        
-        # Обновляем или создаём действие
-        action, created = UserAction.objects.update_or_create(
-            user_from=request.user, 
-            user_to=target_user, 
-            defaults={"action_type": "dislike"}
-        )
-        # Если ранее был мэтч — проверяем и отменяем
-        match = Match.objects.filter(user1=u1, user2=u2, is_active=True).first()
-        if match:
-            match.is_active = False
-            match.save()
-            message = f"Дизлайк пользователю {user_} отправлен"
+        message = f"Дизлайк пользователю {target_user.get_full_name()} отправлен"
+        if unmatched:
             details = "Мэтч был и расторгнут"
         else:
-            message = f"Дизлайк пользователю {user_} отправлен"
             details = "Мэтча не было. Действие обновлено или установлено: дизлайк"
 
         return Response(
@@ -383,37 +428,143 @@ class InteractionViewSet(viewsets.ViewSet):
 
 
 class HistoryViewSet(viewsets.ViewSet):
+    """
+    История действий с keyset-пагинацией от новых к старым (?cursor=, ?page_size=).
+    ?view=summary — компактные строки (id, имя, URL миниатюры главного фото второй стороны),
+    ?export=ndjson — вся история потоком NDJSON (по строке JSON на действие).
+    inbox — входящие лайки без ответа (PendingLike), inbox_count — их число без запросов к БД
+    """
+
     permission_classes = [permissions.IsAuthenticated]
+    export_chunk_size = 2000
+
+    @staticmethod
+    def get_actions(queryset, profile_field):
+        """Действия с профилем второй стороны (JOIN) и его фото (один prefetch-запрос) — без N+1"""
+        return queryset.select_related(profile_field).prefetch_related(
+            f"{profile_field}__photos"
+        )
+
+    @staticmethod
+    def get_summary_actions(queryset, profile_field, fields):
+        """
+        Действия, имя второй стороны (JOIN), путь её главного фото и его копий (подзапросы) —
+        один запрос
+        """
+        main_photo = UserPhoto.objects.filter(
+            user=OuterRef(f"{profile_field}_id"), is_main=True
+        )
+        return (
+            queryset.select_related(profile_field)
+            .only(
+                *fields,
+                f"{profile_field}__id",
+                f"{profile_field}__first_name",
+                f"{profile_field}__last_name",
+            )
+            .annotate(
+                main_photo=Subquery(main_photo.values("image")[:1]),
+                main_photo_renditions=Subquery(main_photo.values("renditions")[:1]),
+            )
+        )
+
+    def history_response(
+        self,
+        request,
+        queryset,
+        serializer_class,
+        profile_field,
+        summary_serializer_class=UserActionSummarySerializer,
+    ):
+        context = {"request": request, "profile_field": profile_field}
+        summary_fields = [
+            field for field in summary_serializer_class.Meta.fields if field != "user"
+        ]
+
+        if request.query_params.get("export") == "ndjson":
+            actions = self.get_summary_actions(
+                queryset, profile_field, summary_fields
+            ).order_by("-created_at", "-id")
+
+            # Асинхронный генератор: под ASGI Django отдаёт его по мере чтения пачек,
+            # а синхронный итератор сначала целиком собрал бы в память (sync_to_async(list))
+            async def rows():
+                async for user_action in actions.aiterator(
+                    chunk_size=self.export_chunk_size
+                ):
+                    data = summary_serializer_class(user_action, context=context).data
+                    yield codec.dumps(data) + "\n"
+
+            return StreamingHttpResponse(rows(), content_type="application/x-ndjson")
+
+        paginator = HistoryKeysetPagination()
+        if request.query_params.get("view") == "summary":
+            page = paginator.paginate_queryset(
+                self.get_summary_actions(queryset, profile_field, summary_fields), request
+            )
+            serializer = summary_serializer_class(page, many=True, context=context)
+        else:
+            page = paginator.paginate_queryset(
+                self.get_actions(queryset, profile_field), request
+            )
+            serializer = serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=["get"])
     def received_likes(self, request):
         """История лайков профиля пользователя (кто лайкнул меня)"""
-        likes = UserAction.objects.filter(user_to=request.user, action_type="like")
-        serializer = UserActionFromSerializer(likes, many=True)
-        return Response(serializer.data)
+        return self.history_response(
+            request,
+            UserAction.objects.filter(user_to=request.user, action_type="like"),
+            UserActionFromSerializer,
+            "user_from",
+        )
+
+    @action(detail=False, methods=["get"])
+    def inbox(self, request):
+        """Входящие лайки без ответа: кто лайкнул меня, а я ещё не лайкнул и не дизлайкнул его"""
+        return self.history_response(
+            request,
+            PendingLike.objects.filter(to_user=request.user),
+            PendingLikeSerializer,
+            "from_user",
+            PendingLikeSummarySerializer,
+        )
+
+    @action(detail=False, methods=["get"])
+    def inbox_count(self, request):
+        """Число входящих лайков без ответа — поле уже загруженного request.user"""
+        return Response({"count": request.user.pending_likes_count})
 
     @action(detail=False, methods=["get"])
     def likes(self, request):
         """Список понравившихся пользователей (кого я лайкнул)"""
-        likes = UserAction.objects.filter(user_from=request.user, action_type="like")
-        serializer = UserActionToSerializer(likes, many=True)
-        return Response(serializer.data)
+        return self.history_response(
+            request,
+            UserAction.objects.filter(user_from=request.user, action_type="like"),
+            UserActionToSerializer,
+            "user_to",
+        )
 
     @action(detail=False, methods=["get"])
     def dislikes(self, request):
         """Список непонравившихся пользователей (кого я дизлайкнул)"""
-        dislikes = UserAction.objects.filter(
-            user_from=request.user, action_type="dislike"
+        return self.history_response(
+            request,
+            UserAction.objects.filter(user_from=request.user, action_type="dislike"),
+            UserActionToSerializer,
+            "user_to",
         )
-        serializer = UserActionToSerializer(dislikes, many=True)
-        return Response(serializer.data)
 
     @action(detail=False, methods=["get"])
     def views(self, request):
         """История просмотренных профилей"""
-        views = UserAction.objects.filter(user_from=request.user, action_type="view")
-        serializer = UserActionToSerializer(views, many=True)
-        return Response(serializer.data)
+        return self.history_response(
+            request,
+            UserAction.objects.filter(user_from=request.user, action_type="view"),
+            UserActionToSerializer,
+            "user_to",
+        )
 
 
 class MatchViewSet(viewsets.ReadOnlyModelViewSet):
@@ -427,8 +578,10 @@ class MatchViewSet(viewsets.ReadOnlyModelViewSet):
             return (
                 UserPhoto.objects.none()
             )  # Возвращаем пустой набор данных для Swagger
-        return Match.objects.filter(
-            Q(user1=self.request.user) | Q(user2=self.request.user), is_active=True
+        return (
+            Match.objects.for_user(self.request.user, is_active=True)
+            .select_related("user1", "user2")
+            .prefetch_related("user1__photos", "user2__photos")
         )
 
     def get_serializer_context(self):
@@ -436,6 +589,23 @@ class MatchViewSet(viewsets.ReadOnlyModelViewSet):
         context["request"] = self.request
         return context
 
+    @action(detail=False, methods=["get"])
+    def online(self, request):
+        """
+        Кто из собеседников по активным мэтчам сейчас онлайн: id пар одним запросом,
+        присутствие — одним get_many к кэшу (chat/presence.py), без чтения last_active
+        """
+        pairs = Match.objects.for_user(request.user, is_active=True).values_list(
+            "user1_id", "user2_id"
+        )
+        match_user_ids = {
+            user2_id if user1_id == request.user.id else user1_id
+            for user1_id, user2_id in pairs
+        }
+        return Response(
+            {"online_user_ids": sorted(presence.online_user_ids(match_user_ids))}
+        )
+
 
 class InvitationViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -457,12 +627,23 @@ class InvitationViewSet(viewsets.ModelViewSet):
             return (
                 UserPhoto.objects.none()
             )  # Возвращаем пустой набор данных для Swagger
-        return Invitation.objects.filter(
-            Q(from_user=self.request.user) | Q(to_user=self.request.user)
+        return (
+            Invitation.objects.filter(
+                Q(from_user=self.request.user) | Q(to_user=self.request.user)
+            )
+            .select_related("from_user", "to_user")
+            .prefetch_related("from_user__photos", "to_user__photos")
         )
 
     def perform_create(self, serializer):
-        serializer.save(from_user=self.request.user)
+        invitation = serializer.save(from_user=self.request.user)
+        notify_user(
+            invitation.to_user_id,
+            "invitation",
+            invitation_id=invitation.id,
+            from_user_id=invitation.from_user_id,
+            invitation_type=invitation.invitation_type,
+        )
 
     @action(detail=True, methods=["post"])
     def accept(self, request, pk=None):
@@ -479,6 +660,12 @@ class InvitationViewSet(viewsets.ModelViewSet):
 
         invitation.status = "accepted"
         invitation.save()
+        notify_user(
+            invitation.from_user_id,
+            "invitation_status",
+            invitation_id=invitation.id,
+            status=invitation.status,
+        )
 
         # Если это обмен контактами, создаем запись
         if invitation.invitation_type == "contact":
@@ -502,6 +689,12 @@ class InvitationViewSet(viewsets.ModelViewSet):
 
         invitation.status = "rejected"
         invitation.save()
+        notify_user(
+            invitation.from_user_id,
+            "invitation_status",
+            invitation_id=invitation.id,
+            status=invitation.status,
+        )
 
         serializer = self.get_serializer(invitation)
         return Response(serializer.data)
@@ -1036,6 +1229,11 @@ def api_root(request):
                 "url": "/api/interactions/random_profile/",
                 "description": "Случайный профиль для оценки",
             },
+            "feed": {
+                "method": "GET",
+                "url": "/api/interactions/feed/?size=10",
+                "description": "Колода случайных профилей с курсором для подгрузки следующей",
+            },
             "chatroom_list": {
                 "method": "GET",
                 "url": "/api/chatroom/",